@@ -0,0 +1,404 @@
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import ExitStack, nullcontext, redirect_stdout
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+from pymongo import MongoClient
+from pymongo.errors import ConnectionFailure
+
+import etl_meteo
+import quality_audit
+from etl_meteo import read_full_json_file
+from instrumentation import RunMetrics
+from testing_support import (frames_identical, generate_synthetic_dataset, legacy_clean_and_convert_csv_df, legacy_clean_and_convert_json,
+                             legacy_final_integrity_stats, make_synthetic_measures, make_synthetic_wu_frame, mongomock_compat,
+                             write_synthetic_infoclimat_json, write_synthetic_wu_csv)
+
+# Fichier des résultats de la suite (une ligne JSON par exécution, comparable d'un commit à l'autre)
+BENCHMARK_RESULTS_FILE = "benchmark_results.jsonl"
+
+# --- Banc d'essai des étapes de transformation du pipeline E-T-L ---
+
+
+def _best_time(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def benchmark_csv_conversion(n_rows=200_000, repeat=3):
+    """Mesure le débit (lignes/s) de la conversion CSV, avant (cellule par cellule) et après (vectorisée)."""
+    df = make_synthetic_wu_frame(n_rows)
+
+    legacy_time, legacy_df = _best_time(lambda: legacy_clean_and_convert_csv_df(df, '1001', 'Weather Underground'), repeat)
+    vector_time, vector_df = _best_time(lambda: etl_meteo.clean_and_convert_csv_df(df, '1001', 'Weather Underground'), repeat)
+
+    identical = frames_identical(legacy_df, vector_df)
+    print(f"--- ⏱️ BENCHMARK clean_and_convert_csv_df ({n_rows} lignes, meilleur de {repeat}) ---")
+    print(f"-> Avant (apply cellule par cellule) : {n_rows / legacy_time:,.0f} lignes/s ({legacy_time:.3f}s)")
+    print(f"-> Après (vectorisé)                 : {n_rows / vector_time:,.0f} lignes/s ({vector_time:.3f}s)")
+    print(f"-> Accélération : x{legacy_time / vector_time:.1f}")
+    print(f"-> Résultat identique bit à bit : {'✅ OUI' if identical else '❌ NON'}")
+    return {'rows': n_rows, 'legacy_rows_per_s': n_rows / legacy_time, 'vectorized_rows_per_s': n_rows / vector_time, 'identical': identical}
+
+
+def _measure(func):
+    """Exécute func deux fois : durée sans instrumentation, puis pic mémoire Python (tracemalloc)."""
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak, result
+
+
+def benchmark_json_parsing(n_stations=20, n_hours=24 * 90, batch_size=10_000):
+    """Compare la lecture JSON complète (json.load + conversion par enregistrement) à la lecture en streaming par lots."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = write_synthetic_infoclimat_json(os.path.join(tmpdir, 'Data_Source1_synthetique.json'), n_stations, n_hours)
+        size_mb = os.path.getsize(path) / 1e6
+
+        def full_read():
+            return len(legacy_clean_and_convert_json(read_full_json_file(path)))
+
+        def streaming_read():
+            # Chaque lot est consommé puis libéré, comme lors d'un chargement en streaming
+            return sum(len(batch) for batch in etl_meteo.iter_json_batches(path, batch_size=batch_size))
+
+        legacy_time, legacy_peak, legacy_rows = _measure(full_read)
+        stream_time, stream_peak, stream_rows = _measure(streaming_read)
+
+    print(f"--- ⏱️ BENCHMARK lecture JSON Infoclimat ({n_stations} stations x {n_hours} h, {size_mb:.1f} Mo) ---")
+    print(f"-> json.load + conversion : {legacy_rows / legacy_time:,.0f} lignes/s, pic mémoire {legacy_peak / 1e6:,.1f} Mo")
+    print(f"-> Streaming par lots     : {stream_rows / stream_time:,.0f} lignes/s, pic mémoire {stream_peak / 1e6:,.1f} Mo (lots de {batch_size})")
+    return {'rows': stream_rows, 'file_mb': size_mb,
+            'legacy_rows_per_s': legacy_rows / legacy_time, 'legacy_peak_mb': legacy_peak / 1e6,
+            'streaming_rows_per_s': stream_rows / stream_time, 'streaming_peak_mb': stream_peak / 1e6}
+
+
+def benchmark_unification(n_files=14, rows_per_file=20_000):
+    """Compare le pic mémoire de l'unification : liste de documents + DataFrame reconstruit, contre lots en colonnes."""
+    frames = [etl_meteo.clean_and_convert_csv_df(make_synthetic_wu_frame(rows_per_file, date_str=f'2024-10-{day % 28 + 1:02d}', seed=day),
+                                                 '1001', 'Weather Underground') for day in range(n_files)]
+
+    def legacy_unification():
+        records = []
+        for frame in frames:
+            records.extend(frame.to_dict('records'))
+        return legacy_final_integrity_stats(records)['total']
+
+    def columnar_unification():
+        integrity = etl_meteo.FinalIntegrityCheck()
+        unified = [integrity.update(frame) for frame in frames]
+        # Conversion en documents au moment du chargement, lot par lot
+        for documents in etl_meteo.iter_document_batches(unified):
+            pass
+        return integrity.total
+
+    legacy_time, legacy_peak, rows = _measure(legacy_unification)
+    columnar_time, columnar_peak, _ = _measure(columnar_unification)
+
+    print(f"--- ⏱️ BENCHMARK unification + intégrité finale ({n_files} fichiers x {rows_per_file} lignes) ---")
+    print(f"-> Liste de documents + DataFrame : {legacy_time:.2f}s, pic mémoire {legacy_peak / 1e6:,.1f} Mo")
+    print(f"-> Lots en colonnes (incrémental) : {columnar_time:.2f}s, pic mémoire {columnar_peak / 1e6:,.1f} Mo")
+    return {'rows': rows, 'legacy_s': legacy_time, 'legacy_peak_mb': legacy_peak / 1e6,
+            'columnar_s': columnar_time, 'columnar_peak_mb': columnar_peak / 1e6}
+
+
+def record_footprint(frames, sample_rows=10_000):
+    """Mémoire par million de relevés (octets) : documents (dictionnaires), colonnes float64/objet et colonnes compactes.
+
+    La taille des documents est estimée sur `sample_rows` relevés (objets partagés comptés une seule fois).
+    """
+    frames = [frame for frame in frames if len(frame)]
+    rows = sum(len(frame) for frame in frames)
+    if not rows:
+        return {'documents': 0.0, 'columns': 0.0, 'compact': 0.0}
+    sample = pd.concat(frames, ignore_index=True).head(sample_rows)
+    seen, document_bytes = set(), 0
+    for document in sample.to_dict('records'):
+        document_bytes += sys.getsizeof(document)
+        for value in document.values():
+            if id(value) not in seen:
+                seen.add(id(value))
+                document_bytes += sys.getsizeof(value)
+    per_million = 1e6 / rows
+    return {
+        'documents': document_bytes * 1e6 / len(sample),
+        'columns': sum(int(frame.memory_usage(deep=True, index=False).sum()) for frame in frames) * per_million,
+        'compact': sum(int(etl_meteo.compact_records(frame).memory_usage(deep=True, index=False).sum()) for frame in frames) * per_million,
+    }
+
+def benchmark_record_footprint(n_stations=10, n_days=365):
+    """Compare la mémoire des relevés unifiés (par million de lignes) : documents, colonnes float64 et colonnes compactes."""
+    frames = make_synthetic_measures(n_stations, n_days, freq='1h')
+    footprint = record_footprint(frames)
+    compact_time, _ = _best_time(lambda: [etl_meteo.compact_records(frame) for frame in frames], 3)
+    print(f"--- ⏱️ BENCHMARK empreinte mémoire des relevés ({sum(len(f) for f in frames)} relevés, {n_stations} stations) ---")
+    print(f"-> Documents (dictionnaires)   : {footprint['documents'] / 1e6:8.1f} Mo par million de relevés")
+    print(f"-> Colonnes float64 / objet    : {footprint['columns'] / 1e6:8.1f} Mo par million de relevés")
+    print(f"-> Colonnes compactes          : {footprint['compact'] / 1e6:8.1f} Mo par million de relevés ({compact_time:.3f}s de conversion)")
+    return footprint
+
+
+def benchmark_storage_layouts(n_stations=10, n_days=30, n_queries=200, database="meteo_projet_BENCH"):
+    """Compare les dispositions 'flat', 'timeseries' et 'bucket' sur un serveur MongoDB réel.
+
+    Mesure le débit d'insertion, la taille sur disque (données + index) et la latence médiane d'une
+    requête station + plage de 6 heures. La base `database` est supprimée à la fin.
+    """
+    frames = make_synthetic_measures(n_stations, n_days)
+    rows = sum(len(frame) for frame in frames)
+    try:
+        client = MongoClient(etl_meteo.MONGO_URI, serverSelectionTimeoutMS=5000)
+        client.admin.command('ping')
+    except ConnectionFailure:
+        print("❌ BENCHMARK stockage ignoré : aucun serveur MongoDB joignable sur", etl_meteo.MONGO_URI)
+        return None
+
+    db = client[database]
+    rng = np.random.default_rng(1)
+    start_dates = pd.Timestamp('2024-10-01') + pd.to_timedelta(rng.integers(0, n_days * 24 - 6, n_queries), unit='h')
+    stations = [f"{1001 + i}" for i in rng.integers(0, n_stations, n_queries)]
+    results = {}
+    try:
+        for layout in ('flat', 'timeseries', 'bucket'):
+            collection = etl_meteo.prepare_storage_collection(db, layout, mode='full')
+            start = time.perf_counter()
+            if layout == 'flat':
+                etl_meteo.insert_documents(collection, frames)
+                etl_meteo.ensure_time_range_index(collection)
+            else:
+                etl_meteo.write_layout_documents(collection, frames, layout)
+            insert_time = time.perf_counter() - start
+
+            latencies = []
+            for station_id, window_start in zip(stations, start_dates):
+                begin = window_start.to_pydatetime()
+                start = time.perf_counter()
+                etl_meteo.query_time_range(collection, station_id, begin, begin + pd.Timedelta(hours=6), layout)
+                latencies.append(time.perf_counter() - start)
+
+            stats = db.command('collStats', collection.name)
+            results[layout] = {'rows_per_s': rows / insert_time, 'storage_mb': stats.get('storageSize', 0) / 1e6,
+                               'index_mb': stats.get('totalIndexSize', 0) / 1e6, 'query_ms_p50': float(np.median(latencies)) * 1e3}
+    finally:
+        client.drop_database(database)
+        client.close()
+
+    print(f"--- ⏱️ BENCHMARK dispositions de stockage ({n_stations} stations x {n_days} jours, {rows} relevés) ---")
+    for layout, r in results.items():
+        print(f"-> {layout:<10} : {r['rows_per_s']:>9,.0f} relevés/s, données {r['storage_mb']:6.2f} Mo, "
+              f"index {r['index_mb']:6.2f} Mo, requête 6 h (médiane) {r['query_ms_p50']:.2f} ms")
+    return results
+
+
+# --- Suite de référence : jeu de données synthétique complet, chaque étape du pipeline chronométrée ---
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark_suite(n_stations=2, n_days=7, rows_per_day=288, backend='mongomock', results_file=BENCHMARK_RESULTS_FILE,
+                        database="meteo_projet_BENCH", seed=0, incremental=None, quiet=True):
+    """Chronomètre chaque étape du pipeline sur un jeu synthétique de n_stations x n_days et enregistre le résultat.
+
+    Étapes : lecture et clean_and_convert_csv_df, lecture et clean_and_convert_json, normalisation des horodatages,
+    check_final_integrity, chargement (complet puis incrémental sans changement), agrégats journaliers, audit en ligne
+    et audits MongoDB. `backend` : 'mongomock' (hors-ligne) ou 'mongod' (serveur de MONGO_URI, base `database` supprimée
+    à la fin). Le rechargement incrémental (`incremental`) n'est mesuré par défaut qu'avec 'mongod' : mongomock évalue
+    les requêtes $in sans index et ne donne pas de durée représentative. Le résultat est ajouté à `results_file`
+    (JSON lines, None = non enregistré) et renvoyé.
+    """
+    if incremental is None:
+        incremental = backend == 'mongod'
+    backend_context = ExitStack()
+    if backend == 'mongomock':
+        import mongomock
+        backend_context.enter_context(mongomock_compat())
+        client = mongomock.MongoClient()
+    elif backend == 'mongod':
+        client = MongoClient(etl_meteo.MONGO_URI, serverSelectionTimeoutMS=5000)
+        client.admin.command('ping')
+    else:
+        raise ValueError(f"Backend inconnu : {backend} (attendu : mongomock, mongod)")
+
+    metrics = RunMetrics()
+    log = io.StringIO() if quiet else None
+    with backend_context, tempfile.TemporaryDirectory() as tmpdir, metrics, redirect_stdout(log) if quiet else nullcontext():
+        with metrics.stage("Génération des sources") as stage:
+            dataset = generate_synthetic_dataset(os.path.join(tmpdir, 'sources'), n_stations, n_days, rows_per_day, seed=seed)
+            stage.rows += dataset['csv_rows'] + dataset['json_rows']
+        registry = etl_meteo.SourceRegistry(dataset['data_dir'], index_path=os.path.join(tmpdir, 'index.json'))
+        registry.scan()
+        tasks = registry.tasks()
+
+        frames = []
+        for task in (t for t in tasks if t.kind == 'csv'):
+            with metrics.stage("Lecture CSV") as stage:
+                raw = pd.concat(etl_meteo.read_csv_chunks(task.path, task.date_str))
+                raw.name = task.date_str
+                stage.rows += len(raw)
+            with metrics.stage("clean_and_convert_csv_df") as stage:
+                df = etl_meteo.clean_and_convert_csv_df(raw, task.station_id, task.source)
+                stage.rows += len(raw)
+            with metrics.stage("normalize_timestamps", rows=len(df)):
+                frames.append(etl_meteo.normalize_timestamps(df, task.source, task.station_id))
+
+        with metrics.stage("Lecture JSON", rows=dataset['json_rows']):
+            hourly = read_full_json_file(dataset['json_file'])
+        with metrics.stage("clean_and_convert_json") as stage:
+            json_df = pd.DataFrame(etl_meteo.clean_and_convert_json(hourly))
+            stage.rows += len(json_df)
+        with metrics.stage("normalize_timestamps", rows=len(json_df)):
+            frames.append(etl_meteo.normalize_timestamps(json_df, 'Infoclimat'))
+
+        rows = sum(len(frame) for frame in frames)
+        footprint = record_footprint(frames)
+        with metrics.stage("compact_records", rows=rows):
+            frames = [etl_meteo.compact_records(frame) for frame in frames]
+        documents = [d for frame in frames for d in etl_meteo.batch_to_documents(frame)]
+        with metrics.stage("check_final_integrity", rows=rows):
+            etl_meteo.check_final_integrity(documents)
+        del documents
+
+        db = client[database]
+        try:
+            collection = db[etl_meteo.MONGO_COLLECTION]
+            collection.delete_many({})
+            with metrics.stage("Chargement complet", rows=rows):
+                etl_meteo.insert_documents(collection, frames)
+                etl_meteo.ensure_time_range_index(collection)
+            if incremental:
+                collection.drop_indexes()
+                etl_meteo.ensure_unique_key_index(collection)
+                with metrics.stage("Chargement incrémental (inchangé)", rows=rows):
+                    etl_meteo.upsert_documents(collection, frames)
+
+            rollup = etl_meteo.DailyRollup()
+            with metrics.stage("Agrégats journaliers") as stage:
+                for frame in frames:
+                    rollup.update(frame)
+                etl_meteo.write_daily_rollup(db[etl_meteo.DAILY_ROLLUP_COLLECTION], rollup, mode='full')
+                stage.rows += rollup.touched
+
+            with metrics.stage("Audit en ligne", rows=rows):
+                inline = quality_audit.StreamingQualityAudit(etl_meteo.NUMERIC_FIELDS)
+                for frame in frames:
+                    inline.update(frame)
+                inline.result()
+            with metrics.stage("Audit MongoDB", rows=rows):
+                quality_audit.run_audit(collection, fields=etl_meteo.NUMERIC_FIELDS)
+            with metrics.stage("Taux d'erreur (plages)", rows=rows):
+                quality_audit.print_range_report(quality_audit.run_audit(collection, fields=list(quality_audit.QUALITY_CONSTRAINTS)))
+            stored = collection.count_documents({})
+        finally:
+            client.drop_database(database)
+            client.close()
+
+    result = {
+        'commit': _git_commit(),
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'backend': backend,
+        'scale': {'stations': n_stations, 'days': n_days, 'rows_per_day': rows_per_day, 'seed': seed, 'incremental': incremental},
+        'rows': rows,
+        'stored': stored,
+        'bytes_per_million_rows': footprint,
+        'environment': {'python': platform.python_version(), 'pandas': pd.__version__, 'numpy': np.__version__},
+        'stages': {name: {'seconds': stage.elapsed, 'rows': stage.rows, 'rows_per_second': stage.rows_per_second,
+                          'peak_rss_bytes': stage.peak_rss_bytes} for name, stage in metrics.stages.items()},
+    }
+    if results_file:
+        with open(results_file, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+    print(f"--- ⏱️ SUITE DE RÉFÉRENCE ({n_stations} stations x {n_days} jours, {rows} relevés, backend {backend}, commit {result['commit']}) ---")
+    for name, stage in result['stages'].items():
+        print(f"-> {name:<34} : {stage['seconds']:8.3f}s, {stage['rows_per_second']:>12,.0f} lignes/s")
+    print("-> Mémoire par million de relevés : " + ", ".join(f"{name} {size / 1e6:,.1f} Mo" for name, size in footprint.items()))
+    return result
+
+
+def load_benchmark_results(results_file=BENCHMARK_RESULTS_FILE):
+    """Relit les résultats enregistrés (du plus ancien au plus récent)."""
+    if not os.path.exists(results_file):
+        return []
+    with open(results_file, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def compare_benchmark_results(results_file=BENCHMARK_RESULTS_FILE, baseline=None, threshold=0.10):
+    """Compare la dernière exécution à une référence de même échelle et même backend.
+
+    La référence est l'exécution précédente, ou la dernière exécution du commit `baseline`. Les étapes plus lentes
+    de plus de `threshold` sont signalées ; renvoie {étape: rapport des durées (dernière / référence)}.
+    """
+    results = load_benchmark_results(results_file)
+    if not results:
+        print(f"ℹ️ Aucun résultat dans {results_file}.")
+        return {}
+    latest = results[-1]
+    candidates = [r for r in results[:-1] if r['scale'] == latest['scale'] and r['backend'] == latest['backend']
+                  and (baseline is None or (r.get('commit') or '').startswith(baseline))]
+    if not candidates:
+        print("ℹ️ Aucune exécution de référence comparable (même échelle, même backend).")
+        return {}
+    reference = candidates[-1]
+
+    print(f"--- ⏱️ COMPARAISON : {latest['commit']} contre {reference['commit']} ({reference['timestamp']}) ---")
+    ratios = {}
+    for name, stage in latest['stages'].items():
+        before = reference['stages'].get(name)
+        if not before or not before['seconds']:
+            continue
+        ratios[name] = stage['seconds'] / before['seconds']
+        flag = "❌" if ratios[name] > 1 + threshold else ("✅" if ratios[name] < 1 - threshold else "  ")
+        print(f"{flag} {name:<34} : {before['seconds']:8.3f}s -> {stage['seconds']:8.3f}s (x{ratios[name]:.2f})")
+    return ratios
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Bancs d'essai du pipeline E-T-L météo.")
+    parser.add_argument('--micro', action='store_true',
+                        help="Exécute les bancs d'essai ciblés (conversion CSV, lecture JSON, unification, dispositions de stockage).")
+    parser.add_argument('--stations', type=int, default=2, help="Nombre de stations du jeu synthétique.")
+    parser.add_argument('--days', type=int, default=7, help="Nombre de jours du jeu synthétique.")
+    parser.add_argument('--rows-per-day', type=int, default=288, help="Relevés Weather Underground par station et par jour.")
+    parser.add_argument('--backend', choices=['mongomock', 'mongod'], default='mongomock',
+                        help="Chargement vers mongomock (hors-ligne) ou vers le serveur MongoDB de MONGO_URI.")
+    parser.add_argument('--results-file', default=BENCHMARK_RESULTS_FILE, help="Fichier JSON lines des résultats.")
+    parser.add_argument('--compare', nargs='?', const='', default=None, metavar='COMMIT',
+                        help="Compare la dernière exécution à la précédente (ou au commit indiqué) sans relancer la suite.")
+    args = parser.parse_args()
+
+    if args.micro:
+        benchmark_csv_conversion()
+        benchmark_json_parsing()
+        benchmark_unification()
+        benchmark_record_footprint()
+        benchmark_storage_layouts()
+    elif args.compare is not None:
+        compare_benchmark_results(args.results_file, baseline=args.compare or None)
+    else:
+        run_benchmark_suite(args.stations, args.days, args.rows_per_day, args.backend, args.results_file)
+        compare_benchmark_results(args.results_file)
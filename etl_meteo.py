@@ -1,17 +1,74 @@
+import numpy as np
 import pandas as pd
+from pandas.api.types import is_bool_dtype, is_datetime64_any_dtype, is_numeric_dtype
+import asyncio
 import json
+import re
+import hashlib
 from datetime import datetime
 import os 
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure, OperationFailure
+import io
+import glob
+import time
+import threading
+import queue
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager, redirect_stdout
+from dataclasses import dataclass
+from pymongo import ASCENDING, MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError, ConnectionFailure, OperationFailure
+from pymongo.write_concern import WriteConcern
+
+try:
+    from pymongo import AsyncMongoClient
+except ImportError:  # PyMongo < 4.9 : pas d'API asynchrone, seul le mode synchrone est disponible
+    AsyncMongoClient = None
+
+from instrumentation import FileStats, RunMetrics
+from quality_audit import QUALITY_CONSTRAINTS, AnomalyDetector, StreamingQualityAudit, run_audit, run_audit_async
 
 # --- 0. CONFIGURATION MONGO DB ET FICHIERS ---
 
-# URI de votre instance MongoDB Compass locale
-MONGO_URI = "mongodb://localhost:27017/" 
-MONGO_DATABASE = "meteo_projet"            # Base de données cible
+# URI de votre instance MongoDB Compass locale (variable d'environnement MONGO_URI, ex: docker-compose)
+MONGO_URI = os.environ.get("MONGO_URI", "mongodb://localhost:27017/")
+MONGO_DATABASE = os.environ.get("MONGO_DATABASE", "meteo_projet")  # Base de données cible
 MONGO_COLLECTION = "donnees_horaires"      # Collection cible
 
+# Mode de chargement : 'full' (purge + réinsertion complète) ou 'incremental' (upsert des seuls documents modifiés)
+LOAD_MODE = "full"
+LOAD_BATCH_SIZE = 1000                     # Nombre de documents par insert_many / bulk_write
+LOAD_QUEUE_SIZE = 4                        # Lots préparés en attente du thread d'écriture (file bornée)
+RELAXED_WRITE_CONCERN = {'w': 1, 'j': False}  # Write concern allégé pour les rechargements massifs (sans journal)
+LOAD_WRITE_CONCERN = None                  # None = write concern par défaut du serveur
+MONGO_MAX_POOL_SIZE = 16                   # Connexions du client partagé par le chargement, les agrégats et l'audit
+# Mode asyncio (API asynchrone de PyMongo) : lots écrits simultanément et requêtes d'audit lancées en parallèle
+ASYNC_MONGO_IO = False
+ASYNC_LOAD_CONCURRENCY = 4                 # Lots en cours d'écriture simultanément en mode asyncio
+
+# L'audit qualité est calculé pendant la transformation ; la relecture complète de MongoDB après chargement est optionnelle
+POST_LOAD_AUDIT = False
+# Drapeaux d'anomalies temporelles par relevé (pics, valeurs figées, trous horaires : quality_audit.AnomalyDetector)
+FLAG_ANOMALIES = True
+DOCUMENT_KEY_FIELDS = ['id_station', 'date_heure_utc']  # Clé unique d'un relevé horaire
+CONTENT_HASH_FIELD = "hash_contenu"        # Empreinte du contenu, pour ignorer les documents inchangés
+
+# Disposition de stockage : 'flat' (un document par relevé), 'timeseries' (collection time-series MongoDB)
+# ou 'bucket' (un document par station et par jour UTC, relevés dans le tableau `mesures`)
+STORAGE_LAYOUT = "flat"
+STORAGE_COLLECTIONS = {
+    'flat': MONGO_COLLECTION,
+    'timeseries': "donnees_horaires_ts",
+    'bucket': "donnees_horaires_seaux",
+}
+TIMESERIES_META_FIELD = "station"           # Sous-document {id_station, source_donnees} des collections time-series
+STATION_FIELDS = ['id_station', 'source_donnees']  # Champs communs à tous les relevés d'une station
+
+# Agrégats journaliers par station (tableaux de bord), calculés pendant la transformation et mis à jour par upsert
+MAINTAIN_DAILY_ROLLUP = True
+DAILY_ROLLUP_COLLECTION = "donnees_journalieres"
+DAILY_ROLLUP_KEY_FIELDS = ['id_station', 'jour']  # Clé unique d'un agrégat (jour UTC)
+
 # --- DÉFINITIONS DES CHEMINS DE FICHIERS LOCAUX (DOIVENT CORRESPONDRE AUX NOMS DE VOS FICHIERS) ---
 csv_files_la_madeleine = {
     '2024-10-07': "Weather+Underground+-+La+Madeleine,+FR.xlsx - 071024.csv",
@@ -33,9 +90,73 @@ csv_files_ichtegem = {
 }
 JSON_FILE_PATH = "Data_Source1_011024-071024.json"
 
+# Découverte automatique des fichiers sources (SourceRegistry) : répertoire de données et motifs glob
+DATA_DIR = "."
+WU_CSV_PATTERN = "Weather+Underground+-+*.csv"
+INFOCLIMAT_JSON_PATTERN = "Data_Source1_*.json"
+# Nom des exports Weather Underground : "<préfixe>+-+<station>.xlsx - <jjmmaa>.csv"
+WU_FILENAME_REGEX = re.compile(r'^Weather\+Underground\+-\+(?P<station>.+?)(?:\.xlsx)? - (?P<ddmmyy>\d{6})\.csv$')
+# Identifiant de station par libellé de fichier (les stations inconnues gardent leur libellé comme identifiant)
+WU_STATION_IDS = {"La+Madeleine,+FR": "1001", "Ichtegem,+BE": "1002"}
+SOURCE_INDEX_FILE = "index_sources.json"   # Index (taille, mtime) des fichiers découverts, rangé dans CACHE_DIR
+
+# Taille des blocs (lignes) lus par read_csv en mode streaming
+CSV_CHUNKSIZE = 50_000
+
+# Taille des lectures (caractères) du parseur JSON incrémental
+JSON_READ_SIZE = 1 << 16
+
+# Nombre de workers par défaut du mode parallèle (un fichier source par tâche)
+ETL_WORKERS = os.cpu_count() or 1
+
+# Cache local des fichiers transformés (clé = empreinte du contenu + version des règles de conversion)
+USE_TRANSFORM_CACHE = True
+CACHE_DIR = ".cache_etl"
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+CONVERSION_RULES_VERSION = "3"   # À incrémenter à chaque changement de logique de transformation
+
+# Représentation compacte des relevés unifiés (lots en mémoire et cache) : stations et sources en catégories,
+# mesures en float32 (précision des capteurs bien inférieure à 7 chiffres significatifs), humidité en petit entier nullable
+COMPACT_RECORDS = True
+CATEGORY_FIELDS = ['id_station', 'source_donnees']
+FLOAT32_FIELDS = ['temperature_c', 'pression_hpa', 'vent_vitesse_ms', 'pluie_accum_mm']
+SMALL_INT_FIELDS = ['humidite_pct']
+SMALL_INT_DTYPES = ('Int8', 'Int16', 'Int32')   # Le plus petit type contenant toutes les valeurs du lot est retenu
+
+# Mesures d'exécution (durée, débit, pic de RSS par étape ; compteurs par fichier) : None = pas de fichier écrit
+METRICS_FILE = None                # Fichier JSON des mesures
+PROMETHEUS_TEXTFILE = None         # Fichier texte Prometheus (collecteur textfile de node_exporter)
+PROFILE_MODE = None                # None, 'cprofile' ou 'tracemalloc'
+
 # Définition des champs numériques à vérifier dans MongoDB
 NUMERIC_FIELDS = ['temperature_c', 'humidite_pct', 'pression_hpa', 'vent_vitesse_ms', 'pluie_accum_mm']
 
+# Table déclarative des conversions Weather Underground (colonne cible -> colonne source, facteurs)
+# Formule appliquée : (valeur + offset) * multiplier / divisor
+CSV_UNIT_CONVERSIONS = {
+    'temperature_c':   {'source': 'Temperature',    'offset': -32, 'multiplier': 5, 'divisor': 9},   # °F -> °C
+    'humidite_pct':    {'source': 'Humidity'},                                                    # %
+    'pression_hpa':    {'source': 'Pressure',       'multiplier': 33.8638},  # inHg -> hPa
+    'vent_vitesse_ms': {'source': 'Speed',          'multiplier': 0.44704},  # mph -> m/s
+    'pluie_accum_mm':  {'source': 'Precip. Accum.', 'multiplier': 25.4},     # in -> mm
+}
+
+# Remplacements appliqués aux cellules texte avant conversion, quelle que soit la colonne (même ordre que clean_value :
+# un retrait peut en révéler un autre, les résultats restent identiques à la conversion cellule par cellule)
+UNIT_STRIP_REPLACEMENTS = [(',', '.'), (' ', ''), ('°F', ''), ('mph', ''), ('in', ''), ('w/m²', ''), ('%', '')]
+
+# Formats d'horodatage candidats par source (le premier qui convient est mémorisé pour la source)
+TIMESTAMP_FORMATS = {
+    'Weather Underground': ['%Y-%m-%d %I:%M %p', '%Y-%m-%d %I:%M:%S %p', '%Y-%m-%d %H:%M', '%Y-%m-%d %H:%M:%S'],
+    'Infoclimat': ['%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%dT%H:%M:%S'],
+}
+TIMESTAMP_SAMPLE_SIZE = 20   # Nombre de valeurs testées pour détecter le format d'un lot
+
+# Fuseau horaire des heures locales : par source (Infoclimat fournit déjà de l'UTC), sinon par station
+SOURCE_TIMEZONES = {'Infoclimat': 'UTC'}
+STATION_TIMEZONES = {'1001': 'Europe/Paris', '1002': 'Europe/Brussels'}
+DEFAULT_TIMEZONE = 'UTC'
+
 # --- 1. FONCTIONS DE TRANSFORMATION ET DE VÉRIFICATION ---
 
 def clean_value(value):
@@ -45,18 +166,64 @@ def clean_value(value):
     try: return float(value)
     except ValueError: return None
 
+def clean_numeric_series(series):
+    """Version vectorisée de clean_value : nettoie une colonne entière et la convertit en float64."""
+    if is_numeric_dtype(series) and not is_bool_dtype(series):
+        return series.astype('float64')
+
+    # Les relevés météo ont peu de valeurs distinctes : on nettoie chaque valeur unique une seule fois
+    codes, uniques = pd.factorize(series)
+    cleaned_uniques = np.append(_clean_unique_values(uniques), np.nan)  # Le code -1 (manquant) pointe sur NaN
+    return pd.Series(cleaned_uniques[codes], index=series.index)
+
+def _clean_unique_values(uniques):
+    """Nettoie un tableau de valeurs distinctes non manquantes et retourne un ndarray float64."""
+    text = pd.Series(uniques, dtype=object).astype(str)
+    # Les remplacements sont chaînés dans le même ordre que clean_value : un retrait peut en révéler un autre
+    for token, replacement in UNIT_STRIP_REPLACEMENTS:
+        text = text.str.replace(token, replacement, regex=False)
+
+    try:
+        # astype(float64) applique la sémantique de float() : résultat identique bit à bit à clean_value
+        return text.astype('float64').to_numpy()
+    except ValueError:
+        pass
+
+    # Chemin lent (rare) : certaines valeurs ne sont pas convertibles et deviennent NaN
+    values = pd.to_numeric(text, errors='coerce').to_numpy(dtype='float64', copy=True)
+    parsable = ~np.isnan(values)
+    values[parsable] = text[parsable].astype('float64').to_numpy()
+    for pos in np.flatnonzero(~parsable):
+        try: values[pos] = float(text.iat[pos])
+        except ValueError: values[pos] = np.nan
+    return values
+
+def convert_units(values, rule):
+    """Applique une règle de CSV_UNIT_CONVERSIONS : (valeur + offset) * multiplier / divisor."""
+    # Les étapes neutres sont omises pour conserver exactement les arrondis du calcul scalaire
+    if rule.get('offset'):
+        values = values + rule['offset']
+    if rule.get('multiplier', 1) != 1:
+        values = values * rule['multiplier']
+    if rule.get('divisor', 1) != 1:
+        values = values / rule['divisor']
+    return values
+
 def clean_and_convert_csv_df(df, station_id, source):
     """Nettoie le DataFrame CSV et effectue les conversions d'unités (Impérial -> Métrique), retourne le DataFrame."""
-    df_clean = pd.DataFrame()
-    
-    # Conversions (Noms de colonnes confirmés : Temperature, Humidity, Speed, Precip. Accum., Pressure, Time)
-    df_clean['temperature_c'] = df['Temperature'].apply(clean_value).apply(lambda f: (f - 32) * 5/9 if f is not None else None)
-    df_clean['humidite_pct'] = df['Humidity'].apply(clean_value)
-    df_clean['pression_hpa'] = df['Pressure'].apply(clean_value).apply(lambda i: i * 33.8638 if i is not None else None) # Conversion inHg -> hPa
-    df_clean['vent_vitesse_ms'] = df['Speed'].apply(clean_value).apply(lambda m: m * 0.44704 if m is not None else None) # Conversion mph -> m/s
-    df_clean['pluie_accum_mm'] = df['Precip. Accum.'].apply(clean_value).apply(lambda i: i * 25.4 if i is not None else None) # Conversion in -> mm
+    df_clean = pd.DataFrame(index=df.index)
 
-    df_clean['date_heure_utc'] = df['Time'].apply(lambda t: t if isinstance(t, str) else None).apply(lambda t: f"{df.name} {t}" if t else None)
+    # Conversions pilotées par CSV_UNIT_CONVERSIONS (Noms de colonnes confirmés : Temperature, Humidity, Speed, Precip. Accum., Pressure, Time)
+    for target_col, rule in CSV_UNIT_CONVERSIONS.items():
+        values = convert_units(clean_numeric_series(df[rule['source']]), rule)
+        if len(values) and values.isna().all():
+            # Colonne entièrement vide : des None (et non des NaN), comme l'ancienne conversion cellule par cellule
+            values = pd.Series([None] * len(values), index=df.index, dtype=object)
+        df_clean[target_col] = values
+
+    times = df['Time']
+    has_time = times.str.len().gt(0) if times.dtype == object else pd.Series(False, index=df.index)
+    df_clean['date_heure_utc'] = (f"{df.name} " + times.where(has_time, '')).where(has_time, None)
 
     df_clean['id_station'] = station_id
     df_clean['source_donnees'] = source
@@ -66,15 +233,92 @@ def clean_and_convert_csv_df(df, station_id, source):
     final_cols = ['date_heure_utc', 'temperature_c', 'humidite_pct', 'pression_hpa', 'vent_vitesse_ms', 'id_station', 'source_donnees', 'pluie_accum_mm']
     return df_clean[final_cols]
 
+class StreamingIntegrityCheck:
+    """Contrôle d'intégrité d'un fichier CSV alimenté bloc par bloc (doublons détectés entre les blocs)."""
+
+    def __init__(self, key_columns=('date_heure_utc',)):
+        self.key_columns = list(key_columns)
+        self.seen_keys = set()
+        self.doublons = 0
+        self.manquants_critiques = 0
+        self.lignes = 0
+
+    def update(self, df_clean):
+        """Ajoute un bloc nettoyé aux statistiques."""
+        if len(self.key_columns) == 1:
+            keys = df_clean[self.key_columns[0]]
+        else:
+            keys = pd.Series(list(zip(*(df_clean[col] for col in self.key_columns))), index=df_clean.index)
+        # Doublon = clé déjà vue dans ce bloc ou dans un bloc précédent
+        self.doublons += int((keys.duplicated() | keys.isin(self.seen_keys)).sum())
+        self.seen_keys.update(keys.unique())
+        self.manquants_critiques += int(df_clean['temperature_c'].isnull().sum())
+        self.lignes += len(df_clean)
+
+    def report(self, station_id, date_str):
+        """Affiche le résultat du contrôle d'intégrité."""
+        if self.doublons > 0 or self.manquants_critiques > 0:
+            print(f"   -> ❌ INTÉGRITÉ ({station_id} - {date_str}) : Doublons: {self.doublons}, Température manquante: {self.manquants_critiques}")
+        else:
+            print(f"   -> ✅ INTÉGRITÉ ({station_id} - {date_str}) : Passée.")
+
 def check_initial_integrity(df_clean, station_id, date_str):
     """Vérifie l'intégrité des données CSV après le nettoyage."""
-    doublons = df_clean.duplicated(subset=['date_heure_utc']).sum()
-    manquants_critiques = df_clean['temperature_c'].isnull().sum()
-    
-    if doublons > 0 or manquants_critiques > 0:
-        print(f"   -> ❌ INTÉGRITÉ ({station_id} - {date_str}) : Doublons: {doublons}, Température manquante: {manquants_critiques}")
-    else:
-        print(f"   -> ✅ INTÉGRITÉ ({station_id} - {date_str}) : Passée.")
+    check = StreamingIntegrityCheck()
+    check.update(df_clean)
+    check.report(station_id, date_str)
+
+def _object_array(values):
+    """Construit un ndarray d'objets 1D (sans que numpy n'interprète les listes imbriquées)."""
+    cells = np.empty(len(values), dtype=object)
+    cells[:] = values
+    return cells
+
+def _truthy(cells):
+    """Masque des cellules « vraies » au sens Python (None, '', 0 et False sont faux)."""
+    return np.fromiter(map(bool, cells), dtype=bool, count=len(cells))
+
+def _optional_float(cells):
+    """float(v) if v else None, sur une colonne entière ; renvoie un tableau Float64 (None -> <NA>, NaN conservé)."""
+    present = _truthy(cells)
+    values = np.full(len(cells), np.nan)
+    values[present] = pd.Series(cells[present], dtype=object).astype('float64').to_numpy()
+    return pd.arrays.FloatingArray(values, ~present)
+
+def _optional_int(cells):
+    """int(v) if v else None, sur une colonne entière ; renvoie un tableau Int64 (None -> <NA>)."""
+    present = _truthy(cells)
+    values = np.zeros(len(cells), dtype='int64')
+    values[present] = pd.Series(cells[present], dtype=object).astype('int64').to_numpy()
+    return pd.arrays.IntegerArray(values, ~present)
+
+def _float_or_zero(cells):
+    """float(v or 0), sur une colonne entière."""
+    cells = np.where(_truthy(cells), cells, 0)
+    return pd.Series(cells, dtype=object).astype('float64').to_numpy()
+
+def convert_json_records(records):
+    """Convertit un lot d'enregistrements horaires Infoclimat en DataFrame colonne par colonne.
+
+    Mêmes règles que la conversion enregistrement par enregistrement : vent km/h -> m/s,
+    pluie_1h (sinon pluie_3h), valeurs absentes ou vides -> None (colonnes nullables Float64/Int64).
+    """
+    def column(key, default=None):
+        return _object_array([record.get(key, default) for record in records])
+
+    has_pluie_1h = np.fromiter(('pluie_1h' in record for record in records), dtype=bool, count=len(records))
+    pluie = np.where(has_pluie_1h, column('pluie_1h'), column('pluie_3h', 0))
+
+    return pd.DataFrame({
+        'date_heure_utc': column('dh_utc'),
+        'temperature_c': _optional_float(column('temperature')),
+        'humidite_pct': _optional_int(column('humidite')),
+        'pression_hpa': _optional_float(column('pression')),
+        'vent_vitesse_ms': _float_or_zero(column('vent_moyen', 0)) / 3.6,
+        'id_station': column('id_station'),
+        'source_donnees': 'Infoclimat',
+        'pluie_accum_mm': _float_or_zero(pluie),
+    })
 
 def clean_and_convert_json(json_hourly_data):
     """Nettoie et convertit les données JSON (Infoclimat)."""
@@ -84,55 +328,354 @@ def clean_and_convert_json(json_hourly_data):
         if not isinstance(records, list):
             print(f"   -> ⚠️ AVERTISSEMENT JSON: Données inattendues pour la station {station_id}. Ignoré.")
             continue
+        all_json_records.extend(record for record in records if isinstance(record, dict))
             
-        for record in records:
-            if not isinstance(record, dict):
-                continue
+    # Format compatible MongoDB (dictionnaires)
+    return convert_json_records(all_json_records).to_dict('records')
 
-            vent_moyen_ms = float(record.get('vent_moyen', 0) or 0) / 3.6
-            pluie_mm = float(record.get('pluie_1h', record.get('pluie_3h', 0) or 0) or 0)
-            
-            # Format compatible MongoDB (dictionnaire)
-            new_record = {
-                'date_heure_utc': record.get('dh_utc'),
-                'temperature_c': float(record.get('temperature')) if record.get('temperature') else None,
-                'humidite_pct': int(record.get('humidite')) if record.get('humidite') else None,
-                'pression_hpa': float(record.get('pression')) if record.get('pression') else None,
-                'vent_vitesse_ms': vent_moyen_ms,
-                'id_station': record.get('id_station'),
-                'source_donnees': 'Infoclimat', 
-                'pluie_accum_mm': pluie_mm
-            }
-            all_json_records.append(new_record)
-            
-    return all_json_records
+_TIMESTAMP_FORMAT_CACHE = {}   # source -> dernier format reconnu
+
+def detect_timestamp_format(values, source):
+    """Renvoie le format d'horodatage d'une source, en essayant d'abord celui mémorisé (None si aucun ne convient)."""
+    sample = values.dropna().head(TIMESTAMP_SAMPLE_SIZE)
+    cached = _TIMESTAMP_FORMAT_CACHE.get(source)
+    candidates = ([cached] if cached else []) + [fmt for fmt in TIMESTAMP_FORMATS.get(source, ()) if fmt != cached]
+    for fmt in candidates:
+        if pd.to_datetime(sample, format=fmt, errors='coerce').notna().all():
+            _TIMESTAMP_FORMAT_CACHE[source] = fmt
+            return fmt
+    return None
+
+def source_timezone(source, station_id=None):
+    """Fuseau horaire des horodatages d'une source (ou de la station pour les heures locales)."""
+    return SOURCE_TIMEZONES.get(source) or STATION_TIMEZONES.get(station_id, DEFAULT_TIMEZONE)
+
+def normalize_timestamps(df, source, station_id=None, seen_ambiguous=None):
+    """Convertit `date_heure_utc` (texte, heure locale ou UTC) en datetime UTC, stocké comme date BSON.
+
+    L'analyse est vectorisée avec un format explicite ; les lignes dont l'horodatage reste
+    illisible sont écartées (la date fait partie de la clé d'un relevé). `seen_ambiguous` (ensemble partagé
+    par les lots d'un même fichier) retient les heures locales répétées déjà rencontrées, pour qu'une
+    heure répétée coupée entre deux lots soit bien en heure d'hiver dans le second.
+    """
+    if df.empty or 'date_heure_utc' not in df.columns or is_datetime64_any_dtype(df['date_heure_utc']):
+        return df
+
+    values = df['date_heure_utc']
+    fmt = detect_timestamp_format(values, source)
+    parsed = pd.to_datetime(values, format=fmt, errors='coerce') if fmt else pd.Series(pd.NaT, index=values.index, dtype='datetime64[ns]')
+    failed = parsed.isna() & values.notna()
+    # Chemin rare : plusieurs formats dans un même lot
+    for other in TIMESTAMP_FORMATS.get(source, ()):
+        if not failed.any():
+            break
+        if other != fmt:
+            parsed[failed] = pd.to_datetime(values[failed], format=other, errors='coerce')
+            failed = parsed.isna() & values.notna()
+
+    timezone = source_timezone(source, station_id)
+    if timezone != 'UTC':
+        # Heure répétée au passage à l'heure d'hiver : la 1re occurrence est en heure d'été, la suivante en heure d'hiver
+        first_occurrence = (~parsed.duplicated(keep='first')).to_numpy()
+        if seen_ambiguous is not None:
+            ambiguous = (parsed.notna() & parsed.dt.tz_localize(timezone, ambiguous='NaT', nonexistent='shift_forward').isna()).to_numpy()
+            if ambiguous.any():
+                first_occurrence[ambiguous] &= ~parsed[ambiguous].isin(seen_ambiguous).to_numpy()
+                seen_ambiguous.update(parsed[ambiguous])
+        parsed = (parsed.dt.tz_localize(timezone, ambiguous=first_occurrence, nonexistent='shift_forward')
+                        .dt.tz_convert('UTC').dt.tz_localize(None))
+
+    df = df.assign(date_heure_utc=parsed)
+    invalid = parsed.isna()
+    if invalid.any():
+        print(f"   -> ⚠️ AVERTISSEMENT: {int(invalid.sum())} horodatage(s) illisible(s) ({source}), lignes écartées.")
+        df = df[~invalid.to_numpy()]
+    return df
+
+# --- 1 bis. REPRÉSENTATION COMPACTE DES RELEVÉS UNIFIÉS ---
+
+def compact_records(df):
+    """Convertit un lot unifié en colonnes compactes ; les valeurs stockées dans MongoDB sont inchangées au float32 près.
+
+    `id_station` et `source_donnees` deviennent des catégories, les mesures float64 passent en float32 (les colonnes
+    nullables Float64 en Float32 : <NA> reste distinct de NaN) et `humidite_pct` en entier nullable Int8/Int16/Int32
+    quand toutes ses valeurs sont entières et qu'aucune n'est NaN (un NaN est stocké comme NaN, pas comme null).
+    """
+    if not COMPACT_RECORDS or not isinstance(df, pd.DataFrame) or df.empty:
+        return df
+    columns = {}
+    for column in CATEGORY_FIELDS:
+        if column in df.columns and not isinstance(df[column].dtype, pd.CategoricalDtype):
+            columns[column] = df[column].astype('category')
+    for column in FLOAT32_FIELDS + SMALL_INT_FIELDS:
+        if column in df.columns:
+            compact = _compact_measure(df[column], integer=column in SMALL_INT_FIELDS)
+            if compact is not None:
+                columns[column] = compact
+    return df.assign(**columns) if columns else df
+
+def _compact_measure(values, integer=False):
+    """Type compact d'une colonne de mesures, ou None si elle est déjà compacte ou non numérique."""
+    if not is_numeric_dtype(values) or is_bool_dtype(values):
+        return None
+    masked = isinstance(values.dtype, pd.api.extensions.ExtensionDtype)
+    if integer:
+        numbers = values.to_numpy(dtype='float64', na_value=np.nan)
+        present = ~values.isna().to_numpy() if masked else ~np.isnan(numbers)
+        # Un NaN d'une colonne float64 (stocké comme NaN) ne peut pas devenir <NA> (stocké comme null)
+        if (masked or present.all()) and np.array_equal(numbers[present], np.round(numbers[present])):
+            low, high = (numbers[present].min(), numbers[present].max()) if present.any() else (0, 0)
+            for dtype in SMALL_INT_DTYPES:
+                info = np.iinfo(dtype.lower())
+                if info.min <= low and high <= info.max:
+                    return None if values.dtype == dtype else values.astype(dtype)
+    if values.dtype in ('float32', 'Float32'):
+        return None
+    return values.astype('Float32' if masked else 'float32')
+
+def widen_float32(values):
+    """Valeurs float32 -> ndarray float64 par leur plus courte écriture décimale (12.3 et non 12.300000190734863).
+
+    Les relevés ont peu de valeurs distinctes : chaque valeur unique n'est convertie qu'une fois (<NA> -> NaN).
+    """
+    data = values.to_numpy(dtype='float32', na_value=np.nan) if isinstance(values, pd.Series) else np.asarray(values, dtype='float32')
+    codes, uniques = pd.factorize(data)
+    return np.append(uniques.astype(str).astype('float64'), np.nan)[codes]
+
+def frame_to_documents(df):
+    """Documents MongoDB d'un lot : catégories -> chaînes, float32 élargis par widen_float32, <NA> -> None."""
+    widened = {}
+    for column, dtype in df.dtypes.items():
+        if dtype == 'float32':
+            widened[column] = widen_float32(df[column])
+        elif dtype == 'Float32':
+            widened[column] = pd.arrays.FloatingArray(widen_float32(df[column]), df[column].isna().to_numpy())
+    return (df.assign(**widened) if widened else df).to_dict('records')
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+    except ImportError as e:
+        raise ImportError("L'export Arrow / Parquet nécessite pyarrow (pip install -r requirements.txt).") from e
+    return pyarrow
+
+def to_arrow_table(frames):
+    """Table Arrow d'un ou plusieurs lots unifiés (catégories -> dictionnaires, colonnes numériques sans copie si possible)."""
+    pa = _import_pyarrow()
+    frames = [frames] if isinstance(frames, pd.DataFrame) else list(frames)
+    tables = [pa.Table.from_pandas(compact_records(frame), preserve_index=False) for frame in frames if len(frame)]
+    return pa.concat_tables(tables, promote_options='permissive') if tables else pa.table({})
+
+def export_parquet(frames, path):
+    """Exporte des lots unifiés dans un fichier Parquet (pyarrow requis) ; renvoie le nombre de lignes écrites."""
+    _import_pyarrow()
+    import pyarrow.parquet as pq
+    table = to_arrow_table(frames)
+    pq.write_table(table, path)
+    return table.num_rows
+
+def key_hashes(df, key_fields=DOCUMENT_KEY_FIELDS):
+    """Empreintes 64 bits des clés d'un lot (une colonne absente compte comme manquante)."""
+    return pd.util.hash_pandas_object(df.reindex(columns=list(key_fields)), index=False).to_numpy()
+
+class SeenKeys:
+    """Ensemble d'empreintes 64 bits de clés déjà vues, alimenté lot par lot (8 octets par clé).
+
+    Les empreintes sont rangées en niveaux triés de tailles décroissantes : les nouvelles empreintes forment un
+    niveau, fusionné avec le précédent tant que celui-ci n'est pas plus de deux fois plus grand. Chaque empreinte
+    est ainsi fusionnée O(log n) fois quel que soit le nombre de lots ; une recherche coûte un searchsorted par niveau.
+    """
+
+    def __init__(self):
+        self.levels = []   # Niveaux d'empreintes triées (uint64), du plus grand au plus petit
+
+    def __len__(self):
+        return sum(len(level) for level in self.levels)
+
+    def contains(self, hashes):
+        """Masque des empreintes déjà vues."""
+        seen = np.zeros(len(hashes), dtype=bool)
+        for level in self.levels:
+            positions = np.searchsorted(level, hashes).clip(max=len(level) - 1)
+            seen |= level[positions] == hashes
+        return seen
+
+    def add(self, hashes):
+        """Ajoute des empreintes ; renvoie le masque des doublons (déjà vues, ou répétées dans `hashes`)."""
+        duplicated = pd.Series(hashes).duplicated().to_numpy() | self.contains(hashes)
+        new = np.unique(hashes[~duplicated])
+        if len(new):
+            self.levels.append(new)
+            while len(self.levels) > 1 and len(self.levels[-2]) <= 2 * len(self.levels[-1]):
+                last = self.levels.pop()
+                self.levels[-1] = np.sort(np.concatenate([self.levels[-1], last]))
+        return duplicated
+
+class FinalIntegrityCheck:
+    """Intégrité de l'ensemble unifié, calculée lot par lot sans reconstruire de DataFrame global.
+
+    Les doublons (date/station) entre lots sont détectés dans les empreintes 64 bits des clés déjà vues (SeenKeys) ;
+    les valeurs manquantes et la période couverte sont cumulées par lot.
+    """
+
+    def __init__(self, key_fields=('date_heure_utc', 'id_station')):
+        self.key_fields = list(key_fields)
+        self.total = 0
+        self.doublons = 0
+        self.nulls = {}        # colonne -> nombre de valeurs manquantes (ordre d'apparition des colonnes)
+        self.start_date = None
+        self.end_date = None
+        self._seen = SeenKeys()
+
+    def update(self, batch):
+        """Ajoute un lot (DataFrame ou liste de documents) aux statistiques ; renvoie le lot inchangé."""
+        df = batch if isinstance(batch, pd.DataFrame) else pd.DataFrame(batch)
+        if df.empty:
+            return batch
+
+        # Doublons : dans le lot, ou déjà vus dans un lot précédent
+        self.doublons += int(self._seen.add(key_hashes(df, self.key_fields)).sum())
+
+        # Valeurs manquantes : une colonne absente d'un lot compte comme manquante sur tout le lot
+        batch_nulls = df.isnull().sum()
+        for column in batch_nulls.index:
+            self.nulls.setdefault(column, self.total)
+        for column in self.nulls:
+            self.nulls[column] += int(batch_nulls.get(column, len(df)))
+        self.total += len(df)
+
+        # Plage de Données
+        if 'date_heure_utc' in df.columns:
+            dates = pd.to_datetime(df['date_heure_utc'], errors='coerce')
+            low, high = dates.min(), dates.max()
+            if not pd.isna(low):
+                self.start_date = low if self.start_date is None else min(self.start_date, low)
+                self.end_date = high if self.end_date is None else max(self.end_date, high)
+        return batch
+
+    def report(self):
+        """Affiche le rapport d'intégrité unifiée ; renvoie False si aucun enregistrement n'a été vu."""
+        if self.total == 0:
+            return False
+        print("\n--- ✅ Rapport d'Intégrité Unifiée (Source Totale) ---")
+        print(f"-> Total des enregistrements : {self.total}")
+        print(f"-> Doublons trouvés (date/station) : {self.doublons}")
+
+        # Résumé des valeurs manquantes
+        print("\n-> Résumé des valeurs manquantes par colonne :")
+        print(pd.Series(self.nulls, dtype='int64'))
+
+        start_date = pd.NaT if self.start_date is None else self.start_date
+        end_date = pd.NaT if self.end_date is None else self.end_date
+        print(f"\n-> Période couverte : Du {start_date} au {end_date}")
+
+        if self.doublons > 0:
+            print("❌ AVERTISSEMENT: Des doublons ont été trouvés. MongoDB les insérera, sauf si vous ajoutez un index unique.")
+        print("-----------------------------------------------------")
+        return True
 
 def check_final_integrity(data_list):
     """Vérifie l'intégrité de la liste complète de documents unifiés avant l'insertion MongoDB."""
     if not data_list: return False
-        
-    df_final = pd.DataFrame(data_list)
-    print("\n--- ✅ Rapport d'Intégrité Unifiée (Source Totale) ---")
-    
-    # Doublons globaux (même horodatage ET même station)
-    duplicates = df_final.duplicated(subset=['date_heure_utc', 'id_station']).sum()
-    print(f"-> Total des enregistrements : {len(df_final)}")
-    print(f"-> Doublons trouvés (date/station) : {duplicates}")
-
-    # Résumé des valeurs manquantes
-    print("\n-> Résumé des valeurs manquantes par colonne :")
-    print(df_final.isnull().sum())
-    
-    # Plage de Données
-    df_final['date_heure_utc'] = pd.to_datetime(df_final['date_heure_utc'], errors='coerce')
-    start_date = df_final['date_heure_utc'].min()
-    end_date = df_final['date_heure_utc'].max()
-    print(f"\n-> Période couverte : Du {start_date} au {end_date}")
-
-    if duplicates > 0:
-        print("❌ AVERTISSEMENT: Des doublons ont été trouvés. MongoDB les insérera, sauf si vous ajoutez un index unique.")
-    print("-----------------------------------------------------")
-    return True
+    integrity = FinalIntegrityCheck()
+    integrity.update(data_list)
+    return integrity.report()
+
+class DailyRollup:
+    """Agrégats journaliers par station (jour UTC), cumulés lot par lot par groupby vectorisé pendant la transformation.
+
+    Chaque lot est réduit en agrégats partiels (min, max, sommes et effectifs) fusionnés avec ceux des lots
+    précédents : seules les stations-jours présentes dans les données de l'exécution sont calculées.
+    Un relevé dont la clé (station, instant) a déjà été vue n'est compté qu'une fois, comme dans la collection chargée.
+    Les agrégats en mémoire ne couvrent que les relevés de l'exécution : en chargement incrémental,
+    write_daily_rollup() recalcule les stations-jours touchées depuis la collection des relevés.
+    """
+
+    # Agrégats partiels : colonne -> fonction de fusion entre lots
+    PARTIALS = {
+        'source_donnees': 'first',
+        'nb_releves': 'sum',
+        'temperature_min_c': 'min',
+        'temperature_max_c': 'max',
+        'temperature_somme': 'sum',
+        'nb_temperature': 'sum',
+        'pluie_totale_mm': 'sum',
+        'vent_somme': 'sum',
+        'nb_vent': 'sum',
+    }
+
+    def __init__(self, key_fields=DAILY_ROLLUP_KEY_FIELDS):
+        self.key_fields = list(key_fields)
+        self.partials = None   # DataFrame indexé par (station, jour)
+        self._seen = SeenKeys()
+
+    def update(self, batch):
+        """Ajoute un lot (DataFrame ou liste de documents) aux agrégats ; renvoie le lot inchangé."""
+        df = batch if isinstance(batch, pd.DataFrame) else pd.DataFrame(batch)
+        if df.empty or 'date_heure_utc' not in df.columns:
+            return batch
+        duplicated = self._seen.add(key_hashes(df))
+        if duplicated.any():
+            df = df[~duplicated]
+
+        station_field, day_field = self.key_fields
+        dates = pd.to_datetime(df['date_heure_utc'], errors='coerce')
+        measures = pd.DataFrame({
+            station_field: df['id_station'].to_numpy(),
+            day_field: dates.dt.floor('D').to_numpy(),
+            'source_donnees': df['source_donnees'].to_numpy() if 'source_donnees' in df.columns else None,
+            'temperature': self._numeric(df, 'temperature_c'),
+            'pluie': self._numeric(df, 'pluie_accum_mm'),
+            'vent': self._numeric(df, 'vent_vitesse_ms'),
+        }).dropna(subset=[day_field])
+
+        grouped = measures.groupby(self.key_fields, sort=False)
+        partial = pd.DataFrame({
+            'source_donnees': grouped['source_donnees'].first(),
+            'nb_releves': grouped.size(),
+            'temperature_min_c': grouped['temperature'].min(),
+            'temperature_max_c': grouped['temperature'].max(),
+            'temperature_somme': grouped['temperature'].sum(),
+            'nb_temperature': grouped['temperature'].count(),
+            'pluie_totale_mm': grouped['pluie'].sum(),
+            'vent_somme': grouped['vent'].sum(),
+            'nb_vent': grouped['vent'].count(),
+        })
+        if self.partials is not None:
+            partial = pd.concat([self.partials, partial]).groupby(level=self.key_fields, sort=False).agg(self.PARTIALS)
+        self.partials = partial
+        return batch
+
+    @staticmethod
+    def _numeric(df, column):
+        if column not in df.columns:
+            return np.full(len(df), np.nan)
+        if df[column].dtype in ('float32', 'Float32'):
+            return widen_float32(df[column])  # Mêmes valeurs que les documents chargés
+        return pd.to_numeric(df[column], errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+
+    @property
+    def touched(self):
+        """Nombre de stations-jours vues par l'exécution."""
+        return 0 if self.partials is None else len(self.partials)
+
+    def days(self):
+        """Stations-jours vues par l'exécution (MultiIndex (station, jour))."""
+        if self.partials is None:
+            return pd.MultiIndex.from_tuples([], names=self.key_fields)
+        return self.partials.index
+
+    def result(self):
+        """Renvoie un DataFrame d'agrégats par station et jour (moyennes NaN si aucune mesure valide)."""
+        columns = self.key_fields + ['source_donnees', 'nb_releves', 'temperature_min_c', 'temperature_max_c',
+                                     'temperature_moy_c', 'pluie_totale_mm', 'vent_moy_ms', 'nb_temperature', 'nb_vent']
+        if self.partials is None:
+            return pd.DataFrame(columns=columns)
+        daily = self.partials.sort_index().reset_index()
+        daily['temperature_moy_c'] = daily['temperature_somme'] / daily['nb_temperature'].where(daily['nb_temperature'] > 0)
+        daily['vent_moy_ms'] = daily['vent_somme'] / daily['nb_vent'].where(daily['nb_vent'] > 0)
+        daily[['nb_releves', 'nb_temperature', 'nb_vent']] = daily[['nb_releves', 'nb_temperature', 'nb_vent']].astype('int64')
+        return daily[columns]
 
 
 # --- 2. FONCTIONS D'EXTRACTION ---
@@ -146,69 +689,1336 @@ def read_full_json_file(file_path):
         full_content = json.load(f)
     return full_content.get('hourly', {})
 
-def extract_and_process_csv_from_disk(file_paths_dict, station_id, source):
-    """Lit les fichiers CSV, les nettoie, les convertit et vérifie leur intégrité."""
-    all_records = []
-    
-    for date_str, file_name in file_paths_dict.items():
-        try:
-            # Correction: Encodage 'latin-1' ET délimiteur 'sep=;'
-            df_csv = pd.read_csv(file_name, header=0, skiprows=[2], encoding='latin-1', sep=';') 
-            
+def read_csv_chunks(file_name, date_str, chunksize=CSV_CHUNKSIZE):
+    """Lit un fichier CSV Weather Underground par blocs de `chunksize` lignes (générateur de DataFrames bruts)."""
+    # Correction: Encodage 'latin-1' ET délimiteur 'sep=;'
+    with pd.read_csv(file_name, header=0, skiprows=[2], encoding='latin-1', sep=';', chunksize=chunksize) as reader:
+        for df_csv in reader:
             # Nettoyage des noms de colonnes pour éviter les espaces
             df_csv.columns = [col.strip() for col in df_csv.columns]
-            
-            df_csv.name = date_str 
-            df_csv.insert(0, 'Date', date_str) 
-            
-            # Transformation (T)
-            df_clean = clean_and_convert_csv_df(df_csv, station_id=station_id, source=source)
-            
-            # Vérification initiale
-            check_initial_integrity(df_clean, station_id, date_str)
-            
-            records = df_clean.to_dict('records')
-            all_records.extend(records)
-            print(f"   -> Traité {source} ({date_str} - {file_name}): {len(records)} lignes.")
+
+            df_csv.name = date_str
+            df_csv.insert(0, 'Date', date_str)
+            yield df_csv
+
+def iter_csv_file_batches(file_name, date_str, station_id, source, chunksize=CSV_CHUNKSIZE, file_stats=None):
+    """Lit, nettoie et convertit un fichier CSV bloc par bloc ; les erreurs de lecture sont propagées.
+
+    `file_stats` (FileStats) reçoit les lignes lues et celles écartées faute d'heure.
+    """
+    integrity = StreamingIntegrityCheck()
+    for df_csv in read_csv_chunks(file_name, date_str, chunksize):
+        # Transformation (T)
+        df_clean = clean_and_convert_csv_df(df_csv, station_id=station_id, source=source)
+        integrity.update(df_clean)
+        if file_stats is not None:
+            file_stats.rows_in += len(df_csv)
+            file_stats.dropped_missing_time += len(df_csv) - len(df_clean)
+        yield df_clean
+
+    # Vérification initiale (sur l'ensemble des blocs du fichier)
+    integrity.report(station_id, date_str)
+    print(f"   -> Traité {source} ({date_str} - {file_name}): {integrity.lignes} lignes.")
+
+def iter_csv_batches(file_paths_dict, station_id, source, chunksize=CSV_CHUNKSIZE, cache=None):
+    """Lit, nettoie et convertit les fichiers CSV bloc par bloc ; produit un DataFrame nettoyé par bloc."""
+    for date_str, file_name in file_paths_dict.items():
+        task = SourceTask('csv', file_name, station_id=station_id, source=source, date_str=date_str)
+        try:
+            yield from iter_task_batches(task, chunksize, cache)
         except FileNotFoundError:
             print(f"   -> ❌ ERREUR: Fichier CSV non trouvé: {file_name}.")
         except Exception as e:
             print(f"   -> ❌ ERREUR lors du traitement de {file_name}: {e}")
-            
+
+def extract_and_process_csv_from_disk(file_paths_dict, station_id, source, chunksize=CSV_CHUNKSIZE, cache=None):
+    """Lit les fichiers CSV, les nettoie, les convertit et vérifie leur intégrité."""
+    all_records = []
+    for df_clean in iter_csv_batches(file_paths_dict, station_id, source, chunksize, cache):
+        all_records.extend(df_clean.to_dict('records'))
     return all_records
 
-# --- 3. FONCTIONS DE CHARGEMENT VERS MONGODB ---
+class _JsonStream:
+    """Lecteur JSON incrémental : décode une valeur à la fois depuis un tampon rempli par blocs."""
 
-def load_data_to_mongodb(data_list):
-    """Connecte à MongoDB, insère la liste complète des documents, et vérifie la collection cible."""
-        
+    _decoder = json.JSONDecoder()
+    _whitespace = re.compile(r'[ \t\n\r]*')
+
+    def __init__(self, f, read_size=JSON_READ_SIZE):
+        self.f = f
+        self.read_size = read_size
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        chunk = self.f.read(self.read_size)
+        if not chunk:
+            self.eof = True
+        # Le tampon ne conserve que la partie non consommée
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+
+    def peek(self):
+        """Renvoie le prochain caractère significatif (sans le consommer), '' en fin de fichier."""
+        while True:
+            self.pos = self._whitespace.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer) or self.eof:
+                return self.buffer[self.pos:self.pos + 1]
+            self._fill()
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"JSON invalide : '{char}' attendu, '{found}' trouvé")
+        self.pos += 1
+
+    def value(self):
+        """Décode la valeur JSON suivante (objet, tableau, chaîne, nombre...)."""
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+                self._fill()
+                continue
+            # Un nombre en fin de tampon peut être tronqué : on relit avant de conclure
+            if end >= len(self.buffer) and not self.eof:
+                self._fill()
+                continue
+            self.pos = end
+            return value
+
+    def members(self):
+        """Itère sur les clés d'un objet (dont '{' a déjà été consommé) ; la valeur reste à lire."""
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            yield key
+            if self.peek() == ',':
+                self.pos += 1
+            else:
+                self.expect('}')
+                return
+
+    def items(self):
+        """Itère sur les éléments d'un tableau (dont '[' a déjà été consommé)."""
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.peek() == ',':
+                self.pos += 1
+            else:
+                self.expect(']')
+                return
+
+def iter_json_hourly_records(file_path, read_size=JSON_READ_SIZE):
+    """Parcourt le JSON Infoclimat en streaming et produit les enregistrements horaires (dict) de chaque station.
+
+    Seul l'enregistrement en cours est matérialisé : la mémoire ne dépend pas de la taille du fichier.
+    """
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"❌ ERREUR CRITIQUE: Fichier JSON non trouvé: {file_path}. Vérifiez le nom.")
+
+    with open(file_path, 'r', encoding='utf-8') as f:
+        stream = _JsonStream(f, read_size)
+        stream.expect('{')
+        for key in stream.members():
+            if key != 'hourly':
+                stream.value()  # Métadonnées (status, stations...) : lues puis ignorées
+                continue
+            stream.expect('{')
+            for station_id in stream.members():
+                if stream.peek() != '[':
+                    stream.value()
+                    print(f"   -> ⚠️ AVERTISSEMENT JSON: Données inattendues pour la station {station_id}. Ignoré.")
+                    continue
+                stream.expect('[')
+                for record in stream.items():
+                    if isinstance(record, dict):
+                        yield record
+
+def iter_json_batches(file_path, batch_size=CSV_CHUNKSIZE, file_stats=None):
+    """Lit le fichier JSON Infoclimat en streaming et produit ses enregistrements convertis par lots (DataFrames)."""
+    total = 0
+    batch = []
+    for record in iter_json_hourly_records(file_path):
+        batch.append(record)
+        if len(batch) >= batch_size:
+            total += len(batch)
+            if file_stats is not None:
+                file_stats.rows_in += len(batch)
+            yield convert_json_records(batch)
+            batch = []
+    if batch:
+        total += len(batch)
+        if file_stats is not None:
+            file_stats.rows_in += len(batch)
+        yield convert_json_records(batch)
+    print(f"   -> Traité Infoclimat (lecture en streaming): {total} lignes.")
+
+SOURCE_PHASE_TITLES = {
+    'csv': "PHASE 1: Traitement des fichiers CSV (Weather Underground)",
+    'json': "PHASE 2: Traitement du fichier JSON (Infoclimat, lecture en streaming)",
+}
+
+def iter_all_source_batches(chunksize=CSV_CHUNKSIZE, cache=None, tasks=None, metrics=None):
+    """Enchaîne les lots de toutes les sources (par défaut : CSV puis JSON) ; un fichier en erreur est signalé puis ignoré.
+
+    Avec `metrics` (RunMetrics), l'extraction de chaque type de source est chronométrée et les compteurs
+    de chaque fichier sont enregistrés.
+    """
+    if tasks is None:
+        tasks = build_source_tasks()
     try:
-        # 1. Connexion
-        client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
-        client.admin.command('ping') 
-        print(f"✅ Connexion MongoDB réussie à l'URI : {MONGO_URI}")
-        
-        # 2. Insertion
-        db = client[MONGO_DATABASE]
-        collection = db[MONGO_COLLECTION]
-        
-        collection.delete_many({}) # Purgement de la collection avant l'insertion
-        print(f"   -> Collection '{MONGO_COLLECTION}' purgée. Insertion de {len(data_list)} documents...")
-        
-        result = collection.insert_many(data_list)
-        
-        # 3. VÉRIFICATION FINALE DANS MONGODB (Compte)
-        target_count = collection.count_documents({})
+        yield from _iter_tasks_batches(tasks, chunksize, cache, metrics)
+    finally:
+        if cache is not None:
+            cache.flush()
+
+def _iter_tasks_batches(tasks, chunksize, cache, metrics):
+    kind = None
+    for task in tasks:
+        if task.kind != kind:
+            kind = task.kind
+            print(f"\n--- ⏳ {SOURCE_PHASE_TITLES.get(kind, kind)} ---")
+        file_stats = FileStats(task.path, task.kind)
+        batches = iter_task_batches(task, chunksize, cache, file_stats)
+        if metrics is not None:
+            metrics.add_file(file_stats)
+            batches = metrics.iter_stage(f"Extraction {task.kind.upper()}", batches)
+        try:
+            yield from batches
+        except FileNotFoundError as e:
+            file_stats.error = f"{type(e).__name__}: {e}"
+            if task.kind == 'csv':
+                print(f"   -> ❌ ERREUR: Fichier CSV non trouvé: {task.path}.")
+        except Exception as e:
+            file_stats.error = f"{type(e).__name__}: {e}"
+            if task.kind == 'csv':
+                print(f"   -> ❌ ERREUR lors du traitement de {task.path}: {e}")
+            else:
+                print(f"   -> ❌ ERREUR critique lors du traitement du fichier JSON: {e}")
+
+# --- 2 bis. EXTRACTION PARALLÈLE (UN FICHIER SOURCE PAR TÂCHE) ---
+
+@dataclass(frozen=True)
+class SourceTask:
+    """Fichier source à extraire et transformer de façon indépendante (CSV d'une station-jour ou JSON Infoclimat)."""
+    kind: str                 # 'csv' ou 'json'
+    path: str
+    station_id: str = None
+    source: str = None
+    date_str: str = None
+
+@dataclass
+class TaskResult:
+    """Résultat d'une tâche d'extraction exécutée par un worker."""
+    task: SourceTask
+    batches: list
+    rows: int
+    elapsed: float
+    worker: str
+    log: str = ""
+    error: str = None
+    file_stats: FileStats = None
+
+def build_source_tasks(registry=None, largest_first=False):
+    """Construit la liste ordonnée des tâches : fichiers découverts par `registry`, sinon fichiers configurés.
+
+    Avec `largest_first`, les plus gros fichiers sont planifiés en premier pour équilibrer les workers.
+    """
+    if registry is not None:
+        return registry.tasks(largest_first=largest_first)
+    tasks = []
+    for file_paths_dict, station_id in ((csv_files_la_madeleine, "1001"), (csv_files_ichtegem, "1002")):
+        for date_str, file_name in file_paths_dict.items():
+            tasks.append(SourceTask('csv', file_name, station_id=station_id, source="Weather Underground", date_str=date_str))
+    tasks.append(SourceTask('json', JSON_FILE_PATH, source="Infoclimat"))
+    if largest_first:
+        tasks.sort(key=lambda task: -_file_size(task.path))
+    return tasks
+
+def chronological_tasks(tasks):
+    """Tâches triées par type, station puis date (ordre des relevés de chaque station, requis par AnomalyDetector.update)."""
+    return sorted(tasks, key=lambda task: (task.kind, task.station_id or '', task.date_str or '', task.path))
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return -1  # Fichier absent : planifié en dernier, l'erreur sera signalée par sa tâche
+
+def process_source_task(task, chunksize=CSV_CHUNKSIZE, cache=None, key=None):
+    """Exécute l'extraction + transformation d'une tâche (dans un worker) ; les messages sont capturés et renvoyés."""
+    start = time.perf_counter()
+    worker = f"pid {os.getpid()} / {threading.current_thread().name}"
+    log = io.StringIO()
+    batches = []
+    error = None
+    file_stats = FileStats(task.path, task.kind)
+    try:
+        with redirect_stdout(log):
+            batches = list(iter_task_batches(task, chunksize, cache, file_stats, key))
+    except Exception as e:
+        error = file_stats.error = f"{type(e).__name__}: {e}"
+        batches = []
+    rows = sum(len(batch) for batch in batches)
+    return TaskResult(task, batches, rows, time.perf_counter() - start, worker, log.getvalue(), error, file_stats)
+
+def run_parallel_extraction(tasks, workers=ETL_WORKERS, executor='process', chunksize=CSV_CHUNKSIZE, cache=None):
+    """Répartit les tâches sur un pool de workers et renvoie les résultats dans l'ordre des tâches (déterministe)."""
+    pool_class = ProcessPoolExecutor if executor == 'process' else ThreadPoolExecutor
+    results = []
+    # Les clés de cache sont calculées ici : l'index des empreintes n'est lu et écrit que par le parent
+    keys = [cache.task_key(task) if cache is not None else None for task in tasks]
+    with pool_class(max_workers=workers) as pool:
+        futures = [pool.submit(process_source_task, task, chunksize, cache, key) for task, key in zip(tasks, keys)]
+        # Fusion dans l'ordre de soumission, indépendamment de l'ordre de fin des workers
+        for task, future in zip(tasks, futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                # Un worker tombé (ex: processus tué) n'interrompt pas les autres tâches
+                result = TaskResult(task, [], 0, 0.0, "?", error=f"{type(e).__name__}: {e}")
+            results.append(result)
+            print(result.log, end="")
+            if result.error:
+                print(f"   -> ❌ ERREUR lors du traitement de {task.path}: {result.error}")
+    if cache is not None:
+        cache.flush()
+    return results
+
+def print_run_summary(stage_timings, results=()):
+    """Affiche le temps d'horloge de chaque étape et la charge de chaque worker."""
+    print("\n--- ⏱️ Résumé d'exécution ---")
+    for stage, elapsed in stage_timings.items():
+        print(f"-> {stage:<25} : {elapsed:8.3f}s")
+
+    per_worker = defaultdict(lambda: {'tasks': 0, 'rows': 0, 'busy': 0.0})
+    for result in results:
+        stats = per_worker[result.worker]
+        stats['tasks'] += 1
+        stats['rows'] += result.rows
+        stats['busy'] += result.elapsed
+    if per_worker:
+        print("\n-> Charge par worker :")
+        for worker, stats in sorted(per_worker.items()):
+            print(f"   {worker} : {stats['tasks']} tâches, {stats['rows']} lignes, {stats['busy']:.3f}s actif")
+    failed = [r for r in results if r.error]
+    if failed:
+        print(f"\n❌ {len(failed)} tâche(s) en échec : " + ", ".join(r.task.path for r in failed))
+    print("-----------------------------")
+
+
+# --- 2 ter. CACHE DES FICHIERS TRANSFORMÉS (CLÉ = EMPREINTE DU CONTENU) ---
+
+def conversion_rules_fingerprint():
+    """Empreinte des règles de conversion : toute modification invalide les entrées de cache existantes."""
+    rules = json.dumps([CONVERSION_RULES_VERSION, CSV_UNIT_CONVERSIONS, UNIT_STRIP_REPLACEMENTS, TIMESTAMP_FORMATS,
+                        SOURCE_TIMEZONES, STATION_TIMEZONES, DEFAULT_TIMEZONE], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(rules.encode('utf-8')).hexdigest()
+
+class TransformCache:
+    """Cache local des DataFrames normalisés, un fichier par source (Feather si pyarrow est installé, sinon pickle).
+
+    La clé combine l'empreinte SHA-256 du fichier source, les paramètres de la tâche et l'empreinte
+    des règles de conversion. Les entrées les moins récemment utilisées sont évincées au-delà de `max_bytes`.
+    L'index des empreintes est chargé une fois puis tenu en mémoire ; flush() l'enregistre et applique l'éviction,
+    une fois par exécution (fin de l'extraction). Les workers reçoivent la clé de leur tâche, calculée par le parent.
+    Avec `cache_only`, un fichier absent du cache est une erreur au lieu d'être retraité (chargement depuis le cache).
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=CACHE_MAX_BYTES, cache_only=False):
+        self.cache_dir = cache_dir or CACHE_DIR
+        self.max_bytes = max_bytes
+        self.cache_only = cache_only
+        self.extension = '.feather' if _feather_available() else '.pkl'
+        self._index = None          # Index des empreintes, chargé au premier besoin
+        self._index_changes = {}    # Entrées ajoutées depuis le dernier flush()
+
+    def __getstate__(self):
+        # L'index n'est pas copié vers les workers (clés calculées par le parent)
+        state = self.__dict__.copy()
+        state['_index'], state['_index_changes'] = None, {}
+        return state
+
+    # Empreintes des fichiers sources, mémorisées par (taille, mtime) pour éviter de les relire
+    def _digest_index_path(self):
+        return os.path.join(self.cache_dir, 'empreintes.json')
+
+    def _load_digest_index(self):
+        try:
+            with open(self._digest_index_path(), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _save_digest_index(self, index):
+        tmp_path = f"{self._digest_index_path()}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self._digest_index_path())
+
+    def file_digest(self, path):
+        """Empreinte SHA-256 du contenu d'un fichier (recalculée seulement si sa taille ou son mtime change)."""
+        stat = os.stat(path)
+        signature = [stat.st_size, stat.st_mtime_ns]
+        if self._index is None:
+            self._index = self._load_digest_index()
+        entry = self._index.get(os.path.abspath(path))
+        if entry and entry['signature'] == signature:
+            return entry['sha256']
+
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                sha.update(block)
+        entry = {'signature': signature, 'sha256': sha.hexdigest()}
+        self._index[os.path.abspath(path)] = self._index_changes[os.path.abspath(path)] = entry
+        return entry['sha256']
+
+    def task_key(self, task):
+        """key_for() ; None si le fichier est illisible (l'erreur sera signalée par la tâche elle-même)."""
+        try:
+            return self.key_for(task)
+        except OSError:
+            return None
+
+    def flush(self):
+        """Enregistre les nouvelles empreintes (fusionnées à l'index sur disque, écriture atomique) puis applique l'éviction."""
+        if self._index_changes:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            index = self._load_digest_index()
+            index.update(self._index_changes)
+            self._save_digest_index(index)
+            self._index, self._index_changes = index, {}
+        return self.evict()
+
+    def key_for(self, task):
+        """Clé de cache d'une tâche : contenu du fichier + paramètres de la tâche + règles de conversion."""
+        parts = [self.file_digest(task.path), task.kind, task.station_id, task.source, task.date_str, conversion_rules_fingerprint()]
+        return hashlib.sha256(json.dumps(parts).encode('utf-8')).hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key + self.extension)
+
+    def get(self, key):
+        """Renvoie le DataFrame en cache pour `key`, ou None."""
+        path = self._entry_path(key)
+        try:
+            df = pd.read_feather(path) if self.extension == '.feather' else pd.read_pickle(path)
+        except (FileNotFoundError, OSError, ValueError):
+            return None
+        os.utime(path)  # Marque l'entrée comme récemment utilisée (éviction LRU)
+        return df
+
+    def put(self, key, df):
+        """Enregistre un DataFrame (écriture atomique) ; l'éviction par taille est appliquée par flush()."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._entry_path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        df = df.reset_index(drop=True)
+        if self.extension == '.feather':
+            df.to_feather(tmp_path)
+        else:
+            df.to_pickle(tmp_path)
+        os.replace(tmp_path, path)
+
+    def _entries(self):
+        if not os.path.isdir(self.cache_dir):
+            return []
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(('.feather', '.pkl')):
+                try:
+                    stat = os.stat(os.path.join(self.cache_dir, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+        return sorted(entries)
+
+    def size(self):
+        """Taille totale (octets) des entrées du cache."""
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self):
+        """Supprime les entrées les moins récemment utilisées jusqu'à repasser sous `max_bytes`."""
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, name in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                pass  # Déjà évincée par un autre worker
+            total -= size
+            removed += 1
+        return removed
+
+    def invalidate(self):
+        """Vide entièrement le cache ; renvoie le nombre d'entrées supprimées."""
+        entries = self._entries()
+        for _, _, name in entries:
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                pass
+        if os.path.exists(self._digest_index_path()):
+            os.remove(self._digest_index_path())
+        self._index, self._index_changes = None, {}
+        return len(entries)
+
+def _feather_available():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+def iter_task_batches(task, chunksize=CSV_CHUNKSIZE, cache=None, file_stats=None, key=None):
+    """Produit les lots transformés (horodatages en UTC) d'une tâche, depuis le cache si le fichier source n'a pas changé.
+
+    En cas d'absence du cache, les lots sont produits au fil de l'eau puis enregistrés une fois le fichier
+    entièrement traité (un fichier en erreur n'est jamais mis en cache). Les erreurs sont propagées.
+    `file_stats` (FileStats) reçoit les compteurs de lignes du fichier ; `key` est la clé de cache déjà calculée (workers).
+    """
+    if file_stats is None:
+        file_stats = FileStats(task.path, task.kind)
+    start = time.perf_counter()
+    if key is None and cache is not None:
+        key = cache.key_for(task)
+    if key is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            print(f"   -> ♻️ CACHE: {task.path} inchangé, {len(cached)} lignes relues sans retraitement.")
+            file_stats.from_cache = True
+            file_stats.rows_in = file_stats.rows_out = len(cached)
+            file_stats.elapsed += time.perf_counter() - start
+            yield cached
+            return
+        if cache.cache_only:
+            raise LookupError(f"{task.path} absent du cache (lancez d'abord l'étape d'extraction)")
+
+    if task.kind == 'csv':
+        batches = iter_csv_file_batches(task.path, task.date_str, task.station_id, task.source, chunksize, file_stats)
+    elif task.kind == 'json':
+        batches = iter_json_batches(task.path, batch_size=chunksize, file_stats=file_stats)
+    else:
+        raise ValueError(f"Type de tâche inconnu : {task.kind}")
+
+    produced = []
+    seen_ambiguous = set()   # Heures locales répétées (passage à l'heure d'hiver) déjà lues dans le fichier
+    for batch in batches:
+        # Normalisation des horodatages (datetime UTC), avant mise en cache
+        rows = len(batch)
+        batch = compact_records(normalize_timestamps(batch, task.source, task.station_id, seen_ambiguous))
+        file_stats.dropped_bad_timestamp += rows - len(batch)
+        file_stats.rows_out += len(batch)
+        if key is not None:
+            produced.append(batch)
+        file_stats.elapsed += time.perf_counter() - start
+        yield batch
+        start = time.perf_counter()
+    file_stats.elapsed += time.perf_counter() - start
+    if key is not None and produced:
+        # Les catégories diffèrent d'un lot à l'autre (stations du JSON) : la concaténation est recompactée
+        cache.put(key, compact_records(pd.concat(produced, ignore_index=True)))
 
-        print("\n--- ✅ Rapport d'Intégrité Cible (MongoDB - Compte) ---")
-        if target_count == len(data_list):
-             print(f"-> ✅ SUCCÈS: Nombre d'enregistrements (Source: {len(data_list)}, Cible: {target_count}) correspond.")
+
+# --- 2 quater. REGISTRE DES FICHIERS SOURCES (DÉCOUVERTE PAR RÉPERTOIRE) ---
+
+@dataclass
+class RegistryScan:
+    """Différences constatées par SourceRegistry.scan() par rapport à l'index précédent."""
+    added: list
+    modified: list
+    removed: list
+    unchanged: int = 0
+
+class SourceRegistry:
+    """Découvre les fichiers sources d'un répertoire de données (motifs glob) et en tient un index persistant.
+
+    La station et la date des exports Weather Underground sont lues dans le nom du fichier
+    (`... - 071024.csv`). L'index conserve la taille et le mtime de chaque fichier : un nouveau scan
+    ne fait qu'un `stat` par fichier et ne réanalyse que les fichiers nouveaux.
+    """
+
+    def __init__(self, data_dir=DATA_DIR, csv_pattern=WU_CSV_PATTERN, json_pattern=INFOCLIMAT_JSON_PATTERN,
+                 station_ids=WU_STATION_IDS, index_path=None):
+        self.data_dir = data_dir
+        self.patterns = {'csv': csv_pattern, 'json': json_pattern}
+        self.station_ids = station_ids
+        self.index_path = index_path or os.path.join(CACHE_DIR, SOURCE_INDEX_FILE)
+        self.files = {}     # chemin relatif -> {'kind', 'station_id', 'source', 'date_str', 'size', 'mtime_ns'}
+        self.ignored = []   # fichiers correspondant aux motifs mais dont le nom n'a pas pu être interprété
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+        # Un index construit pour un autre répertoire n'est pas réutilisé
+        return index.get('files', {}) if index.get('data_dir') == os.path.abspath(self.data_dir) else {}
+
+    def _save_index(self):
+        os.makedirs(os.path.dirname(self.index_path) or '.', exist_ok=True)
+        tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'data_dir': os.path.abspath(self.data_dir), 'files': self.files}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.index_path)
+
+    def parse_filename(self, kind, name):
+        """Déduit (station_id, source, date_str) du nom d'un fichier ; None si le nom n'est pas reconnu."""
+        if kind == 'json':
+            return None, "Infoclimat", None
+        match = WU_FILENAME_REGEX.match(os.path.basename(name))
+        if match is None:
+            return None
+        try:
+            date_str = datetime.strptime(match.group('ddmmyy'), '%d%m%y').strftime('%Y-%m-%d')
+        except ValueError:
+            return None
+        label = match.group('station')
+        station_id = self.station_ids.get(label, label.replace('+', ' '))
+        return station_id, "Weather Underground", date_str
+
+    def scan(self):
+        """Parcourt le répertoire, met à jour l'index et renvoie un RegistryScan (nouveaux, modifiés, supprimés)."""
+        previous = self._load_index() or self.files
+        files, self.ignored = {}, []
+        added, modified = [], []
+        for kind, pattern in self.patterns.items():
+            for name in sorted(glob.glob(pattern, root_dir=self.data_dir, recursive=True)):
+                try:
+                    stat = os.stat(os.path.join(self.data_dir, name))
+                except FileNotFoundError:
+                    continue  # Supprimé pendant le scan
+                old = previous.get(name)
+                if old is not None and old['kind'] == kind:
+                    entry = dict(old, size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+                    if (old['size'], old['mtime_ns']) != (stat.st_size, stat.st_mtime_ns):
+                        modified.append(name)
+                else:
+                    parsed = self.parse_filename(kind, name)
+                    if parsed is None:
+                        self.ignored.append(name)
+                        continue
+                    station_id, source, date_str = parsed
+                    entry = {'kind': kind, 'station_id': station_id, 'source': source, 'date_str': date_str,
+                             'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+                    added.append(name)
+                files[name] = entry
+        removed = sorted(set(previous) - set(files))
+        self.files = files
+        self._save_index()
+        return RegistryScan(added, modified, removed, len(files) - len(added) - len(modified))
+
+    def tasks(self, largest_first=False):
+        """Tâches des fichiers indexés : CSV par station et date puis JSON, ou les plus gros fichiers d'abord."""
+        def task_for(name):
+            entry = self.files[name]
+            return SourceTask(entry['kind'], os.path.normpath(os.path.join(self.data_dir, name)), station_id=entry['station_id'],
+                              source=entry['source'], date_str=entry['date_str'])
+
+        if largest_first:
+            names = sorted(self.files, key=lambda name: (-self.files[name]['size'], name))
         else:
-             print(f"-> ❌ ÉCHEC: La source ({len(data_list)}) ne correspond pas à la cible ({target_count}).")
+            kind_order = list(self.patterns)
+            names = sorted(self.files, key=lambda name: (kind_order.index(self.files[name]['kind']),
+                                                         self.files[name]['station_id'] or '', self.files[name]['date_str'] or '', name))
+        return [task_for(name) for name in names]
+
+    def print_summary(self, scan):
+        """Affiche le résultat d'un scan."""
+        total_mb = sum(entry['size'] for entry in self.files.values()) / 1e6
+        print(f"--- 🔎 REGISTRE DES SOURCES ({self.data_dir}) : {len(self.files)} fichiers, {total_mb:.1f} Mo ---")
+        print(f"-> Nouveaux : {len(scan.added)} | Modifiés : {len(scan.modified)} | Supprimés : {len(scan.removed)} | Inchangés : {scan.unchanged}")
+        for name in self.ignored:
+            print(f"   -> ⚠️ AVERTISSEMENT: Nom de fichier non reconnu, ignoré : {name}")
 
-        print("-------------------------------------------------------")
+
+# --- 3. FONCTIONS DE CHARGEMENT VERS MONGODB ---
+
+_shared_client = None   # Client poolé ouvert par shared_mongo_client(), réutilisé par toutes les étapes MongoDB
+
+@contextmanager
+def shared_mongo_client(uri=None, max_pool_size=MONGO_MAX_POOL_SIZE):
+    """Ouvre (et vérifie par un ping) un client poolé partagé par le chargement, les agrégats et l'audit,
+    fermé à la sortie du bloc. Les fonctions appelées dans le bloc n'ouvrent pas de connexion supplémentaire.
+    """
+    global _shared_client
+    client = MongoClient(uri or MONGO_URI, serverSelectionTimeoutMS=5000, maxPoolSize=max_pool_size)
+    previous = _shared_client
+    try:
+        client.admin.command('ping')
+        _shared_client = client
+        yield client
+    finally:
+        _shared_client = previous
         client.close()
+
+@contextmanager
+def mongo_client():
+    """Client d'une opération : le client partagé s'il est ouvert (laissé ouvert), sinon un client dédié vérifié puis fermé."""
+    if _shared_client is not None:
+        yield _shared_client
+        return
+    client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
+    try:
+        client.admin.command('ping')
+        yield client
+    finally:
+        client.close()
+
+def async_mongo_client(uri=None, max_pool_size=MONGO_MAX_POOL_SIZE):
+    """Client PyMongo asynchrone poolé (à créer dans la boucle asyncio qui l'utilise)."""
+    if AsyncMongoClient is None:
+        raise RuntimeError("Le mode asyncio nécessite PyMongo >= 4.9 (AsyncMongoClient).")
+    return AsyncMongoClient(uri or MONGO_URI, serverSelectionTimeoutMS=5000, maxPoolSize=max_pool_size)
+
+def batch_to_documents(batch):
+    """Convertit un lot (DataFrame nettoyé ou liste de dictionnaires) en documents MongoDB."""
+    if isinstance(batch, pd.DataFrame):
+        return frame_to_documents(batch)
+    return list(batch)
+
+def iter_document_batches(data, batch_size=LOAD_BATCH_SIZE):
+    """Redécoupe un flux (documents, listes de documents ou DataFrames) en lots de taille fixe.
+
+    Les DataFrames sont convertis en documents tranche par tranche : seul le lot en cours existe sous forme de dictionnaires.
+    """
+    buffer = []
+    for item in data:
+        if isinstance(item, dict):
+            buffer.append(item)
+        elif isinstance(item, pd.DataFrame):
+            for start in range(0, len(item), batch_size):
+                buffer.extend(frame_to_documents(item.iloc[start:start + batch_size]))
+                while len(buffer) >= batch_size:
+                    yield buffer[:batch_size]
+                    buffer = buffer[batch_size:]
+        else:
+            buffer.extend(batch_to_documents(item))
+        while len(buffer) >= batch_size:
+            yield buffer[:batch_size]
+            buffer = buffer[batch_size:]
+    if buffer:
+        yield buffer
+
+@dataclass
+class LoadStats:
+    """Statistiques d'un chargement : volumes, débit et latence par lot."""
+    documents: int = 0
+    written: int = 0
+    batches: int = 0
+    failed_batches: int = 0
+    elapsed: float = 0.0
+    latencies: list = None
+
+    @property
+    def docs_per_second(self):
+        return self.documents / self.elapsed if self.elapsed else 0.0
+
+    def latency_percentiles(self, percentiles=(50, 95, 99)):
+        """Latence par lot (ms) aux percentiles demandés."""
+        if not self.latencies:
+            return {p: 0.0 for p in percentiles}
+        return {p: float(np.percentile(self.latencies, p)) * 1000 for p in percentiles}
+
+    def print_report(self):
+        p = self.latency_percentiles()
+        print(f"   -> Débit : {self.docs_per_second:,.0f} docs/s ({self.documents} documents, {self.batches} lots, {self.elapsed:.2f}s)")
+        print(f"   -> Latence par lot : p50 {p[50]:.1f} ms, p95 {p[95]:.1f} ms, p99 {p[99]:.1f} ms")
+        if self.failed_batches:
+            print(f"   -> ❌ {self.failed_batches} lot(s) en échec")
+
+class PipelinedWriter:
+    """Écrit des lots de documents depuis un thread d'arrière-plan alimenté par une file bornée.
+
+    La préparation des lots (conversion, empreintes) se fait dans le thread appelant pendant
+    que le thread d'écriture attend les allers-retours réseau de MongoDB.
+    """
+
+    _STOP = object()
+
+    def __init__(self, write_batch, queue_size=LOAD_QUEUE_SIZE):
+        # write_batch(lot) écrit un lot et renvoie le nombre de documents effectivement écrits
+        self.write_batch = write_batch
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.stats = LoadStats(latencies=[])
+        self.errors = []
+
+    def _run(self):
+        while True:
+            batch = self.queue.get()
+            if batch is self._STOP:
+                return
+            start = time.perf_counter()
+            try:
+                self.stats.written += self.write_batch(batch)
+            except Exception as e:
+                # Un lot en échec n'interrompt pas les suivants
+                self.stats.failed_batches += 1
+                self.errors.append(e)
+            self.stats.latencies.append(time.perf_counter() - start)
+
+    def write_all(self, document_batches):
+        """Envoie tous les lots au thread d'écriture et attend la fin ; renvoie les LoadStats."""
+        start = time.perf_counter()
+        writer = threading.Thread(target=self._run, name="mongo-writer", daemon=True)
+        writer.start()
+        try:
+            for batch in document_batches:
+                self.queue.put(batch)  # Bloque si le thread d'écriture a trop de retard (mémoire bornée)
+                self.stats.documents += len(batch)
+                self.stats.batches += 1
+        finally:
+            self.queue.put(self._STOP)
+            writer.join()
+            self.stats.elapsed = time.perf_counter() - start
+
+        connection_errors = [e for e in self.errors if isinstance(e, ConnectionFailure)]
+        if connection_errors:
+            raise connection_errors[0]
+        for e in self.errors[:3]:
+            print(f"   -> ❌ ERREUR d'écriture d'un lot : {e}")
+        return self.stats
+
+async def write_batches_async(write_batch, document_batches, concurrency=ASYNC_LOAD_CONCURRENCY):
+    """Écrit les lots avec la coroutine `write_batch`, au plus `concurrency` lots en vol sur le pool ; renvoie les LoadStats.
+
+    Les lots sont préparés dans un thread pendant que la boucle attend les réponses de MongoDB.
+    Même gestion des erreurs que PipelinedWriter : un lot en échec n'interrompt pas les suivants.
+    """
+    stats = LoadStats(latencies=[])
+    errors = []
+    slots = asyncio.Semaphore(concurrency)
+    pending = set()
+    start = time.perf_counter()
+
+    async def write(batch):
+        batch_start = time.perf_counter()
+        try:
+            stats.written += await write_batch(batch)
+        except Exception as e:
+            stats.failed_batches += 1
+            errors.append(e)
+        finally:
+            stats.latencies.append(time.perf_counter() - batch_start)
+            slots.release()
+
+    batches = iter(document_batches)
+    try:
+        while True:
+            batch = await asyncio.to_thread(next, batches, None)
+            if batch is None:
+                break
+            await slots.acquire()  # Attend qu'un lot en vol se termine (mémoire bornée)
+            stats.documents += len(batch)
+            stats.batches += 1
+            task = asyncio.create_task(write(batch))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+    finally:
+        if pending:
+            await asyncio.gather(*pending)
+        stats.elapsed = time.perf_counter() - start
+
+    connection_errors = [e for e in errors if isinstance(e, ConnectionFailure)]
+    if connection_errors:
+        raise connection_errors[0]
+    for e in errors[:3]:
+        print(f"   -> ❌ ERREUR d'écriture d'un lot : {e}")
+    return stats
+
+def with_write_concern(collection, write_concern=None):
+    """Applique un write concern optionnel (ex: RELAXED_WRITE_CONCERN) à la collection."""
+    if write_concern is None:
+        return collection
+    return collection.with_options(write_concern=WriteConcern(**write_concern))
+
+def insert_documents(collection, data, batch_size=LOAD_BATCH_SIZE, queue_size=LOAD_QUEUE_SIZE, write_concern=None):
+    """Insère un flux de documents par lots non ordonnés de taille fixe, via le thread d'écriture."""
+    target = with_write_concern(collection, write_concern)
+
+    def write_batch(documents):
+        try:
+            result = target.insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            # Insertion non ordonnée : les documents valides du lot sont conservés
+            print(f"   -> ❌ ERREUR partielle d'insertion : {len(e.details.get('writeErrors', []))} document(s) rejeté(s)")
+            return e.details.get('nInserted', 0)
+        return len(result.inserted_ids) if result.acknowledged else len(documents)
+
+    return PipelinedWriter(write_batch, queue_size).write_all(iter_document_batches(data, batch_size))
+
+async def insert_documents_async(collection, data, batch_size=LOAD_BATCH_SIZE, concurrency=ASYNC_LOAD_CONCURRENCY, write_concern=None):
+    """Variante asynchrone d'insert_documents (collection PyMongo asynchrone) : plusieurs insert_many en vol."""
+    target = with_write_concern(collection, write_concern)
+
+    async def write_batch(documents):
+        try:
+            result = await target.insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            print(f"   -> ❌ ERREUR partielle d'insertion : {len(e.details.get('writeErrors', []))} document(s) rejeté(s)")
+            return e.details.get('nInserted', 0)
+        return len(result.inserted_ids) if result.acknowledged else len(documents)
+
+    return await write_batches_async(write_batch, iter_document_batches(data, batch_size), concurrency)
+
+def document_content_hash(document):
+    """Calcule l'empreinte SHA-1 du contenu d'un document (hors _id et hors empreinte elle-même)."""
+    content = {k: v for k, v in document.items() if k not in ('_id', CONTENT_HASH_FIELD)}
+    return hashlib.sha1(json.dumps(content, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+def ensure_unique_key_index(collection):
+    """Crée (si besoin) l'index unique composé (id_station, date_heure_utc) utilisé par les upserts."""
+    return collection.create_index([(field, ASCENDING) for field in DOCUMENT_KEY_FIELDS], unique=True, name="cle_station_date")
+
+def ensure_time_range_index(collection):
+    """Garantit un index (id_station, date_heure_utc) pour les requêtes par station et plage de dates.
+
+    L'index unique du mode incrémental convient s'il existe ; sinon un index non unique est créé
+    (un chargement complet peut contenir des doublons signalés par le contrôle d'intégrité).
+    """
+    keys = [(field, ASCENDING) for field in DOCUMENT_KEY_FIELDS]
+    for name, info in collection.index_information().items():
+        if [(field, int(direction)) for field, direction in info['key']] == keys:
+            return name
+    return collection.create_index(keys, name="station_date_heure")
+
+def _prepare_upsert_batch(documents, key_fields=DOCUMENT_KEY_FIELDS):
+    """Ajoute l'empreinte de contenu et dédoublonne le lot par clé (la dernière version l'emporte)."""
+    pending = {}
+    for document in documents:
+        document.pop('_id', None)
+        document[CONTENT_HASH_FIELD] = document_content_hash(document)
+        # Une même clé ne doit apparaître qu'une fois par bulk_write non ordonné
+        pending[tuple(document.get(field) for field in key_fields)] = document
+    return pending
+
+def upsert_documents(collection, data, batch_size=LOAD_BATCH_SIZE, queue_size=LOAD_QUEUE_SIZE, write_concern=None,
+                     key_fields=DOCUMENT_KEY_FIELDS):
+    """Charge un flux en mode incrémental : bulk_write non ordonnés d'UpdateOne(upsert=True), documents inchangés ignorés.
+
+    `key_fields` est la clé (station, instant) des documents. Retourne un dictionnaire de statistiques
+    (source, inserted, modified, unchanged, load_stats).
+    """
+    stats = {'source': 0, 'inserted': 0, 'modified': 0, 'unchanged': 0}
+    target = with_write_concern(collection, write_concern)
+
+    def write_batch(pending):
+        query, projection = _existing_hashes_query(pending, key_fields)
+        operations = _upsert_operations(pending, collection.find(query, projection), key_fields, stats)
+        if not operations:
+            return 0
+        try:
+            result = target.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            return _record_upsert_error(e, stats)
+        return _record_upsert_result(result, operations, stats)
+
+    stats['load_stats'] = PipelinedWriter(write_batch, queue_size).write_all(_prepared_upsert_batches(data, batch_size, key_fields, stats))
+    return stats
+
+async def upsert_documents_async(collection, data, batch_size=LOAD_BATCH_SIZE, concurrency=ASYNC_LOAD_CONCURRENCY, write_concern=None,
+                                 key_fields=DOCUMENT_KEY_FIELDS):
+    """Variante asynchrone d'upsert_documents (collection PyMongo asynchrone) : plusieurs bulk_write en vol.
+
+    Deux lots en vol peuvent contenir la même clé : le serveur rejoue l'upsert en conflit sur l'index unique.
+    """
+    stats = {'source': 0, 'inserted': 0, 'modified': 0, 'unchanged': 0}
+    target = with_write_concern(collection, write_concern)
+
+    async def write_batch(pending):
+        query, projection = _existing_hashes_query(pending, key_fields)
+        existing = await collection.find(query, projection).to_list(None)
+        operations = _upsert_operations(pending, existing, key_fields, stats)
+        if not operations:
+            return 0
+        try:
+            result = await target.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            return _record_upsert_error(e, stats)
+        return _record_upsert_result(result, operations, stats)
+
+    stats['load_stats'] = await write_batches_async(write_batch, _prepared_upsert_batches(data, batch_size, key_fields, stats), concurrency)
+    return stats
+
+def _prepared_upsert_batches(data, batch_size, key_fields, stats):
+    for documents in iter_document_batches(data, batch_size):
+        stats['source'] += len(documents)
+        yield _prepare_upsert_batch(documents, key_fields)
+
+def _existing_hashes_query(pending, key_fields):
+    """Requête des empreintes déjà en base pour les clés du lot (une condition $in par station)."""
+    station_field, time_field = key_fields
+    dates_by_station = defaultdict(list)
+    for station_id, date_heure in pending:
+        dates_by_station[station_id].append(date_heure)
+    query = {"$or": [{station_field: station_id, time_field: {"$in": dates}} for station_id, dates in dates_by_station.items()]}
+    return query, {"_id": 0, station_field: 1, time_field: 1, CONTENT_HASH_FIELD: 1}
+
+def _upsert_operations(pending, existing_documents, key_fields, stats):
+    """UpdateOne(upsert=True) des documents du lot dont l'empreinte diffère de celle en base."""
+    station_field, time_field = key_fields
+    existing = {(doc.get(station_field), doc.get(time_field)): doc.get(CONTENT_HASH_FIELD) for doc in existing_documents}
+    operations = []
+    for key, document in pending.items():
+        if existing.get(key) == document[CONTENT_HASH_FIELD]:
+            stats['unchanged'] += 1
+            continue
+        operations.append(UpdateOne(dict(zip(key_fields, key)), {"$set": document}, upsert=True))
+    return operations
+
+def _record_upsert_result(result, operations, stats):
+    if result.acknowledged:
+        stats['inserted'] += result.upserted_count
+        stats['modified'] += result.modified_count
+    return len(operations)
+
+def _record_upsert_error(error, stats):
+    print(f"   -> ❌ ERREUR partielle d'upsert : {len(error.details.get('writeErrors', []))} opération(s) rejetée(s)")
+    stats['inserted'] += error.details.get('nUpserted', 0)
+    stats['modified'] += error.details.get('nModified', 0)
+    return error.details.get('nUpserted', 0) + error.details.get('nModified', 0)
+
+# --- 3 bis. DISPOSITIONS DE STOCKAGE COMPACTES (TIME-SERIES, SEAUX STATION-JOUR) ---
+
+def storage_collection_name(layout=STORAGE_LAYOUT):
+    """Nom de la collection cible d'une disposition de stockage."""
+    if layout == 'flat':
+        return MONGO_COLLECTION
+    if layout not in STORAGE_COLLECTIONS:
+        raise ValueError(f"Disposition de stockage inconnue : {layout} (attendu : {', '.join(STORAGE_COLLECTIONS)})")
+    return STORAGE_COLLECTIONS[layout]
+
+def prepare_storage_collection(db, layout=STORAGE_LAYOUT, mode=LOAD_MODE):
+    """Renvoie la collection cible, créée et indexée selon la disposition ; en mode 'full' elle est vidée."""
+    name = storage_collection_name(layout)
+    if layout == 'timeseries':
+        if mode != 'incremental' and name in db.list_collection_names():
+            db.drop_collection(name)  # Plus rapide qu'une suppression document par document
+        if name not in db.list_collection_names():
+            db.create_collection(name, timeseries={'timeField': 'date_heure_utc', 'metaField': TIMESERIES_META_FIELD, 'granularity': 'hours'})
+        return db[name]
+
+    collection = db[name]
+    if mode != 'incremental':
+        collection.delete_many({})
+    if layout == 'bucket':
+        collection.create_index([('id_station', ASCENDING), ('jour', ASCENDING)], unique=True, name="cle_station_jour")
+    return collection
+
+def to_timeseries_document(document):
+    """Relevé à plat -> document time-series (champs de station regroupés dans le metaField)."""
+    measures = {k: v for k, v in document.items() if k not in STATION_FIELDS and k != '_id'}
+    measures[TIMESERIES_META_FIELD] = {k: document.get(k) for k in STATION_FIELDS}
+    return measures
+
+def _bucket_day(value):
+    if not isinstance(value, datetime):
+        raise TypeError(f"date_heure_utc doit être un datetime pour le stockage par seaux (reçu : {type(value).__name__})")
+    return datetime(value.year, value.month, value.day)
+
+def bucket_operations(documents, replace_existing=False, pushed=None):
+    """Regroupe des relevés à plat par station et jour UTC en opérations d'ajout dans les seaux correspondants.
+
+    Avec `replace_existing`, les relevés déjà présents aux mêmes horodatages sont d'abord retirés
+    (rechargement incrémental idempotent). La liste `pushed`, si fournie, reçoit le nombre de relevés
+    ajoutés par chaque opération (0 pour un retrait).
+    """
+    pushed = [] if pushed is None else pushed
+    buckets = {}
+    for document in documents:
+        key = (document.get('id_station'), _bucket_day(document['date_heure_utc']))
+        bucket = buckets.setdefault(key, {'source_donnees': document.get('source_donnees'), 'mesures': []})
+        bucket['mesures'].append({k: v for k, v in document.items() if k not in STATION_FIELDS and k != '_id'})
+
+    operations = []
+    for (station_id, day), bucket in buckets.items():
+        key = {'id_station': station_id, 'jour': day}
+        if replace_existing:
+            dates = [measure['date_heure_utc'] for measure in bucket['mesures']]
+            operations.append(UpdateOne(key, {'$pull': {'mesures': {'date_heure_utc': {'$in': dates}}}}))
+            pushed.append(0)
+        operations.append(UpdateOne(key, {'$push': {'mesures': {'$each': bucket['mesures']}},
+                                          '$setOnInsert': {'source_donnees': bucket['source_donnees']}}, upsert=True))
+        pushed.append(len(bucket['mesures']))
+    return operations
+
+def write_layout_documents(collection, data, layout, mode=LOAD_MODE, batch_size=LOAD_BATCH_SIZE, queue_size=LOAD_QUEUE_SIZE,
+                           write_concern=None):
+    """Écrit un flux de relevés dans une collection 'timeseries' ou 'bucket' via le thread d'écriture ; renvoie les LoadStats.
+
+    En mode 'incremental', les relevés existants aux mêmes (station, horodatage) sont remplacés.
+    """
+    target = with_write_concern(collection, write_concern)
+    incremental = mode == 'incremental'
+
+    def write_timeseries(documents):
+        if incremental:
+            dates_by_station = defaultdict(list)
+            for document in documents:
+                dates_by_station[document['station']['id_station']].append(document['date_heure_utc'])
+            target.delete_many({"$or": [{f"{TIMESERIES_META_FIELD}.id_station": station_id, "date_heure_utc": {"$in": dates}}
+                                        for station_id, dates in dates_by_station.items()]})
+        try:
+            result = target.insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            print(f"   -> ❌ ERREUR partielle d'insertion : {len(e.details.get('writeErrors', []))} document(s) rejeté(s)")
+            return e.details.get('nInserted', 0)
+        return len(result.inserted_ids) if result.acknowledged else len(documents)
+
+    def write_buckets(documents):
+        pushed = []
+        operations = bucket_operations(documents, replace_existing=incremental, pushed=pushed)
+        try:
+            # Ordonné : le retrait des anciens relevés doit précéder l'ajout des nouveaux dans un même seau
+            result = target.bulk_write(operations, ordered=incremental)
+        except BulkWriteError as e:
+            failed = {error['index'] for error in e.details.get('writeErrors', [])}
+            print(f"   -> ❌ ERREUR partielle d'écriture des seaux : {len(failed)} opération(s) rejetée(s)")
+            # En mode ordonné, le serveur s'arrête à la première erreur : les opérations suivantes ne sont pas exécutées
+            applied = range(min(failed)) if incremental and failed else [i for i in range(len(operations)) if i not in failed]
+            return sum(pushed[i] for i in applied)
+        return sum(pushed) if result.acknowledged else len(documents)
+
+    if layout == 'timeseries':
+        batches = ([to_timeseries_document(d) for d in documents] for documents in iter_document_batches(data, batch_size))
+        return PipelinedWriter(write_timeseries, queue_size).write_all(batches)
+    if layout == 'bucket':
+        return PipelinedWriter(write_buckets, queue_size).write_all(iter_document_batches(data, batch_size))
+    raise ValueError(f"Disposition sans écriture dédiée : {layout}")
+
+def count_stored_measures(collection, layout=STORAGE_LAYOUT):
+    """Nombre de relevés stockés (les seaux contiennent plusieurs relevés chacun)."""
+    if layout != 'bucket':
+        return collection.count_documents({})
+    result = list(collection.aggregate([{"$group": {"_id": None, "n": {"$sum": {"$size": "$mesures"}}}}]))
+    return result[0]["n"] if result else 0
+
+def audit_pre_pipeline(layout=STORAGE_LAYOUT):
+    """Étapes d'agrégation ramenant une disposition au schéma à plat avant l'audit (un document par relevé)."""
+    if layout == 'bucket':
+        return [{"$unwind": "$mesures"}, {"$replaceRoot": {"newRoot": "$mesures"}}]
+    return []
+
+def query_time_range(collection, station_id, start, end, layout=STORAGE_LAYOUT):
+    """Relevés d'une station sur [start, end[ (datetimes UTC), à plat et triés, quelle que soit la disposition."""
+    if layout == 'bucket':
+        first_day = datetime(start.year, start.month, start.day)
+        pipeline = [
+            {"$match": {"id_station": station_id, "jour": {"$gte": first_day, "$lt": end}}},
+            {"$unwind": "$mesures"},
+            {"$match": {"mesures.date_heure_utc": {"$gte": start, "$lt": end}}},
+            {"$replaceRoot": {"newRoot": "$mesures"}},
+            {"$sort": {"date_heure_utc": 1}},
+        ]
+        return list(collection.aggregate(pipeline))
+    station_field = f"{TIMESERIES_META_FIELD}.id_station" if layout == 'timeseries' else "id_station"
+    query = {station_field: station_id, "date_heure_utc": {"$gte": start, "$lt": end}}
+    return list(collection.find(query, {"_id": 0}).sort("date_heure_utc", ASCENDING))
+
+# --- 3 ter. AGRÉGATS JOURNALIERS (DONNÉES PRÉ-CALCULÉES POUR LES TABLEAUX DE BORD) ---
+
+def ensure_daily_rollup_index(collection):
+    """Crée (si besoin) l'index unique (id_station, jour) des agrégats journaliers."""
+    return collection.create_index([(field, ASCENDING) for field in DAILY_ROLLUP_KEY_FIELDS], unique=True, name="cle_station_jour")
+
+def daily_rollup_pipeline(days, layout=STORAGE_LAYOUT):
+    """Agrégation recalculant, depuis les relevés stockés, les agrégats journaliers des stations-jours `days`.
+
+    Une seule plage [premier jour, dernier jour] est lue par station ; les valeurs NaN comptent comme manquantes.
+    """
+    days = days.to_frame(index=False)
+    station_field, day_field = DAILY_ROLLUP_KEY_FIELDS
+    ranges = days.groupby(station_field, observed=True)[day_field].agg(['min', 'max'])
+    time_field = 'jour' if layout == 'bucket' else 'date_heure_utc'
+    station_path = f"{TIMESERIES_META_FIELD}.id_station" if layout == 'timeseries' else "id_station"
+    match = {"$or": [{station_path: str(station), time_field: {"$gte": low.to_pydatetime(), "$lt": (high + pd.Timedelta(days=1)).to_pydatetime()}}
+                     for station, (low, high) in ranges.iterrows()]}
+    # Champs de station : sous-document time-series ou racine ; relevés : tableau des seaux ou racine
+    station = f"${TIMESERIES_META_FIELD}." if layout == 'timeseries' else "$"
+    measure = "$mesures." if layout == 'bucket' else "$"
+
+    def valid(name):
+        value = f"{measure}{name}"
+        # NaN est inférieur à tout autre nombre dans l'ordre de comparaison BSON
+        return {"$cond": [{"$and": [{"$isNumber": value}, {"$gte": [value, float('-inf')]}]}, value, None]}
+
+    def count_valid(name):
+        return {"$sum": {"$cond": [{"$eq": [valid(name), None]}, 0, 1]}}
+
+    date = f"{measure}date_heure_utc"
+    day = {"$dateFromParts": {"year": {"$year": date}, "month": {"$month": date}, "day": {"$dayOfMonth": date}}}
+    unwind = [{"$unwind": "$mesures"}] if layout == 'bucket' else []
+    return [{"$match": match}] + unwind + [
+        {"$group": {
+            "_id": {station_field: f"{station}id_station", day_field: day},
+            "source_donnees": {"$first": f"{station}source_donnees"},
+            "nb_releves": {"$sum": 1},
+            "temperature_min_c": {"$min": valid('temperature_c')},
+            "temperature_max_c": {"$max": valid('temperature_c')},
+            "temperature_moy_c": {"$avg": valid('temperature_c')},
+            "nb_temperature": count_valid('temperature_c'),
+            "pluie_totale_mm": {"$sum": valid('pluie_accum_mm')},
+            "vent_moy_ms": {"$avg": valid('vent_vitesse_ms')},
+            "nb_vent": count_valid('vent_vitesse_ms'),
+        }},
+    ]
+
+def daily_rollup_frame(rows, days):
+    """Met les résultats de daily_rollup_pipeline au format de DailyRollup.result(), restreints aux stations-jours `days`."""
+    columns = DailyRollup().result().columns
+    daily = pd.DataFrame([{**row.pop('_id'), **row} for row in rows], columns=columns)
+    daily = daily.set_index(DAILY_ROLLUP_KEY_FIELDS)
+    daily = daily[daily.index.isin(days)].sort_index().reset_index()
+    floats = ['temperature_min_c', 'temperature_max_c', 'temperature_moy_c', 'pluie_totale_mm', 'vent_moy_ms']
+    daily[floats] = daily[floats].astype('float64')
+    daily[['nb_releves', 'nb_temperature', 'nb_vent']] = daily[['nb_releves', 'nb_temperature', 'nb_vent']].astype('int64')
+    return daily[columns]
+
+def rollup_from_measures(source, rollup, layout=STORAGE_LAYOUT):
+    """Agrégats des stations-jours vus par `rollup`, recalculés depuis la collection des relevés `source`."""
+    days = rollup.days()
+    if not len(days):
+        return rollup.result()
+    return daily_rollup_frame(source.aggregate(daily_rollup_pipeline(days, layout), allowDiskUse=True), days)
+
+def write_daily_rollup(collection, rollup, mode=LOAD_MODE, batch_size=LOAD_BATCH_SIZE, queue_size=LOAD_QUEUE_SIZE, write_concern=None,
+                       source=None, layout=STORAGE_LAYOUT):
+    """Upsert des agrégats des stations-jours vus par l'exécution ; les agrégats inchangés ne sont pas réécrits.
+
+    En mode 'full', la collection est d'abord vidée (elle est reconstruite comme la collection horaire) et les
+    agrégats calculés en mémoire sont écrits. En mode 'incremental', les stations-jours touchées sont recalculées
+    depuis la collection des relevés `source` (disposition `layout`) : une exécution partielle, ou un fichier
+    à cheval sur deux jours UTC, ne tronque pas les agrégats déjà stockés. Retourne les statistiques d'upsert_documents.
+    """
+    if mode != 'incremental':
+        collection.delete_many({})
+        daily = rollup.result()
+    else:
+        daily = rollup_from_measures(source, rollup, layout) if source is not None else rollup.result()
+    ensure_daily_rollup_index(collection)
+    return upsert_documents(collection, [daily], batch_size, queue_size, write_concern, key_fields=DAILY_ROLLUP_KEY_FIELDS)
+
+def load_daily_rollup_to_mongodb(rollup, mode=LOAD_MODE, write_concern=LOAD_WRITE_CONCERN, layout=STORAGE_LAYOUT):
+    """Connecte à MongoDB et met à jour la collection des agrégats journaliers ; renvoie False en cas d'erreur."""
+    print(f"--- 📊 Agrégats journaliers : {rollup.touched} station(s)-jour(s) recalculée(s) -> '{DAILY_ROLLUP_COLLECTION}' ---")
+    try:
+        with mongo_client() as client:
+            db = client[MONGO_DATABASE]
+            stats = write_daily_rollup(db[DAILY_ROLLUP_COLLECTION], rollup, mode, write_concern=write_concern,
+                                       source=db[storage_collection_name(layout)], layout=layout)
+        print(f"   -> Insérés: {stats['inserted']}, Mis à jour: {stats['modified']}, Inchangés (ignorés): {stats['unchanged']}")
         return True
+    except ConnectionFailure:
+        print("\n❌ ERREUR DE CONNEXION: Impossible de mettre à jour les agrégats journaliers.")
+    except Exception as e:
+        print(f"\n❌ ERREUR LORS DE LA MISE À JOUR DES AGRÉGATS JOURNALIERS : {e}")
+    return False
+
+def query_daily_rollup(collection, station_id, start, end):
+    """Agrégats journaliers d'une station pour les jours UTC de [start, end[, triés par jour."""
+    query = {"id_station": station_id, "jour": {"$gte": start, "$lt": end}}
+    return list(collection.find(query, {"_id": 0, CONTENT_HASH_FIELD: 0}).sort("jour", ASCENDING))
+
+def weekly_rollup(daily):
+    """Agrège des agrégats journaliers (DataFrame ou documents) par station et semaine (lundi UTC).
+
+    Les moyennes hebdomadaires sont pondérées par les effectifs journaliers de mesures valides.
+    """
+    daily = pd.DataFrame(daily)
+    if daily.empty:
+        return daily
+    daily = daily.assign(semaine=pd.to_datetime(daily['jour']).dt.to_period('W-SUN').dt.start_time,
+                         temperature_somme=daily['temperature_moy_c'].fillna(0) * daily['nb_temperature'],
+                         vent_somme=daily['vent_moy_ms'].fillna(0) * daily['nb_vent'])
+    weekly = daily.groupby(['id_station', 'semaine'], sort=True).agg(
+        nb_releves=('nb_releves', 'sum'), temperature_min_c=('temperature_min_c', 'min'), temperature_max_c=('temperature_max_c', 'max'),
+        temperature_somme=('temperature_somme', 'sum'), nb_temperature=('nb_temperature', 'sum'),
+        pluie_totale_mm=('pluie_totale_mm', 'sum'), vent_somme=('vent_somme', 'sum'), nb_vent=('nb_vent', 'sum'),
+    ).reset_index()
+    weekly['temperature_moy_c'] = weekly['temperature_somme'] / weekly['nb_temperature'].where(weekly['nb_temperature'] > 0)
+    weekly['vent_moy_ms'] = weekly['vent_somme'] / weekly['nb_vent'].where(weekly['nb_vent'] > 0)
+    return weekly.drop(columns=['temperature_somme', 'vent_somme'])
+
+def report_target_count(source_count, target_count, mode=LOAD_MODE):
+    """Affiche la comparaison du nombre d'enregistrements source et du nombre de relevés en base."""
+    print("\n--- ✅ Rapport d'Intégrité Cible (MongoDB - Compte) ---")
+    if target_count == source_count:
+         print(f"-> ✅ SUCCÈS: Nombre d'enregistrements (Source: {source_count}, Cible: {target_count}) correspond.")
+    elif mode == 'incremental':
+         # La collection conserve l'historique des exécutions précédentes et les doublons source sont fusionnés
+         print(f"-> ℹ️ Incrémental : {source_count} enregistrements source, {target_count} documents en base (historique inclus).")
+    else:
+         print(f"-> ❌ ÉCHEC: La source ({source_count}) ne correspond pas à la cible ({target_count}).")
+    print("-------------------------------------------------------")
+
+def load_data_to_mongodb(data_list, mode=LOAD_MODE):
+    """Connecte à MongoDB, insère la liste complète des documents, et vérifie la collection cible."""
+    return load_batches_to_mongodb([data_list], mode=mode)
+
+def load_batches_to_mongodb(batches, mode=LOAD_MODE, batch_size=LOAD_BATCH_SIZE, write_concern=LOAD_WRITE_CONCERN, queue_size=LOAD_QUEUE_SIZE,
+                            layout=STORAGE_LAYOUT):
+    """Connecte à MongoDB et charge le flux de lots (ou de documents) par lots de taille fixe, puis vérifie la collection cible.
+
+    En mode 'full', la collection est purgée puis entièrement réinsérée ; en mode 'incremental',
+    seuls les documents nouveaux ou modifiés sont envoyés (upsert sur id_station + date_heure_utc).
+    Les écritures sont faites par un thread dédié pendant que les lots suivants sont préparés.
+    `layout` choisit la disposition de stockage ('flat', 'timeseries' ou 'bucket').
+    """
+        
+    try:
+        # 1. Connexion (client partagé du pipeline s'il est ouvert)
+        with mongo_client() as client:
+            print(f"✅ Connexion MongoDB réussie à l'URI : {MONGO_URI}")
+            
+            # 2. Insertion
+            db = client[MONGO_DATABASE]
+            collection = db[MONGO_COLLECTION]
+            
+            if layout != 'flat':
+                collection = prepare_storage_collection(db, layout, mode)
+                print(f"   -> Chargement '{mode}' dans '{collection.name}' (disposition '{layout}', lots de {batch_size})...")
+                load_stats = write_layout_documents(collection, batches, layout, mode, batch_size, queue_size, write_concern)
+                load_stats.print_report()
+                source_count = load_stats.documents
+            elif mode == 'incremental':
+                try:
+                    ensure_unique_key_index(collection)
+                except OperationFailure as e:
+                    print(f"\n❌ ERREUR: Index unique (id_station, date_heure_utc) impossible à créer, la collection contient des doublons. Relancez un chargement 'full' après dédoublonnage. ({e})")
+                    return False
+                print(f"   -> Chargement incrémental dans '{MONGO_COLLECTION}' (upsert par lots de {batch_size})...")
+                stats = upsert_documents(collection, batches, batch_size, queue_size, write_concern)
+                print(f"   -> Insérés: {stats['inserted']}, Mis à jour: {stats['modified']}, Inchangés (ignorés): {stats['unchanged']}")
+                stats['load_stats'].print_report()
+                source_count = stats['source']
+            else:
+                collection.delete_many({}) # Purgement de la collection avant l'insertion
+                print(f"   -> Collection '{MONGO_COLLECTION}' purgée. Insertion des documents par lots de {batch_size}...")
+                load_stats = insert_documents(collection, batches, batch_size, queue_size, write_concern)
+                load_stats.print_report()
+                # Index construit après l'insertion en masse (plus rapide que sa mise à jour document par document)
+                ensure_time_range_index(collection)
+                source_count = load_stats.documents
+            
+            # 3. VÉRIFICATION FINALE DANS MONGODB (Compte)
+            report_target_count(source_count, count_stored_measures(collection, layout), mode)
+            return True
     
     except ConnectionFailure:
         print("\n❌ ERREUR DE CONNEXION: Assurez-vous que votre serveur MongoDB local est démarré (via Compass) et que l'URI est correct.")
@@ -220,117 +2030,428 @@ def load_data_to_mongodb(data_list):
 
 # --- 4. NOUVELLE FONCTION D'AUDIT POST-MIGRATION ---
 
-def audit_mongodb_data():
-    """Vérifie les types et les valeurs nulles des données après la migration dans MongoDB."""
+def print_audit_report(report):
+    """Affiche un AuditReport (valeurs nulles, NaN, types, plages)."""
+    print(f"\n-> {report.total_documents} documents audités en une passe ({report.elapsed:.3f}s), du {report.min_date} au {report.max_date}.")
+
+    print("\n-> Vérification des valeurs manquantes (Nulles):")
+    for name, audit in report.fields.items():
+        if audit.nulls > 0:
+            print(f"   ❌ {name.upper()} : {audit.nulls} documents contiennent la valeur null.")
+        else:
+            print(f"   ✅ {name.upper()} : 0 valeur nulle (Passée).")
+        if audit.nans > 0:
+            print(f"   ℹ️ {name.upper()} : {audit.nans} valeurs NaN (mesure non renseignée à la source).")
+
+    print("\n-> Vérification des types (chaînes de caractères dans champs numériques):")
+    for name, audit in report.fields.items():
+        if audit.strings > 0:
+            print(f"   ❌ {name.upper()} : {audit.strings} documents contiennent une chaîne de caractères au lieu d'un nombre.")
+        else:
+            print(f"   ✅ {name.upper()} : Type numérique correct (Passée).")
+
+    print("\n-> Vérification des plages de valeurs :")
+    for name, audit in report.fields.items():
+        if audit.constraint is None:
+            continue
+        status = "❌" if audit.out_of_range else "✅"
+        print(f"   {status} {name.upper()} : {audit.out_of_range} valeur(s) hors de [{audit.constraint['min']}, {audit.constraint['max']}].")
+    print(f"   -> Taux d'anomalies de plage : {report.error_rate:.2f}%")
+    flagged = {name: n for name, n in report.quality_flags.items() if n}
+    if flagged:
+        print("   -> Relevés signalés par drapeau : " + ", ".join(f"{name} {n}" for name, n in flagged.items()))
+
+def report_inline_audit(audit):
+    """Affiche l'audit qualité calculé lot par lot pendant la transformation (sans relecture de MongoDB)."""
+    print("\n--- 🔬 AUDIT QUALITÉ EN LIGNE (calculé pendant la transformation) ---")
+    report = audit.result()
+    print_audit_report(report)
+    if report.passed:
+        print("\n🎉 AUDIT RÉUSSI: Aucune valeur nulle ni type incorrect dans les données chargées.")
+    else:
+        print("\n⚠️ AVERTISSEMENT: L'audit a détecté des problèmes de qualité (nulles/types).")
+    print("==========================================================================")
+    return report
+
+def audit_mongodb_data(layout=STORAGE_LAYOUT):
+    """Vérifie les types, les valeurs nulles et les plages des données après la migration dans MongoDB.
+
+    Tous les compteurs (nulles, types, plages, taux d'erreur et drapeaux d'anomalies) sont calculés en une seule
+    passe d'agrégation. Retourne l'AuditReport (None en cas d'erreur).
+    """
     
     print("\n--- 🔬 AUDIT POST-MIGRATION MONGO DB (Qualité des Données) ---")
     
     try:
-        client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
-        db = client[MONGO_DATABASE]
-        collection = db[MONGO_COLLECTION]
-        
-        audit_success = True
-        
-        # 1. Vérification des types et des nulles (MongoDB Aggregation)
-        pipeline = []
-        for field in NUMERIC_FIELDS:
-            # Compte le nombre de documents où le champ est manquant (null)
-            pipeline.append({
-                "$group": {
-                    "_id": None,
-                    f"nulls_{field}": {"$sum": {"$cond": [{"$eq": [f"${field}", None]}, 1, 0]}}
-                }
-            })
-            
-        # Simplification de l'agrégation en un seul appel
-        audit_results = list(collection.aggregate(pipeline))
+        with mongo_client() as client:
+            collection = client[MONGO_DATABASE][storage_collection_name(layout)]
+            report = run_audit(collection, fields=NUMERIC_FIELDS, constraints=QUALITY_CONSTRAINTS, pre_pipeline=audit_pre_pipeline(layout))
+            print_post_load_audit(report)
+        return report
 
-        if audit_results:
-            results = audit_results[0]
-            del results['_id']
-            
-            print("\n-> Vérification des valeurs manquantes (Nulles):")
-            for key, count in results.items():
-                field_name = key.replace('nulls_', '')
-                if count > 0:
-                    print(f"   ❌ {field_name.upper()} : {count} documents contiennent la valeur null.")
-                    audit_success = False
-                else:
-                    print(f"   ✅ {field_name.upper()} : 0 valeur nulle (Passée).")
+    except ConnectionFailure:
+        print("\n❌ ERREUR DE CONNEXION: Impossible d'auditer. Le serveur MongoDB est-il toujours démarré ?")
+    except Exception as e:
+        print(f"\n❌ ERREUR LORS DE L'AUDIT MONGODB : {e}")
 
-        # 2. Vérification des plages de valeurs (optionnel mais bon)
-        # On peut exécuter un simple find pour s'assurer qu'aucune chaîne n'a été insérée
-        
-        # Assurez-vous qu'aucun type String n'est présent dans les champs numériques
-        print("\n-> Vérification des types (chaînes de caractères dans champs numériques):")
-        for field in NUMERIC_FIELDS:
-            # Cherche si le champ existe et est de type String (BSON type 2)
-            string_count = collection.count_documents({field: {"$type": "string"}})
-            if string_count > 0:
-                print(f"   ❌ {field.upper()} : {string_count} documents contiennent une chaîne de caractères au lieu d'un nombre.")
-                audit_success = False
-            else:
-                print(f"   ✅ {field.upper()} : Type numérique correct (Passée).")
+def print_post_load_audit(report):
+    """Affiche l'AuditReport de la relecture de MongoDB et sa conclusion."""
+    print_audit_report(report)
+    if report.passed:
+        print("\n🎉 AUDIT RÉUSSI: La qualité des données est maintenue après la migration.")
+    else:
+         print("\n⚠️ AVERTISSEMENT: L'audit a détecté des problèmes de qualité (nulles/types).")
+    print("==========================================================================")
 
+# --- 4 bis. MODE ASYNCIO (CLIENT POOLÉ ASYNCHRONE : ÉCRITURES ET REQUÊTES D'AUDIT CONCURRENTES) ---
 
-        if audit_success:
-            print("\n🎉 AUDIT RÉUSSI: La qualité des données est maintenue après la migration.")
+async def load_batches_to_mongodb_async(client, batches, mode=LOAD_MODE, batch_size=LOAD_BATCH_SIZE, write_concern=LOAD_WRITE_CONCERN,
+                                        concurrency=ASYNC_LOAD_CONCURRENCY):
+    """Variante asynchrone de load_batches_to_mongodb (disposition 'flat') sur le client asynchrone `client` :
+    jusqu'à `concurrency` lots sont écrits simultanément. Renvoie False en cas d'erreur.
+    """
+    try:
+        await client.admin.command('ping')
+        print(f"✅ Connexion MongoDB (asyncio, {concurrency} lots en vol) réussie à l'URI : {MONGO_URI}")
+        collection = client[MONGO_DATABASE][MONGO_COLLECTION]
+        if mode == 'incremental':
+            try:
+                await collection.create_index([(field, ASCENDING) for field in DOCUMENT_KEY_FIELDS], unique=True, name="cle_station_date")
+            except OperationFailure as e:
+                print(f"\n❌ ERREUR: Index unique (id_station, date_heure_utc) impossible à créer, la collection contient des doublons. Relancez un chargement 'full' après dédoublonnage. ({e})")
+                return False
+            print(f"   -> Chargement incrémental dans '{MONGO_COLLECTION}' (upsert par lots de {batch_size})...")
+            stats = await upsert_documents_async(collection, batches, batch_size, concurrency, write_concern)
+            print(f"   -> Insérés: {stats['inserted']}, Mis à jour: {stats['modified']}, Inchangés (ignorés): {stats['unchanged']}")
+            stats['load_stats'].print_report()
+            source_count = stats['source']
         else:
-             print("\n⚠️ AVERTISSEMENT: L'audit a détecté des problèmes de qualité (nulles/types).")
-
-        print("==========================================================================")
-        client.close()
-
+            await collection.delete_many({})
+            print(f"   -> Collection '{MONGO_COLLECTION}' purgée. Insertion des documents par lots de {batch_size}...")
+            load_stats = await insert_documents_async(collection, batches, batch_size, concurrency, write_concern)
+            load_stats.print_report()
+            keys = [(field, ASCENDING) for field in DOCUMENT_KEY_FIELDS]
+            if not any([(f, int(d)) for f, d in info['key']] == keys for info in (await collection.index_information()).values()):
+                await collection.create_index(keys, name="station_date_heure")
+            source_count = load_stats.documents
+        report_target_count(source_count, await collection.count_documents({}), mode)
+        return True
     except ConnectionFailure:
-        print("\n❌ ERREUR DE CONNEXION: Impossible d'auditer. Le serveur MongoDB est-il toujours démarré ?")
+        print("\n❌ ERREUR DE CONNEXION: Assurez-vous que votre serveur MongoDB local est démarré (via Compass) et que l'URI est correct.")
+        return False
     except Exception as e:
-        print(f"\n❌ ERREUR LORS DE L'AUDIT MONGODB : {e}")
+        print(f"\n❌ ERREUR LORS DU CHARGEMENT MONGODB : {e}")
+        return False
+
+async def write_daily_rollup_async(collection, rollup, mode=LOAD_MODE, batch_size=LOAD_BATCH_SIZE, concurrency=ASYNC_LOAD_CONCURRENCY,
+                                   write_concern=None, source=None):
+    """Variante asynchrone de write_daily_rollup (disposition 'flat')."""
+    if mode != 'incremental':
+        await collection.delete_many({})
+        daily = rollup.result()
+    elif source is not None and rollup.touched:
+        cursor = await source.aggregate(daily_rollup_pipeline(rollup.days(), 'flat'), allowDiskUse=True)
+        daily = daily_rollup_frame(await cursor.to_list(None), rollup.days())
+    else:
+        daily = rollup.result()
+    await collection.create_index([(field, ASCENDING) for field in DAILY_ROLLUP_KEY_FIELDS], unique=True, name="cle_station_jour")
+    return await upsert_documents_async(collection, [daily], batch_size, concurrency, write_concern, key_fields=DAILY_ROLLUP_KEY_FIELDS)
+
+async def load_and_audit_async(batches, quality=None, rollup=None, mode=LOAD_MODE, verify_after_load=POST_LOAD_AUDIT,
+                               concurrency=ASYNC_LOAD_CONCURRENCY, metrics=None):
+    """Chargement, agrégats journaliers et audit en mode asyncio, sur un seul client asynchrone poolé.
+
+    Les agrégats journaliers et l'audit par relecture (une agrégation par champ) sont indépendants :
+    ils s'exécutent en parallèle une fois le chargement terminé. Renvoie (succès du chargement, AuditReport ou None).
+    """
+    metrics = metrics or RunMetrics()
+    client = async_mongo_client()
+    try:
+        with metrics.stage("Chargement MongoDB") as stage:
+            load_success = await load_batches_to_mongodb_async(client, batches, mode, concurrency=concurrency)
+            loaded = quality.report.total_documents if quality is not None else 0
+            stage.rows += loaded
+        if not load_success:
+            return False, None
+
+        db = client[MONGO_DATABASE]
+
+        async def update_rollup():
+            with metrics.stage("Agrégats journaliers", rows=rollup.touched):
+                print(f"--- 📊 Agrégats journaliers : {rollup.touched} station(s)-jour(s) recalculée(s) -> '{DAILY_ROLLUP_COLLECTION}' ---")
+                stats = await write_daily_rollup_async(db[DAILY_ROLLUP_COLLECTION], rollup, mode, concurrency=concurrency,
+                                                       source=db[MONGO_COLLECTION])
+                print(f"   -> Insérés: {stats['inserted']}, Mis à jour: {stats['modified']}, Inchangés (ignorés): {stats['unchanged']}")
+
+        async def audit():
+            with metrics.stage("Audit", rows=loaded):
+                return await run_audit_async(db[MONGO_COLLECTION], fields=NUMERIC_FIELDS, constraints=QUALITY_CONSTRAINTS)
+
+        jobs = ([update_rollup()] if rollup is not None else []) + ([audit()] if verify_after_load else [])
+        results = await asyncio.gather(*jobs, return_exceptions=True)
+        for error in (r for r in results if isinstance(r, Exception)):
+            print(f"\n❌ ERREUR APRÈS CHARGEMENT (asyncio) : {error}")
+        report = results[-1] if verify_after_load and not isinstance(results[-1], Exception) else None
+
+        if quality is not None:
+            report_inline_audit(quality)
+        if report is not None:
+            print("\n--- 🔬 AUDIT POST-MIGRATION MONGO DB (Qualité des Données) ---")
+            print_post_load_audit(report)
+        return True, report
+    finally:
+        await client.close()
 
 # --- 5. ORCHESTRATION DU PIPELINE E-T-L FINAL ---
 
-def run_full_etl():
-    """Exécute l'intégralité du pipeline E-T-L pour MongoDB, suivi de l'audit."""
-    
-    all_processed_records = []
-    
-    print("--- ⏳ PHASE 1: Traitement des 14 fichiers CSV complets (Weather Underground) ---")
-    madeleine_records = extract_and_process_csv_from_disk(csv_files_la_madeleine, station_id="1001", source="Weather Underground")
-    all_processed_records.extend(madeleine_records)
+def run_full_etl(streaming=False, chunksize=CSV_CHUNKSIZE, workers=None, executor='process', load_mode=LOAD_MODE,
+                 verify_after_load=POST_LOAD_AUDIT, use_cache=USE_TRANSFORM_CACHE, data_dir=None, storage=STORAGE_LAYOUT,
+                 daily_rollup=MAINTAIN_DAILY_ROLLUP, metrics_file=METRICS_FILE, prometheus_file=PROMETHEUS_TEXTFILE, profile=PROFILE_MODE,
+                 async_io=ASYNC_MONGO_IO, tasks=None, cache=None, flag_anomalies=FLAG_ANOMALIES):
+    """Exécute l'intégralité du pipeline E-T-L pour MongoDB, suivi de l'audit.
 
-    ichtegem_records = extract_and_process_csv_from_disk(csv_files_ichtegem, station_id="1002", source="Weather Underground")
-    all_processed_records.extend(ichtegem_records)
+    L'audit qualité est calculé en ligne sur les données transformées ; `verify_after_load`
+    ajoute l'audit de vérification par relecture de la collection MongoDB.
+    Avec `use_cache`, les fichiers sources inchangés depuis la dernière exécution sont relus depuis le cache.
+    Avec `data_dir`, les fichiers sources sont découverts dans ce répertoire (SourceRegistry)
+    au lieu des dictionnaires configurés. `storage` choisit la disposition de stockage MongoDB.
+    Avec `daily_rollup`, les agrégats journaliers des stations-jours traités sont mis à jour après le chargement.
+    Les mesures de chaque étape sont écrites dans `metrics_file` (JSON) et `prometheus_file` (texte Prometheus) ;
+    `profile` ('cprofile' ou 'tracemalloc') active le profilage. Renvoie les RunMetrics de l'exécution.
+    Toutes les étapes MongoDB partagent un client poolé ; avec `async_io` (disposition 'flat'), le chargement
+    passe par le client asynchrone et les agrégats journaliers et l'audit s'exécutent en parallèle.
+    `tasks` (liste de SourceTask) et `cache` (TransformCache) remplacent les fichiers découverts ou configurés et le cache par défaut.
+    Avec `flag_anomalies`, chaque document reçoit le masque des anomalies temporelles de sa station (drapeaux_qualite).
+    """
+    if async_io and storage != 'flat':
+        print(f"⚠️ Mode asyncio disponible pour la disposition 'flat' uniquement : chargement '{storage}' synchrone.")
+        async_io = False
+    metrics = RunMetrics(profile).start()
+    stack = ExitStack()
+    try:
+        if not async_io:
+            try:
+                stack.enter_context(shared_mongo_client())
+            except ConnectionFailure:
+                pass  # Chaque étape MongoDB signalera l'erreur de connexion
+        if cache is None and use_cache:
+            cache = TransformCache()
+        if tasks is None:
+            registry = None
+            if data_dir is not None:
+                registry = SourceRegistry(data_dir)
+                with metrics.stage("Découverte des sources"):
+                    scan = registry.scan()
+                registry.print_summary(scan)
+            tasks = build_source_tasks(registry, largest_first=bool(workers))
+        if streaming:
+            run_streaming_etl(chunksize, load_mode, verify_after_load, cache, tasks, storage, daily_rollup, metrics, async_io,
+                              flag_anomalies)
+        elif workers:
+            run_parallel_etl(workers, executor, chunksize, load_mode, verify_after_load, cache, tasks, storage, daily_rollup, metrics,
+                             async_io, flag_anomalies)
+        else:
+            _run_batch_etl(chunksize, load_mode, verify_after_load, cache, tasks, storage, daily_rollup, metrics, async_io,
+                           flag_anomalies)
+    finally:
+        stack.close()
+        metrics.stop()
+        emit_run_metrics(metrics, metrics_file, prometheus_file)
+    return metrics
 
-    print("\n--- ⏳ PHASE 2: Traitement du fichier JSON complet (Infoclimat) ---")
-    
+def emit_run_metrics(metrics, metrics_file=METRICS_FILE, prometheus_file=PROMETHEUS_TEXTFILE):
+    """Affiche les mesures par étape et les écrit dans les fichiers demandés (profil cProfile brut : <metrics_file>.prof)."""
+    metrics.print_report()
     try:
-        json_raw_content = read_full_json_file(JSON_FILE_PATH)
-        print(f"   -> JSON Infoclimat complet chargé.")
-        
-        json_records = clean_and_convert_json(json_raw_content)
-        all_processed_records.extend(json_records)
-        print(f"   -> Traité Infoclimat: {len(json_records)} lignes.")
-    except FileNotFoundError:
-        pass 
-    except Exception as e:
-        print(f"   -> ❌ ERREUR critique lors du traitement du fichier JSON: {e}")
+        if metrics_file:
+            metrics.write_json(metrics_file)
+            print(f"ℹ️ Mesures d'exécution écrites dans {metrics_file}")
+            if metrics.profile == 'cprofile':
+                metrics.dump_profile(f"{os.path.splitext(metrics_file)[0]}.prof")
+        if prometheus_file:
+            metrics.write_prometheus(prometheus_file)
+    except OSError as e:
+        print(f"   -> ⚠️ AVERTISSEMENT: Mesures d'exécution non écrites : {e}")
+
+def flag_frame_anomalies(frames, metrics):
+    """Ajoute les drapeaux d'anomalies temporelles aux lots (une passe triée par station et date) et en affiche le bilan."""
+    anomalies = AnomalyDetector()
+    with metrics.stage("Détection d'anomalies", rows=sum(len(frame) for frame in frames)):
+        frames = anomalies.flag_frames(frames)
+    anomalies.report()
+    return frames
+
+def _load_and_audit(frames, final_count, quality, rollup, load_mode, verify_after_load, storage, daily_rollup, metrics, async_io=False):
+    """Chargement MongoDB, agrégats journaliers et audit (chaque étape est chronométrée)."""
+    print("--- 🚀 PHASE 4: Chargement des données complètes vers MongoDB ---")
+    if async_io:
+        load_success, _ = asyncio.run(load_and_audit_async(frames, quality, rollup if daily_rollup else None, load_mode,
+                                                           verify_after_load, metrics=metrics))
+        return load_success
+    with metrics.stage("Chargement MongoDB", rows=final_count):
+        load_success = load_batches_to_mongodb(frames, mode=load_mode, layout=storage)
+
+    if load_success and daily_rollup:
+        with metrics.stage("Agrégats journaliers", rows=rollup.touched):
+            load_daily_rollup_to_mongodb(rollup, mode=load_mode, layout=storage)
+
+    # AUDIT QUALITÉ : calculé en ligne, relecture de MongoDB en option
+    if load_success:
+        with metrics.stage("Audit", rows=final_count):
+            report_inline_audit(quality)
+            if verify_after_load:
+                audit_mongodb_data(storage)
+    return load_success
+
+def _run_batch_etl(chunksize=CSV_CHUNKSIZE, load_mode=LOAD_MODE, verify_after_load=POST_LOAD_AUDIT, cache=None, tasks=None,
+                   storage=STORAGE_LAYOUT, daily_rollup=MAINTAIN_DAILY_ROLLUP, metrics=None, async_io=False, flag_anomalies=FLAG_ANOMALIES):
+    """Pipeline séquentiel : toutes les sources sont transformées avant le chargement."""
+    metrics = metrics or RunMetrics()
+    # Les lots restent des DataFrames jusqu'au chargement (conversion en documents lot par lot)
+    frames = []
+    quality = StreamingQualityAudit(NUMERIC_FIELDS)
+    integrity = FinalIntegrityCheck()
+    rollup = DailyRollup()
     
-    final_count = len(all_processed_records)
+    for batch in iter_all_source_batches(chunksize, cache, tasks, metrics):
+        with metrics.stage("Intégrité + audit en ligne", rows=len(batch)):
+            frames.append(rollup.update(integrity.update(quality.update(batch))))
+    
+    final_count = integrity.total
     print(f"\n--- ✅ PHASE 3: Données unifiées : {final_count} enregistrements totaux ---")
     
     if final_count > 0:
         # Vérification finale avant chargement (Source)
-        check_final_integrity(all_processed_records) 
-        
-        print("--- 🚀 PHASE 4: Chargement des données complètes vers MongoDB ---")
-        load_success = load_data_to_mongodb(all_processed_records)
-        
-        # NOUVELLE ÉTAPE : AUDIT POST-MIGRATION
-        if load_success:
-            audit_mongodb_data()
+        integrity.report()
+        if flag_anomalies:
+            frames = flag_frame_anomalies(frames, metrics)
+        _load_and_audit(frames, final_count, quality, rollup, load_mode, verify_after_load, storage, daily_rollup, metrics, async_io)
     else:
         print("⚠️ Le pipeline s'arrête car aucune donnée n'a pu être traitée.")
 
+def run_streaming_etl(chunksize=CSV_CHUNKSIZE, load_mode=LOAD_MODE, verify_after_load=POST_LOAD_AUDIT, cache=None, tasks=None,
+                      storage=STORAGE_LAYOUT, daily_rollup=MAINTAIN_DAILY_ROLLUP, metrics=None, async_io=False,
+                      flag_anomalies=FLAG_ANOMALIES):
+    """Exécute le pipeline E-T-L en streaming : les lots transformés sont envoyés directement au chargement.
+
+    La mémoire reste bornée par la taille des lots, quel que soit le nombre de fichiers configurés.
+    Les contrôles d'intégrité sont faits par fichier, au fil des blocs, et sur l'ensemble unifié
+    (doublons entre fichiers) ; ce dernier rapport est affiché après le chargement.
+    L'étape de chargement englobe ici l'extraction, dont la part est aussi mesurée séparément.
+    Les drapeaux d'anomalies comparent chaque lot au dernier relevé déjà vu de chaque station : les fichiers
+    sont alors traités par station et par date (chronological_tasks) plutôt que les plus gros d'abord.
+    """
+    metrics = metrics or RunMetrics()
+    if flag_anomalies:
+        tasks = chronological_tasks(build_source_tasks() if tasks is None else tasks)
+    print(f"--- 🚀 MODE STREAMING: lots de {chunksize} lignes chargés au fil de l'eau vers MongoDB ---")
+    quality = StreamingQualityAudit(NUMERIC_FIELDS)
+    integrity = FinalIntegrityCheck()
+    rollup = DailyRollup()
+    anomalies = AnomalyDetector() if flag_anomalies else None
+
+    def audited_batches():
+        for batch in iter_all_source_batches(chunksize, cache, tasks, metrics):
+            with metrics.stage("Intégrité + audit en ligne", rows=len(batch)):
+                batch = rollup.update(integrity.update(quality.update(batch)))
+            if anomalies is not None:
+                with metrics.stage("Détection d'anomalies", rows=len(batch)):
+                    batch = anomalies.update(batch)
+            yield batch
+
+    if async_io:
+        asyncio.run(load_and_audit_async(audited_batches(), quality, rollup if daily_rollup else None, load_mode,
+                                         verify_after_load, metrics=metrics))
+        integrity.report()
+        if anomalies is not None:
+            anomalies.report()
+        return
+
+    with metrics.stage("Chargement MongoDB") as stage:
+        load_success = load_batches_to_mongodb(audited_batches(), mode=load_mode, layout=storage)
+        stage.rows += integrity.total
+    integrity.report()
+    if anomalies is not None:
+        anomalies.report()
+
+    if load_success and daily_rollup:
+        with metrics.stage("Agrégats journaliers", rows=rollup.touched):
+            load_daily_rollup_to_mongodb(rollup, mode=load_mode, layout=storage)
+    if load_success:
+        with metrics.stage("Audit", rows=integrity.total):
+            report_inline_audit(quality)
+            if verify_after_load:
+                audit_mongodb_data(storage)
+
+def run_parallel_etl(workers=ETL_WORKERS, executor='process', chunksize=CSV_CHUNKSIZE, load_mode=LOAD_MODE,
+                     verify_after_load=POST_LOAD_AUDIT, cache=None, tasks=None, storage=STORAGE_LAYOUT, daily_rollup=MAINTAIN_DAILY_ROLLUP,
+                     metrics=None, async_io=False, flag_anomalies=FLAG_ANOMALIES):
+    """Exécute le pipeline E-T-L avec une extraction parallèle (un fichier par tâche) sur `workers` workers."""
+    metrics = metrics or RunMetrics()
+    if tasks is None:
+        tasks = build_source_tasks(largest_first=True)
+
+    print(f"--- ⏳ PHASE 1-2: Traitement parallèle de {len(tasks)} fichiers sources ({workers} workers, pool '{executor}') ---")
+    with metrics.stage("Extraction + transformation") as stage:
+        results = run_parallel_extraction(tasks, workers, executor, chunksize, cache)
+        stage.rows += sum(result.rows for result in results)
+    for result in results:
+        metrics.add_file(result.file_stats or FileStats(result.task.path, result.task.kind, error=result.error))
+
+    frames = []
+    quality = StreamingQualityAudit(NUMERIC_FIELDS)
+    integrity = FinalIntegrityCheck()
+    rollup = DailyRollup()
+    with metrics.stage("Intégrité + audit en ligne") as stage:
+        for result in results:
+            for batch in result.batches:
+                frames.append(rollup.update(integrity.update(quality.update(batch))))
+        stage.rows += integrity.total
+
+    final_count = integrity.total
+    print(f"\n--- ✅ PHASE 3: Données unifiées : {final_count} enregistrements totaux ---")
+
+    if final_count > 0:
+        integrity.report()
+        if flag_anomalies:
+            frames = flag_frame_anomalies(frames, metrics)
+        _load_and_audit(frames, final_count, quality, rollup, load_mode, verify_after_load, storage, daily_rollup, metrics, async_io)
+    else:
+        print("⚠️ Le pipeline s'arrête car aucune donnée n'a pu être traitée.")
+
+    print_run_summary(metrics.timings(), results)
+    return results
+
 
 if __name__ == "__main__":
-    run_full_etl()
\ No newline at end of file
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Pipeline E-T-L météo vers MongoDB.")
+    parser.add_argument('--invalidate-cache', action='store_true',
+                        help="Vide le cache des fichiers transformés avant l'exécution.")
+    parser.add_argument('--no-cache', action='store_true', help="Retraite tous les fichiers sources sans utiliser le cache.")
+    parser.add_argument('--data-dir', help="Découvre les fichiers sources dans ce répertoire au lieu des fichiers configurés.")
+    parser.add_argument('--storage', choices=list(STORAGE_COLLECTIONS), default=STORAGE_LAYOUT,
+                        help="Disposition de stockage MongoDB : un document par relevé, collection time-series ou seaux station-jour.")
+    parser.add_argument('--no-rollup', action='store_true', help="Ne met pas à jour les agrégats journaliers par station.")
+    parser.add_argument('--metrics-file', default=METRICS_FILE, help="Écrit les mesures de l'exécution (JSON) dans ce fichier.")
+    parser.add_argument('--prometheus-file', default=PROMETHEUS_TEXTFILE,
+                        help="Écrit les mesures au format texte Prometheus (collecteur textfile de node_exporter).")
+    parser.add_argument('--profile', choices=['cprofile', 'tracemalloc'], default=PROFILE_MODE,
+                        help="Active le profilage (cProfile : temps par fonction ; tracemalloc : allocations par étape).")
+    parser.add_argument('--async-io', action='store_true', default=ASYNC_MONGO_IO,
+                        help="Chargement par le client PyMongo asynchrone (lots concurrents) ; agrégats et audit en parallèle.")
+    parser.add_argument('--no-anomaly-flags', action='store_true',
+                        help="N'écrit pas les drapeaux d'anomalies temporelles (pics, valeurs figées, trous horaires).")
+    parser.add_argument('--streaming', action='store_true',
+                        help="Chargement au fil de l'eau : chaque lot est chargé dès sa transformation (mémoire bornée).")
+    parser.add_argument('--workers', type=int, default=0,
+                        help="Extraction parallèle sur ce nombre de processus (0 = séquentielle ; ignoré avec --streaming).")
+    args = parser.parse_args()
+
+    if args.invalidate_cache:
+        removed = TransformCache().invalidate()
+        print(f"ℹ️ Cache des fichiers transformés vidé : {removed} entrée(s) supprimée(s).")
+    run_full_etl(streaming=args.streaming, workers=args.workers or None, use_cache=not args.no_cache, data_dir=args.data_dir, storage=args.storage, daily_rollup=not args.no_rollup,
+                 metrics_file=args.metrics_file, prometheus_file=args.prometheus_file, profile=args.profile, async_io=args.async_io,
+                 flag_anomalies=not args.no_anomaly_flags)
\ No newline at end of file
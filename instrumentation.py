@@ -0,0 +1,329 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from functools import wraps
+
+# --- Configuration ---
+RSS_SAMPLE_INTERVAL = 0.05        # Période d'échantillonnage de la mémoire résidente (s)
+PROFILE_TOP_FUNCTIONS = 25        # Fonctions conservées dans le rapport cProfile (tri par temps cumulé)
+TRACEMALLOC_TOP_LINES = 10        # Lignes sources conservées dans le rapport tracemalloc
+PROMETHEUS_PREFIX = "etl_meteo"
+PROFILE_MODES = ('cprofile', 'tracemalloc')
+
+
+# --- Mémoire résidente (RSS) ---
+
+def _rss_reader():
+    """Renvoie une fonction lisant la mémoire résidente courante (octets), ou None si la plateforme ne le permet pas."""
+    try:
+        import psutil
+    except ImportError:
+        psutil = None
+    if psutil is not None:
+        process = psutil.Process()
+        return lambda: process.memory_info().rss
+    if os.path.exists('/proc/self/statm'):
+        page_size = os.sysconf('SC_PAGE_SIZE')
+
+        def read_statm():
+            with open('/proc/self/statm') as f:
+                return int(f.read().split()[1]) * page_size
+        return read_statm
+    return None
+
+def peak_rss_bytes():
+    """Pic de mémoire résidente du processus depuis son démarrage (octets), None si indisponible."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss est en Ko sous Linux, en octets sous macOS
+    return peak if os.uname().sysname == 'Darwin' else peak * 1024
+
+
+# --- Compteurs ---
+
+@dataclass
+class StageMetrics:
+    """Mesures cumulées d'une étape du pipeline (une étape peut être ouverte plusieurs fois, ex: un fichier par entrée)."""
+    name: str
+    calls: int = 0
+    elapsed: float = 0.0
+    rows: int = 0
+    peak_rss_bytes: int = None
+    peak_traced_bytes: int = None   # Mode tracemalloc uniquement
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+@dataclass
+class FileStats:
+    """Compteurs d'un fichier source : lignes lues, produites et écartées à la transformation."""
+    path: str
+    kind: str = None
+    rows_in: int = 0
+    rows_out: int = 0
+    dropped_missing_time: int = 0     # Lignes sans heure (dropna sur date_heure_utc)
+    dropped_bad_timestamp: int = 0    # Horodatages illisibles écartés à la normalisation
+    from_cache: bool = False
+    elapsed: float = 0.0
+    error: str = None
+
+    @property
+    def rows_dropped(self):
+        return self.dropped_missing_time + self.dropped_bad_timestamp
+
+
+class RunMetrics:
+    """Instrumentation légère d'une exécution : durée, débit et pic de RSS par étape, compteurs par fichier.
+
+    Un thread d'échantillonnage relève la mémoire résidente tant que des étapes sont ouvertes ;
+    le profilage (`profile` = 'cprofile' ou 'tracemalloc') est optionnel.
+    """
+
+    def __init__(self, profile=None, sample_interval=RSS_SAMPLE_INTERVAL):
+        if profile not in (None,) + PROFILE_MODES:
+            raise ValueError(f"Mode de profilage inconnu : {profile} (attendu : {', '.join(PROFILE_MODES)})")
+        self.profile = profile
+        self.sample_interval = sample_interval
+        self.stages = {}
+        self.files = []
+        self.started_at = datetime.now(timezone.utc)
+        self.elapsed = 0.0
+        self.profile_report = None
+        self._start = None
+        self._open = {}                 # Étape ouverte -> nombre d'entrées en cours
+        self._lock = threading.Lock()
+        self._read_rss = _rss_reader()
+        self._sampler = None
+        self._stop = threading.Event()
+        self._profiler = None
+
+    # Cycle de vie
+
+    def start(self):
+        """Démarre le chronomètre global, l'échantillonnage de la RSS et le profilage éventuel."""
+        self._start = time.perf_counter()
+        if self._read_rss is not None:
+            self._sampler = threading.Thread(target=self._sample_rss, name="rss-sampler", daemon=True)
+            self._sampler.start()
+        if self.profile == 'cprofile':
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        elif self.profile == 'tracemalloc' and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        return self
+
+    def stop(self):
+        """Arrête les mesures ; le rapport de profilage est conservé dans `profile_report`."""
+        if self._start is None:
+            return self
+        self.elapsed = time.perf_counter() - self._start
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        if self._profiler is not None:
+            self._profiler.disable()
+            self.profile_report = self._cprofile_report()
+        elif self.profile == 'tracemalloc' and tracemalloc.is_tracing():
+            self.profile_report = self._tracemalloc_report()
+            tracemalloc.stop()
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _sample_rss(self):
+        while not self._stop.wait(self.sample_interval):
+            with self._lock:
+                if not self._open:
+                    continue
+                rss = self._read_rss()
+                for name in self._open:
+                    stage = self.stages[name]
+                    stage.peak_rss_bytes = max(stage.peak_rss_bytes or 0, rss)
+
+    # Étapes
+
+    @contextmanager
+    def stage(self, name, rows=0):
+        """Chronomètre une étape (contexte réentrant : les entrées successives sont cumulées).
+
+        L'objet StageMetrics est renvoyé : `stage.rows += n` compte les lignes traitées.
+        """
+        with self._lock:
+            stage = self.stages.setdefault(name, StageMetrics(name))
+            self._open[name] = self._open.get(name, 0) + 1
+            if self._read_rss is not None:
+                stage.peak_rss_bytes = max(stage.peak_rss_bytes or 0, self._read_rss())
+        if self.profile == 'tracemalloc' and tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        stage.rows += rows
+        start = time.perf_counter()
+        try:
+            yield stage
+        finally:
+            stage.elapsed += time.perf_counter() - start
+            stage.calls += 1
+            if self.profile == 'tracemalloc' and tracemalloc.is_tracing():
+                stage.peak_traced_bytes = max(stage.peak_traced_bytes or 0, tracemalloc.get_traced_memory()[1])
+            with self._lock:
+                if self._read_rss is not None:
+                    stage.peak_rss_bytes = max(stage.peak_rss_bytes or 0, self._read_rss())
+                self._open[name] -= 1
+                if not self._open[name]:
+                    del self._open[name]
+
+    def timed(self, name):
+        """Décorateur : chaque appel de la fonction est compté dans l'étape `name`."""
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.stage(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def iter_stage(self, name, iterable):
+        """Itère sur `iterable` en ne chronométrant que la production de chaque élément (lignes comptées par len).
+
+        Le travail du consommateur entre deux éléments n'est pas attribué à l'étape.
+        """
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name) as stage:
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                stage.rows += len(item)
+            yield item
+
+    def add_file(self, file_stats):
+        """Enregistre les compteurs d'un fichier source."""
+        self.files.append(file_stats)
+        return file_stats
+
+    def timings(self):
+        """Durée de chaque étape (s), dans l'ordre de première ouverture."""
+        return {name: stage.elapsed for name, stage in self.stages.items()}
+
+    # Profilage
+
+    def _cprofile_report(self):
+        stats = pstats.Stats(self._profiler, stream=io.StringIO())
+        stats.sort_stats(pstats.SortKey.CUMULATIVE)
+        report = []
+        for (filename, line, function), (_, ncalls, tottime, cumtime, _) in sorted(
+                stats.stats.items(), key=lambda item: -item[1][3])[:PROFILE_TOP_FUNCTIONS]:
+            report.append({'function': f"{os.path.basename(filename)}:{line}({function})", 'calls': ncalls,
+                           'tottime': tottime, 'cumtime': cumtime})
+        return report
+
+    def dump_profile(self, path):
+        """Écrit les statistiques cProfile brutes (lisibles par pstats / snakeviz)."""
+        if self._profiler is not None:
+            self._profiler.dump_stats(path)
+
+    def _tracemalloc_report(self):
+        snapshot = tracemalloc.take_snapshot()
+        return [{'line': str(stat.traceback[0]), 'size_bytes': stat.size, 'count': stat.count}
+                for stat in snapshot.statistics('lineno')[:TRACEMALLOC_TOP_LINES]]
+
+    # Export
+
+    def to_dict(self):
+        """Mesures sérialisables en JSON."""
+        stages = {}
+        for name, stage in self.stages.items():
+            stages[name] = {**asdict(stage), 'rows_per_second': stage.rows_per_second}
+            del stages[name]['name']
+        return {
+            'started_at': self.started_at.isoformat(),
+            'elapsed': self.elapsed,
+            'peak_rss_bytes': peak_rss_bytes(),
+            'stages': stages,
+            'files': [{**asdict(f), 'rows_dropped': f.rows_dropped} for f in self.files],
+            'totals': {
+                'rows_in': sum(f.rows_in for f in self.files),
+                'rows_out': sum(f.rows_out for f in self.files),
+                'rows_dropped': sum(f.rows_dropped for f in self.files),
+                'failed_files': sum(1 for f in self.files if f.error),
+            },
+            'profile': {'mode': self.profile, 'report': self.profile_report} if self.profile else None,
+        }
+
+    def write_json(self, path):
+        """Écrit le fichier de mesures JSON (écriture atomique)."""
+        _atomic_write(path, json.dumps(self.to_dict(), indent=2, ensure_ascii=False, default=str))
+        return path
+
+    def prometheus_lines(self, prefix=PROMETHEUS_PREFIX):
+        """Mesures au format texte Prometheus (collecteur textfile de node_exporter)."""
+        metrics = {}
+
+        def add(name, help_text, value, **labels):
+            if value is None:
+                return
+            entry = metrics.setdefault(name, (help_text, []))
+            label_text = ",".join(f'{k}="{_escape_label(v)}"' for k, v in labels.items())
+            entry[1].append(f"{prefix}_{name}{{{label_text}}} {value}" if labels else f"{prefix}_{name} {value}")
+
+        add('run_timestamp_seconds', "Début de l'exécution (epoch).", self.started_at.timestamp())
+        add('run_duration_seconds', "Durée totale de l'exécution.", self.elapsed)
+        add('run_peak_rss_bytes', "Pic de mémoire résidente du processus.", peak_rss_bytes())
+        for name, stage in self.stages.items():
+            add('stage_duration_seconds', "Durée cumulée de l'étape.", stage.elapsed, stage=name)
+            add('stage_rows_total', "Lignes traitées par l'étape.", stage.rows, stage=name)
+            add('stage_peak_rss_bytes', "Pic de mémoire résidente pendant l'étape.", stage.peak_rss_bytes, stage=name)
+        for f in self.files:
+            add('file_rows_in_total', "Lignes lues dans le fichier source.", f.rows_in, file=f.path)
+            add('file_rows_out_total', "Lignes produites par la transformation.", f.rows_out, file=f.path)
+            add('file_rows_dropped_total', "Lignes écartées à la transformation.", f.rows_dropped, file=f.path)
+        lines = []
+        for name, (help_text, samples) in metrics.items():
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} gauge")
+            lines.extend(samples)
+        return lines
+
+    def write_prometheus(self, path, prefix=PROMETHEUS_PREFIX):
+        """Écrit le fichier texte Prometheus ; l'écriture atomique évite qu'un collecteur lise un fichier partiel."""
+        _atomic_write(path, "\n".join(self.prometheus_lines(prefix)) + "\n")
+        return path
+
+    def print_report(self):
+        """Affiche débit et pic de RSS par étape, et les lignes écartées par fichier."""
+        print("\n--- 📈 Mesures par étape ---")
+        for name, stage in self.stages.items():
+            rss = f", pic RSS {stage.peak_rss_bytes / 1e6:,.0f} Mo" if stage.peak_rss_bytes else ""
+            print(f"-> {name:<25} : {stage.elapsed:8.3f}s, {stage.rows} lignes ({stage.rows_per_second:,.0f}/s){rss}")
+        dropped = [f for f in self.files if f.rows_dropped]
+        for f in dropped:
+            print(f"   {f.path} : {f.rows_dropped} ligne(s) écartée(s) sur {f.rows_in}")
+        print("-----------------------------")
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _atomic_write(path, text):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
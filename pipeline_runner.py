@@ -0,0 +1,288 @@
+import json
+import os
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, fields
+
+import etl_meteo
+import quality_audit
+from etl_meteo import (NUMERIC_FIELDS, DailyRollup, FinalIntegrityCheck, SourceRegistry, SourceTask, StreamingQualityAudit,
+                       TransformCache)
+from instrumentation import PROFILE_MODES, FileStats, RunMetrics
+from quality_audit import AnomalyDetector
+
+# --- Configuration ---
+STAGES = ('extract', 'load', 'audit')   # Étapes du pipeline, dans l'ordre d'exécution
+CONFIG_ENV_VAR = "ETL_CONFIG"           # Chemin du fichier de configuration JSON (facultatif)
+SETTINGS_ENV_PREFIX = "ETL_"            # Préfixe des variables d'environnement des réglages (ex: ETL_LOAD_MODE)
+# Variables lues sans préfixe (fournies par docker-compose)
+UNPREFIXED_ENV_VARS = {'mongo_uri': "MONGO_URI", 'mongo_database': "MONGO_DATABASE"}
+TRUE_VALUES = ('1', 'true', 'yes', 'oui', 'on')
+
+
+# --- Réglages d'exécution ---
+
+@dataclass
+class PipelineSettings:
+    """Réglages d'une exécution ; les valeurs par défaut sont les constantes d'etl_meteo.
+
+    Priorité croissante : valeurs par défaut, fichier de configuration JSON, variables d'environnement,
+    options de la ligne de commande. `csv_files` associe un identifiant de station à ses fichiers
+    Weather Underground par date ({"1001": {"2024-10-07": "....csv"}}).
+    """
+    mongo_uri: str = etl_meteo.MONGO_URI
+    mongo_database: str = etl_meteo.MONGO_DATABASE
+    data_dir: str = None
+    csv_files: dict = None
+    json_file: str = None
+    cache_dir: str = etl_meteo.CACHE_DIR
+    use_cache: bool = etl_meteo.USE_TRANSFORM_CACHE
+    load_mode: str = etl_meteo.LOAD_MODE
+    storage: str = etl_meteo.STORAGE_LAYOUT
+    chunksize: int = etl_meteo.CSV_CHUNKSIZE
+    workers: int = 0
+    executor: str = 'process'
+    streaming: bool = False
+    daily_rollup: bool = etl_meteo.MAINTAIN_DAILY_ROLLUP
+    post_load_audit: bool = etl_meteo.POST_LOAD_AUDIT
+    flag_anomalies: bool = etl_meteo.FLAG_ANOMALIES
+    async_io: bool = etl_meteo.ASYNC_MONGO_IO
+    metrics_file: str = etl_meteo.METRICS_FILE
+    prometheus_file: str = etl_meteo.PROMETHEUS_TEXTFILE
+    profile: str = etl_meteo.PROFILE_MODE
+
+    def __post_init__(self):
+        if self.load_mode not in ('full', 'incremental'):
+            raise ValueError(f"Mode de chargement inconnu : {self.load_mode} ('full' ou 'incremental')")
+        if self.storage not in etl_meteo.STORAGE_COLLECTIONS:
+            raise ValueError(f"Disposition de stockage inconnue : {self.storage} ({', '.join(etl_meteo.STORAGE_COLLECTIONS)})")
+        if self.executor not in ('process', 'thread'):
+            raise ValueError(f"Pool de workers inconnu : {self.executor} ('process' ou 'thread')")
+        if self.profile is not None and self.profile not in PROFILE_MODES:
+            raise ValueError(f"Mode de profilage inconnu : {self.profile} ({', '.join(PROFILE_MODES)})")
+
+    @classmethod
+    def from_file(cls, path):
+        """Lit les réglages d'un fichier JSON (clés = noms des champs ; une clé inconnue est une erreur)."""
+        with open(path, 'r', encoding='utf-8') as f:
+            values = json.load(f)
+        unknown = set(values) - {f.name for f in fields(cls)}
+        if unknown:
+            raise ValueError(f"Réglage(s) inconnu(s) dans {path} : {', '.join(sorted(unknown))}")
+        return values
+
+    @classmethod
+    def from_env(cls, environ=None):
+        """Lit les réglages des variables d'environnement ETL_<CHAMP> (MONGO_URI et MONGO_DATABASE sans préfixe)."""
+        environ = os.environ if environ is None else environ
+        values = {}
+        for f in fields(cls):
+            name = UNPREFIXED_ENV_VARS.get(f.name, SETTINGS_ENV_PREFIX + f.name.upper())
+            if environ.get(name, '') != '':
+                values[f.name] = _parse_env_value(f, environ[name])
+        return values
+
+    @classmethod
+    def load(cls, config_file=None, environ=None, **overrides):
+        """Construit les réglages : défauts < fichier (`config_file` ou $ETL_CONFIG) < environnement < `overrides` non None."""
+        environ = os.environ if environ is None else environ
+        values = {}
+        config_file = config_file or environ.get(CONFIG_ENV_VAR)
+        if config_file:
+            values.update(cls.from_file(config_file))
+        values.update(cls.from_env(environ))
+        values.update({name: value for name, value in overrides.items() if value is not None})
+        return cls(**values)
+
+    def to_dict(self):
+        return asdict(self)
+
+    @contextmanager
+    def applied(self):
+        """Applique la connexion MongoDB (etl_meteo et quality_audit) et le répertoire de cache le temps du bloc."""
+        patches = [(etl_meteo, {'MONGO_URI': self.mongo_uri, 'MONGO_DATABASE': self.mongo_database, 'CACHE_DIR': self.cache_dir}),
+                   (quality_audit, {'MONGO_URI': self.mongo_uri, 'MONGO_DATABASE': self.mongo_database})]
+        previous = [(module, {name: getattr(module, name) for name in names}) for module, names in patches]
+        for module, names in patches:
+            for name, value in names.items():
+                setattr(module, name, value)
+        try:
+            yield self
+        finally:
+            for module, names in previous:
+                for name, value in names.items():
+                    setattr(module, name, value)
+
+    def configured_tasks(self):
+        """Tâches des fichiers `csv_files` / `json_file` des réglages, ou None s'ils ne sont pas renseignés."""
+        if not self.csv_files and not self.json_file:
+            return None
+        tasks = [SourceTask('csv', path, station_id=station_id, source="Weather Underground", date_str=date_str)
+                 for station_id, files in (self.csv_files or {}).items() for date_str, path in files.items()]
+        if self.json_file:
+            tasks.append(SourceTask('json', self.json_file, source="Infoclimat"))
+        if self.workers:
+            tasks.sort(key=lambda task: -etl_meteo._file_size(task.path))
+        return tasks
+
+    def source_tasks(self, metrics=None):
+        """Tâches de l'exécution : fichiers découverts dans `data_dir`, sinon fichiers des réglages, sinon fichiers configurés."""
+        if self.data_dir is not None:
+            registry = SourceRegistry(self.data_dir)
+            with (metrics or RunMetrics()).stage("Découverte des sources"):
+                scan = registry.scan()
+            registry.print_summary(scan)
+            return registry.tasks(largest_first=bool(self.workers))
+        return self.configured_tasks() or etl_meteo.build_source_tasks(largest_first=bool(self.workers))
+
+def _parse_env_value(f, raw):
+    """Convertit une variable d'environnement selon le type du champ (dictionnaires en JSON)."""
+    if f.type is bool:
+        return raw.strip().lower() in TRUE_VALUES
+    if f.type is int:
+        return int(raw)
+    if f.type is dict:
+        return json.loads(raw)
+    return raw
+
+
+# --- Étapes ---
+
+def normalize_stages(stages):
+    """Valide les étapes demandées et les renvoie dans l'ordre du pipeline."""
+    unknown = set(stages) - set(STAGES)
+    if unknown or not stages:
+        raise ValueError(f"Étape(s) inconnue(s) : {', '.join(sorted(unknown)) or '(aucune)'} ({', '.join(STAGES)})")
+    return tuple(stage for stage in STAGES if stage in stages)
+
+def iter_extracted_batches(settings, tasks, cache, metrics):
+    """Lots transformés de toutes les tâches : extraction séquentielle, ou parallèle sur `settings.workers` workers."""
+    if not settings.workers:
+        yield from etl_meteo.iter_all_source_batches(settings.chunksize, cache, tasks, metrics)
+        return
+    print(f"--- ⏳ PHASE 1-2: Traitement parallèle de {len(tasks)} fichiers sources ({settings.workers} workers, pool '{settings.executor}') ---")
+    with metrics.stage("Extraction + transformation") as stage:
+        results = etl_meteo.run_parallel_extraction(tasks, settings.workers, settings.executor, settings.chunksize, cache)
+        stage.rows += sum(result.rows for result in results)
+    for result in results:
+        metrics.add_file(result.file_stats or FileStats(result.task.path, result.task.kind, error=result.error))
+        yield from result.batches
+
+def extract_to_cache(settings, metrics):
+    """Étape d'extraction seule : transforme les fichiers sources et remplit le cache, sans contacter MongoDB."""
+    cache = TransformCache(settings.cache_dir)
+    tasks = settings.source_tasks(metrics)
+    print(f"--- 💾 EXTRACTION SEULE : {len(tasks)} fichier(s) source(s) transformé(s) vers le cache {cache.cache_dir} ---")
+    rows = sum(len(batch) for batch in iter_extracted_batches(settings, tasks, cache, metrics))
+    cached = sum(1 for stats in metrics.files if not stats.error)
+    print(f"\n--- ✅ {rows} enregistrements transformés ; {cached}/{len(tasks)} fichier(s) en cache ---")
+    return rows
+
+def dry_run(settings, metrics):
+    """Mesure de débit à blanc : extraction, contrôles en ligne, anomalies, agrégats et conversion en documents, sans MongoDB."""
+    cache = TransformCache(settings.cache_dir) if settings.use_cache else None
+    tasks = settings.source_tasks(metrics)
+    if settings.flag_anomalies:
+        tasks = etl_meteo.chronological_tasks(tasks)   # Relevés de chaque station dans l'ordre (AnomalyDetector.update)
+    print(f"--- 🧪 MODE À BLANC : {len(tasks)} fichier(s) source(s), MongoDB n'est pas contacté ---")
+    quality = StreamingQualityAudit(NUMERIC_FIELDS)
+    integrity = FinalIntegrityCheck()
+    rollup = DailyRollup()
+    anomalies = AnomalyDetector() if settings.flag_anomalies else None
+    for batch in iter_extracted_batches(settings, tasks, cache, metrics):
+        with metrics.stage("Intégrité + audit en ligne", rows=len(batch)):
+            batch = rollup.update(integrity.update(quality.update(batch)))
+        if anomalies is not None:
+            with metrics.stage("Détection d'anomalies", rows=len(batch)):
+                batch = anomalies.update(batch)
+        # Conversion en documents MongoDB (coût du chargement côté client), documents aussitôt abandonnés
+        with metrics.stage("Conversion en documents") as stage:
+            for documents in etl_meteo.iter_document_batches([batch]):
+                stage.rows += len(documents)
+    if settings.daily_rollup:
+        with metrics.stage("Agrégats journaliers", rows=rollup.touched):
+            rollup.result()
+    print(f"\n--- ✅ PHASE 3: Données unifiées : {integrity.total} enregistrements totaux ---")
+    if integrity.total:
+        integrity.report()
+        etl_meteo.report_inline_audit(quality)
+        if anomalies is not None:
+            anomalies.report()
+    return integrity.total
+
+def audit_only(settings, metrics):
+    """Étape d'audit seule : relecture de la collection MongoDB déjà chargée."""
+    with metrics.stage("Audit"):
+        report = etl_meteo.audit_mongodb_data(settings.storage)
+    if report is not None:
+        metrics.stages["Audit"].rows += report.total_documents
+    return report
+
+def run_pipeline(settings=None, stages=STAGES, dry=False):
+    """Exécute les étapes demandées avec les réglages `settings` (par défaut : PipelineSettings.load()).
+
+    - 'extract' seul remplit le cache des fichiers transformés ;
+    - 'load' sans 'extract' charge depuis le cache (un fichier absent du cache est signalé et ignoré) ;
+    - 'audit' seul relit la collection MongoDB ; avec 'load', il ajoute l'audit en ligne (et la relecture si `post_load_audit`).
+    `dry` remplace toutes les étapes par une mesure de débit sans MongoDB. Renvoie les RunMetrics de l'exécution.
+    """
+    settings = settings or PipelineSettings.load()
+    stages = normalize_stages(stages)
+    with settings.applied():
+        if 'load' in stages and not dry:
+            cache = None
+            if 'extract' not in stages:
+                cache = TransformCache(settings.cache_dir, cache_only=True)
+            elif settings.use_cache:
+                cache = TransformCache(settings.cache_dir)
+            return etl_meteo.run_full_etl(
+                streaming=settings.streaming, chunksize=settings.chunksize, workers=settings.workers or None,
+                executor=settings.executor, load_mode=settings.load_mode,
+                verify_after_load=settings.post_load_audit and 'audit' in stages, use_cache=cache is not None,
+                data_dir=settings.data_dir, storage=settings.storage, daily_rollup=settings.daily_rollup,
+                metrics_file=settings.metrics_file, prometheus_file=settings.prometheus_file, profile=settings.profile,
+                async_io=settings.async_io, flag_anomalies=settings.flag_anomalies, tasks=None if settings.data_dir else settings.configured_tasks(), cache=cache)
+
+        metrics = RunMetrics(settings.profile).start()
+        try:
+            if dry:
+                dry_run(settings, metrics)
+            else:
+                if 'extract' in stages:
+                    extract_to_cache(settings, metrics)
+                if 'audit' in stages:
+                    audit_only(settings, metrics)
+        finally:
+            metrics.stop()
+            etl_meteo.emit_run_metrics(metrics, settings.metrics_file, settings.prometheus_file)
+        return metrics
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Exécution configurable du pipeline E-T-L météo (étapes au choix).")
+    parser.add_argument('--config', help=f"Fichier de configuration JSON (par défaut : ${CONFIG_ENV_VAR}).")
+    selection = parser.add_mutually_exclusive_group()
+    selection.add_argument('--stages', nargs='+', choices=STAGES, default=list(STAGES), help="Étapes à exécuter.")
+    selection.add_argument('--extract-only', dest='stages', action='store_const', const=['extract'],
+                           help="Transforme les fichiers sources vers le cache, sans MongoDB.")
+    selection.add_argument('--load-only', dest='stages', action='store_const', const=['load'],
+                           help="Charge dans MongoDB les fichiers transformés depuis le cache.")
+    selection.add_argument('--audit-only', dest='stages', action='store_const', const=['audit'],
+                           help="Audite la collection MongoDB déjà chargée.")
+    parser.add_argument('--dry-run', action='store_true', help="Mesure le débit de l'extraction et de la transformation sans MongoDB.")
+    parser.add_argument('--data-dir', help="Découvre les fichiers sources dans ce répertoire.")
+    parser.add_argument('--storage', choices=list(etl_meteo.STORAGE_COLLECTIONS), help="Disposition de stockage MongoDB.")
+    parser.add_argument('--mode', dest='load_mode', choices=['full', 'incremental'], help="Mode de chargement.")
+    parser.add_argument('--workers', type=int, help="Extraction parallèle sur ce nombre de workers (0 = séquentielle).")
+    parser.add_argument('--streaming', action='store_true', default=None, help="Chargement au fil de l'eau.")
+    parser.add_argument('--metrics-file', help="Écrit les mesures de l'exécution (JSON) dans ce fichier.")
+    parser.add_argument('--print-settings', action='store_true', help="Affiche les réglages effectifs et s'arrête.")
+    args = parser.parse_args()
+
+    settings = PipelineSettings.load(args.config, data_dir=args.data_dir, storage=args.storage, load_mode=args.load_mode,
+                                     workers=args.workers, streaming=args.streaming, metrics_file=args.metrics_file)
+    if args.print_settings:
+        print(json.dumps(settings.to_dict(), indent=2, ensure_ascii=False))
+    else:
+        run_pipeline(settings, args.stages, dry=args.dry_run)
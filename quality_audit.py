@@ -1,9 +1,17 @@
+import os
+import time
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+from pandas.api.extensions import ExtensionDtype
+from pandas.api.types import infer_dtype, is_bool_dtype, is_numeric_dtype
 from pymongo import MongoClient
 from pymongo.errors import ConnectionFailure
 
-# --- Configuration MongoDB ---
-MONGO_URI = "mongodb://localhost:27017/" 
-MONGO_DATABASE = "meteo_projet"          
+# --- Configuration MongoDB --- (variables d'environnement MONGO_URI / MONGO_DATABASE, comme etl_meteo.py)
+MONGO_URI = os.environ.get("MONGO_URI", "mongodb://localhost:27017/")
+MONGO_DATABASE = os.environ.get("MONGO_DATABASE", "meteo_projet")
 MONGO_COLLECTION = "donnees_horaires"
 
 # --- Contraintes de Qualité ---
@@ -15,66 +23,420 @@ QUALITY_CONSTRAINTS = {
     "vent_vitesse_ms": {"min": 0.0, "max": 50.0}
 }
 
-def calculate_error_rate():
-    """Se connecte à MongoDB et calcule le taux d'anomalies des données."""
-    
-    print(f"--- 📊 CALCUL DU TAUX D'ERREUR DE QUALITÉ dans '{MONGO_DATABASE}' ---")
+# Champs numériques audités (nulles, types, NaN)
+AUDITED_FIELDS = ['temperature_c', 'humidite_pct', 'pression_hpa', 'vent_vitesse_ms', 'pluie_accum_mm']
 
-    try:
-        # 1. Connexion à MongoDB
-        client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
-        client.admin.command('ping') 
-        db = client[MONGO_DATABASE]
-        collection = db[MONGO_COLLECTION]
-        
-        total_documents = collection.count_documents({})
-        if total_documents == 0:
-            print("❌ ERREUR: La collection est vide. Impossible de calculer le taux d'erreur.")
-            client.close()
-            return
+# --- Anomalies temporelles (par station, relevés triés par date) ---
+# Variation maximale admise entre deux relevés consécutifs, par heure écoulée (au moins une heure : un relevé à 5 min
+# ne peut pas varier davantage qu'en une heure)
+SPIKE_MAX_CHANGE_PER_HOUR = {"temperature_c": 8.0, "humidite_pct": 40.0, "pression_hpa": 6.0, "vent_vitesse_ms": 15.0}
+# Durée minimale (heures) d'une valeur strictement constante signalant un capteur bloqué
+FLATLINE_MIN_HOURS = {"temperature_c": 6.0, "humidite_pct": 12.0, "pression_hpa": 6.0, "vent_vitesse_ms": 12.0}
+GAP_MAX_INTERVAL_HOURS = 1.5   # Écart au relevé précédent au-delà duquel au moins une heure de relevés manque
+QUALITY_FLAGS_FIELD = "drapeaux_qualite"   # Masque de bits des anomalies, écrit avec chaque document
 
-        anomalies_found = 0
-        
-        print(f"-> Total des enregistrements vérifiés : {total_documents}")
-        print("\n-> Vérification des plages de valeurs (Contrôles de Validité) :")
-        
-        # 2. Itération sur les contraintes et Agrégation
-        for field, constraint in QUALITY_CONSTRAINTS.items():
-            
-            # La requête trouve les documents où le champ est en dehors de [min, max]
-            query = {
-                "$or": [
-                    {field: {"$lt": constraint["min"]}}, # Inférieur au minimum
-                    {field: {"$gt": constraint["max"]}}  # Supérieur au maximum
-                ]
-            }
-            
-            anomalous_count = collection.count_documents(query)
-            anomalies_found += anomalous_count
-
-            if anomalous_count > 0:
-                print(f"   ❌ {field.upper()} : {anomalous_count} anomalies trouvées (hors de [{constraint['min']}, {constraint['max']}]).")
+def _build_quality_flags():
+    names = ["trou_horaire"]
+    for name in dict.fromkeys(list(SPIKE_MAX_CHANGE_PER_HOUR) + list(FLATLINE_MIN_HOURS) + list(QUALITY_CONSTRAINTS)):
+        names += [f"{kind}_{name}" for kind, rules in (("pic", SPIKE_MAX_CHANGE_PER_HOUR), ("plat", FLATLINE_MIN_HOURS),
+                                                        ("hors_plage", QUALITY_CONSTRAINTS)) if name in rules]
+    return {name: 1 << bit for bit, name in enumerate(names)}
+
+# Nom du drapeau -> bit de QUALITY_FLAGS_FIELD (requête MongoDB : {"drapeaux_qualite": {"$bitsAnySet": bit}})
+QUALITY_FLAGS = _build_quality_flags()
+
+NAN = float('nan')
+
+# Résultats de pandas.api.types.infer_dtype pour lesquels une colonne ne contient que des nombres
+NUMERIC_INFERRED_TYPES = ('floating', 'integer', 'mixed-integer-float', 'decimal', 'empty')
+
+
+# --- Moteur d'audit en une seule passe d'agrégation ---
+
+@dataclass
+class FieldAudit:
+    """Résultat de l'audit d'un champ numérique."""
+    field: str
+    nulls: int = 0            # Valeur null ou champ absent
+    nans: int = 0             # Valeur NaN (nombre non renseigné)
+    strings: int = 0          # Chaîne de caractères au lieu d'un nombre
+    non_numeric: int = 0      # Tout type non numérique hors null (chaînes incluses)
+    out_of_range: int = None  # Hors de [min, max] (None si aucune contrainte)
+    constraint: dict = None
+
+@dataclass
+class AuditReport:
+    """Résultat structuré d'un audit de collection."""
+    total_documents: int = 0
+    fields: dict = field(default_factory=dict)
+    min_date: object = None
+    max_date: object = None
+    elapsed: float = 0.0
+    quality_flags: dict = field(default_factory=dict)   # Drapeau d'anomalie -> nombre de documents signalés
+
+    @property
+    def range_anomalies(self):
+        return sum(f.out_of_range or 0 for f in self.fields.values())
+
+    @property
+    def error_rate(self):
+        """Taux d'anomalies de plage (%) rapporté au nombre total de documents."""
+        return (self.range_anomalies / self.total_documents) * 100 if self.total_documents else 0.0
+
+    @property
+    def passed(self):
+        """Vrai si aucun champ ne contient de valeur nulle ni de type incorrect."""
+        return all(f.nulls == 0 and f.strings == 0 for f in self.fields.values())
+
+def _is_number(expr):
+    return {"$isNumber": expr}
+
+def build_audit_pipeline(fields=AUDITED_FIELDS, constraints=QUALITY_CONSTRAINTS, pre_pipeline=()):
+    """Construit le pipeline d'agrégation qui calcule tous les compteurs de l'audit en un seul $group."""
+    def count_if(condition):
+        return {"$sum": {"$cond": [condition, 1, 0]}}
+
+    group = {"_id": None, "total": {"$sum": 1},
+             "min_date": {"$min": "$date_heure_utc"}, "max_date": {"$max": "$date_heure_utc"}}
+    for name in dict.fromkeys(list(fields) + list(constraints)):
+        value = f"${name}"
+        is_null = {"$eq": [{"$ifNull": [value, None]}, None]}
+        group[f"nulls_{name}"] = count_if(is_null)
+        # MongoDB considère NaN égal à NaN dans les expressions d'agrégation
+        group[f"nans_{name}"] = count_if({"$and": [_is_number(value), {"$eq": [value, NAN]}]})
+        # Les chaînes se situent entre les nombres et les objets dans l'ordre de comparaison BSON
+        group[f"strings_{name}"] = count_if({"$and": [{"$gte": [value, ""]}, {"$lt": [value, {}]}]})
+        group[f"nonnum_{name}"] = count_if({"$and": [{"$eq": [is_null, False]}, {"$eq": [_is_number(value), False]}]})
+        if name in constraints:
+            bounds = constraints[name]
+            group[f"range_{name}"] = count_if({"$and": [
+                _is_number(value), {"$ne": [value, NAN]},
+                {"$or": [{"$lt": [value, bounds["min"]]}, {"$gt": [value, bounds["max"]]}]},
+            ]})
+    # Drapeaux d'anomalies : bit testé par division entière ($bitAnd n'existe qu'à partir de MongoDB 6.3)
+    mask = {"$cond": [_is_number(f"${QUALITY_FLAGS_FIELD}"), f"${QUALITY_FLAGS_FIELD}", 0]}
+    for name, bit in QUALITY_FLAGS.items():
+        group[f"flag_{name}"] = count_if({"$eq": [{"$mod": [{"$floor": {"$divide": [mask, bit]}}, 2]}, 1]})
+    return list(pre_pipeline) + [{"$group": group}]
+
+def run_audit(collection, fields=AUDITED_FIELDS, constraints=QUALITY_CONSTRAINTS, pre_pipeline=()):
+    """Audite la collection (nulles, NaN, types, plages) en une seule passe et renvoie un AuditReport."""
+    start = time.perf_counter()
+    results = list(collection.aggregate(build_audit_pipeline(fields, constraints, pre_pipeline), allowDiskUse=True))
+    report = _report_from_row(results[0] if results else {}, fields, constraints)
+    report.elapsed = time.perf_counter() - start
+    return report
+
+async def run_audit_async(collection, fields=AUDITED_FIELDS, constraints=QUALITY_CONSTRAINTS, pre_pipeline=()):
+    """Variante asynchrone de run_audit (collection PyMongo asynchrone) : la même agrégation unique, attendue sans
+    bloquer la boucle d'événements (les autres tâches, comme l'écriture des agrégats, avancent pendant l'audit).
+    """
+    start = time.perf_counter()
+    cursor = await collection.aggregate(build_audit_pipeline(fields, constraints, pre_pipeline), allowDiskUse=True)
+    results = await cursor.to_list(None)
+    report = _report_from_row(results[0] if results else {}, fields, constraints)
+    report.elapsed = time.perf_counter() - start
+    return report
+
+def _report_from_row(row, fields, constraints):
+    report = AuditReport()
+    report.total_documents = row.get("total", 0)
+    report.min_date = row.get("min_date")
+    report.max_date = row.get("max_date")
+    report.quality_flags = {name: row.get(f"flag_{name}", 0) for name in QUALITY_FLAGS}
+    for name in dict.fromkeys(list(fields) + list(constraints)):
+        report.fields[name] = FieldAudit(
+            field=name,
+            nulls=row.get(f"nulls_{name}", 0),
+            nans=row.get(f"nans_{name}", 0),
+            strings=row.get(f"strings_{name}", 0),
+            non_numeric=row.get(f"nonnum_{name}", 0),
+            out_of_range=row.get(f"range_{name}") if name in constraints else None,
+            constraint=constraints.get(name),
+        )
+    return report
+
+# --- Audit en ligne : mêmes compteurs, calculés lot par lot pendant la transformation ---
+
+class StreamingQualityAudit:
+    """Calcule les compteurs d'un AuditReport de façon incrémentale sur les lots transformés (sans relire MongoDB).
+
+    Les lots peuvent être des DataFrames nettoyés ou des listes de documents ; les valeurs sont
+    évaluées telles qu'elles seront stockées (None -> null, NaN -> NaN).
+    """
+
+    def __init__(self, fields=AUDITED_FIELDS, constraints=QUALITY_CONSTRAINTS):
+        self.constraints = constraints
+        self.start = time.perf_counter()
+        self.report = AuditReport()
+        for name in dict.fromkeys(list(fields) + list(constraints)):
+            self.report.fields[name] = FieldAudit(field=name, out_of_range=0 if name in constraints else None,
+                                                  constraint=constraints.get(name))
+
+    def update(self, batch):
+        """Ajoute un lot (DataFrame ou liste de documents) aux compteurs."""
+        if isinstance(batch, pd.DataFrame):
+            columns = {name: batch[name] if name in batch.columns else None for name in self.report.fields}
+            dates = batch['date_heure_utc'] if 'date_heure_utc' in batch.columns else None
+            size = len(batch)
+        else:
+            batch = list(batch)
+            columns = {name: pd.Series([doc.get(name) for doc in batch], dtype=object) for name in self.report.fields}
+            dates = pd.Series([doc.get('date_heure_utc') for doc in batch], dtype=object)
+            size = len(batch)
+
+        self.report.total_documents += size
+        for name, values in columns.items():
+            self._update_field(self.report.fields[name], values, size)
+        self._update_dates(dates)
+        return batch
+
+    def _update_field(self, audit, values, size):
+        if values is None:
+            audit.nulls += size  # Champ absent de tous les documents du lot
+            return
+        if isinstance(values.dtype, ExtensionDtype) and values.dtype.kind in 'iuf':
+            # Colonne nullable (Float64/Int64) : <NA> sera stocké comme null, NaN reste NaN
+            is_null = values.isna().to_numpy()
+            numbers = pd.Series(values.to_numpy(dtype='float64', na_value=np.nan), index=values.index)
+            audit.nulls += int(is_null.sum())
+            audit.nans += int((numbers.isna().to_numpy() & ~is_null).sum())
+        elif is_numeric_dtype(values) and not is_bool_dtype(values):
+            # Colonne typée : les valeurs manquantes seront stockées comme NaN
+            numbers = values.astype('float64')
+            audit.nans += int(numbers.isna().sum())
+        else:
+            cells = values.to_numpy(dtype=object)
+            is_null = cells == None  # noqa: E711 (comparaison élément par élément)
+            if infer_dtype(values, skipna=True) in NUMERIC_INFERRED_TYPES:
+                is_number = ~is_null
             else:
-                print(f"   ✅ {field.upper()} : 0 violation. (Plage [{constraint['min']}, {constraint['max']}])")
+                # Chemin rare : types mélangés, chaque valeur est inspectée
+                is_number = np.array([isinstance(v, (int, float, np.number)) and not isinstance(v, (bool, np.bool_)) for v in cells], dtype=bool)
+                audit.strings += sum(isinstance(v, str) for v in cells)
+                audit.non_numeric += int((~is_number & ~is_null & ~pd.isna(cells)).sum())
+            numbers = pd.to_numeric(values.where(is_number), errors='coerce').astype('float64')
+            audit.nulls += int(is_null.sum())
+            audit.nans += int((is_number & numbers.isna().to_numpy()).sum())
 
+        if audit.constraint is not None:
+            audit.out_of_range += int(((numbers < audit.constraint['min']) | (numbers > audit.constraint['max'])).sum())
 
-        # 3. Calcul du Taux d'Erreur Final
-        if total_documents > 0:
-            error_rate = (anomalies_found / total_documents) * 100
+    def _update_dates(self, dates):
+        if dates is None:
+            return
+        dates = dates.dropna()
+        if dates.empty:
+            return
+        low, high = dates.min(), dates.max()
+        self.report.min_date = low if self.report.min_date is None else min(self.report.min_date, low)
+        self.report.max_date = high if self.report.max_date is None else max(self.report.max_date, high)
+
+    def result(self):
+        """Renvoie l'AuditReport courant."""
+        self.report.elapsed = time.perf_counter() - self.start
+        return self.report
+
+# --- Détection vectorisée des anomalies temporelles (pics, valeurs figées, trous horaires) ---
+
+def quality_flag_names(mask):
+    """Noms des drapeaux d'un masque QUALITY_FLAGS_FIELD."""
+    return [name for name, bit in QUALITY_FLAGS.items() if int(mask) & bit]
+
+class AnomalyDetector:
+    """Signale, relevé par relevé, les pics de variation, les valeurs figées et les trous horaires de chaque station.
+
+    Les relevés sont triés par (station, date) puis comparés à leur prédécesseur en une passe NumPy :
+    - pic : |Δvaleur| > SPIKE_MAX_CHANGE_PER_HOUR x max(Δt en heures, 1) ;
+    - valeur figée : série de valeurs identiques couvrant au moins FLATLINE_MIN_HOURS (tous les relevés de la série) ;
+    - trou horaire : Δt > GAP_MAX_INTERVAL_HOURS depuis le relevé précédent ;
+    - hors plage : valeur hors de QUALITY_CONSTRAINTS.
+    Le masque de bits est ajouté au lot dans QUALITY_FLAGS_FIELD. flag_frames() traite l'ensemble des lots d'un coup ;
+    update() traite un flux : le dernier relevé de chaque station est conservé pour comparer le lot suivant (les relevés
+    d'une série figée déjà chargés avant que sa durée n'atteigne le seuil ne sont pas signalés a posteriori).
+    """
+
+    def __init__(self, spike_rules=SPIKE_MAX_CHANGE_PER_HOUR, flatline_rules=FLATLINE_MIN_HOURS, constraints=QUALITY_CONSTRAINTS,
+                 gap_hours=GAP_MAX_INTERVAL_HOURS):
+        self.spike_rules = spike_rules
+        self.flatline_rules = flatline_rules
+        self.constraints = constraints
+        self.gap_hours = gap_hours
+        self.fields = list(dict.fromkeys(list(spike_rules) + list(flatline_rules) + list(constraints)))
+        self.counts = dict.fromkeys(QUALITY_FLAGS, 0)
+        self.total = 0
+        self.flagged = 0
+        self.missing_hours = 0
+        self._last = {}   # station -> (date en ns, {champ: valeur}, {champ: début de la série de valeurs identiques})
+
+    def update(self, batch):
+        """Ajoute QUALITY_FLAGS_FIELD à un lot (DataFrame ou liste de documents) ; renvoie un DataFrame."""
+        df = batch if isinstance(batch, pd.DataFrame) else pd.DataFrame(batch)
+        if df.empty or 'date_heure_utc' not in df.columns:
+            return df
+        flags = self._detect(df['id_station'].to_numpy(dtype=object), pd.to_datetime(df['date_heure_utc']).to_numpy('datetime64[ns]'),
+                             {name: self._values(df, name) for name in self.fields})
+        return df.assign(**{QUALITY_FLAGS_FIELD: flags})
+
+    def flag_frames(self, frames):
+        """Signale les anomalies de tous les lots en une seule passe triée ; renvoie les lots complétés (même ordre)."""
+        frames = [frame if isinstance(frame, pd.DataFrame) else pd.DataFrame(frame) for frame in frames]
+        sizes = [len(frame) for frame in frames]
+        if not sum(sizes):
+            return frames
+        flags = self._detect(np.concatenate([frame['id_station'].to_numpy(dtype=object) for frame in frames]),
+                             np.concatenate([pd.to_datetime(frame['date_heure_utc']).to_numpy('datetime64[ns]') for frame in frames]),
+                             {name: np.concatenate([self._values(frame, name) for frame in frames]) for name in self.fields})
+        parts = np.split(flags, np.cumsum(sizes)[:-1])
+        return [frame.assign(**{QUALITY_FLAGS_FIELD: part}) for frame, part in zip(frames, parts)]
+
+    @staticmethod
+    def _values(df, name):
+        if name not in df.columns:
+            return np.full(len(df), np.nan)
+        return pd.to_numeric(df[name], errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+
+    def _detect(self, stations, times, values):
+        """Masques de drapeaux (ordre d'origine) ; les relevés conservés des lots précédents précèdent ceux du lot."""
+        n = len(stations)
+        times = times.astype('int64')
+        # Relevé précédent de chaque station, s'il est antérieur à tout le lot (sinon le lot ouvre un nouveau segment)
+        batch_start = pd.Series(times).groupby(stations).min()
+        carried = [(station, *self._last[station]) for station, start in batch_start.items()
+                   if station in self._last and self._last[station][0] < start]
+        stations = np.concatenate([np.array([c[0] for c in carried], dtype=object), stations])
+        times = np.concatenate([np.array([c[1] for c in carried], dtype='int64'), times])
+        values = {name: np.concatenate([[c[2][name] for c in carried], v]) for name, v in values.items()}
+        is_carried = np.arange(len(stations)) < len(carried)
+
+        codes, labels = pd.factorize(stations)
+        order = np.lexsort((times, codes))
+        codes, times, is_carried = codes[order], times[order], is_carried[order]
+        same = np.r_[False, codes[1:] == codes[:-1]]
+        hours = np.r_[0, np.diff(times)] / 3.6e12
+        flags = np.zeros(len(order), dtype=np.int32)
+
+        gaps = same & (hours > self.gap_hours)
+        flags[gaps] |= QUALITY_FLAGS["trou_horaire"]
+        self.missing_hours += int(np.maximum(np.round(hours[gaps]) - 1, 1).sum())
+
+        last = np.flatnonzero(np.r_[codes[1:] != codes[:-1], True])   # Dernier relevé de chaque station
+        run_starts = {}
+        for name in self.fields:
+            v = values[name][order]
+            previous = np.r_[np.nan, v[:-1]]
+            if name in self.spike_rules:
+                flags[same & (np.abs(v - previous) > self.spike_rules[name] * np.maximum(hours, 1.0))] |= QUALITY_FLAGS[f"pic_{name}"]
+            if name in self.flatline_rules:
+                new_run = ~(same & (v == previous))
+                run_id = np.cumsum(new_run) - 1
+                first = np.flatnonzero(new_run)
+                start = times.copy()
+                for pos in np.flatnonzero(is_carried):
+                    start[pos] = self._last[labels[codes[pos]]][2][name]   # Début de la série dans les lots précédents
+                run_start = start[first]
+                duration = np.maximum.reduceat(times, first) - run_start
+                frozen = (duration >= self.flatline_rules[name] * 3.6e12) & ~np.isnan(v[first])
+                flags[frozen[run_id]] |= QUALITY_FLAGS[f"plat_{name}"]
+                run_starts[name] = run_start[run_id[last]]
+            if name in self.constraints:
+                bounds = self.constraints[name]
+                flags[(v < bounds['min']) | (v > bounds['max'])] |= QUALITY_FLAGS[f"hors_plage_{name}"]
+            values[name] = v
+
+        for i, pos in enumerate(last):
+            self._last[labels[codes[pos]]] = (int(times[pos]), {name: values[name][pos] for name in self.fields},
+                                              {name: int(run_starts[name][i]) if name in run_starts else int(times[pos])
+                                               for name in self.fields})
+
+        result = np.zeros(n, dtype=np.int32)
+        result[order[~is_carried] - len(carried)] = flags[~is_carried]
+        self.total += n
+        self.flagged += int((result != 0).sum())
+        for name, bit in QUALITY_FLAGS.items():
+            self.counts[name] += int(np.count_nonzero(result & bit))
+        return result
+
+    def report(self):
+        """Affiche le nombre de relevés signalés par type d'anomalie."""
+        print("\n--- 🩺 Anomalies temporelles (par station) ---")
+        print(f"-> Relevés signalés : {self.flagged} sur {self.total} ({QUALITY_FLAGS_FIELD})")
+        for kind, title in (("pic", "Pics de variation"), ("plat", "Valeurs figées"), ("hors_plage", "Hors plage")):
+            counts = {name[len(kind) + 1:]: n for name, n in self.counts.items() if name.startswith(kind + "_") and n}
+            print(f"-> {title:<18} : " + (", ".join(f"{name} {n}" for name, n in counts.items()) or "aucun"))
+        print(f"-> Trous horaires   : {self.counts['trou_horaire']} (≈ {self.missing_hours} heure(s) manquante(s))")
+        print("-----------------------------------------------")
+
+def count_quality_flags(collection, pre_pipeline=()):
+    """Compte les documents MongoDB par drapeau d'anomalie en une seule agrégation (regroupement par masque)."""
+    counts = dict.fromkeys(QUALITY_FLAGS, 0)
+    pipeline = list(pre_pipeline) + [{"$match": {QUALITY_FLAGS_FIELD: {"$gt": 0}}},
+                                     {"$group": {"_id": f"${QUALITY_FLAGS_FIELD}", "n": {"$sum": 1}}}]
+    for row in collection.aggregate(pipeline):
+        for name in quality_flag_names(row["_id"]):
+            counts[name] += row["n"]
+    return counts
+
+def print_range_report(report):
+    """Affiche les violations de plage et le taux d'erreur d'un AuditReport."""
+    print(f"-> Total des enregistrements vérifiés : {report.total_documents}")
+    print("\n-> Vérification des plages de valeurs (Contrôles de Validité) :")
+    for name, audit in report.fields.items():
+        if audit.constraint is None:
+            continue
+        constraint = audit.constraint
+        if audit.out_of_range > 0:
+            print(f"   ❌ {name.upper()} : {audit.out_of_range} anomalies trouvées (hors de [{constraint['min']}, {constraint['max']}]).")
         else:
-            error_rate = 0.0
+            print(f"   ✅ {name.upper()} : 0 violation. (Plage [{constraint['min']}, {constraint['max']}])")
+
+    print("\n------------------------------------------------------")
+    print(f"-> Nombre total d'anomalies de plage trouvées : {report.range_anomalies}")
+    print(f"-> TAUX D'ERREUR DE QUALITÉ (Anomalies de Plage) : {report.error_rate:.2f}%")
+    print("------------------------------------------------------")
+
+
+def calculate_error_rate(client=None, database=None, collection_name=MONGO_COLLECTION, pre_pipeline=()):
+    """Se connecte à MongoDB et calcule le taux d'anomalies des données.
 
-        print("\n------------------------------------------------------")
-        print(f"-> Nombre total d'anomalies de plage trouvées : {anomalies_found}")
-        print(f"-> TAUX D'ERREUR DE QUALITÉ (Anomalies de Plage) : {error_rate:.2f}%")
-        print("------------------------------------------------------")
+    Avec `client`, le client (poolé) de l'appelant est réutilisé et n'est pas fermé. `database` (défaut : MONGO_DATABASE),
+    `collection_name` et `pre_pipeline` désignent la collection d'une autre base ou disposition de stockage
+    et les étapes qui la ramènent à plat.
+    """
+    database = database or MONGO_DATABASE
+    print(f"--- 📊 CALCUL DU TAUX D'ERREUR DE QUALITÉ dans '{database}' ---")
+
+    own_client = client is None
+    try:
+        # 1. Connexion à MongoDB
+        if own_client:
+            client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
+            client.admin.command('ping') 
+        db = client[database]
+        collection = db[collection_name]
         
-        client.close()
+        # 2. Audit complet (plages, nulles, types) en une seule passe d'agrégation
+        report = run_audit(collection, fields=list(QUALITY_CONSTRAINTS), pre_pipeline=pre_pipeline)
+        if report.total_documents == 0:
+            print("❌ ERREUR: La collection est vide. Impossible de calculer le taux d'erreur.")
+            return None
+
+        # 3. Calcul du Taux d'Erreur Final
+        print_range_report(report)
+
+        # 4. Anomalies temporelles signalées au chargement (comptées dans la même passe)
+        flagged = {name: n for name, n in report.quality_flags.items() if n}
+        if flagged:
+            print("-> Relevés signalés par drapeau (" + QUALITY_FLAGS_FIELD + ") : " + ", ".join(f"{name} {n}" for name, n in flagged.items()))
+        return report
 
     except ConnectionFailure:
         print("\n❌ ERREUR DE CONNEXION: Assurez-vous que votre serveur MongoDB est démarré.")
     except Exception as e:
         print(f"\n❌ ERREUR LORS DU CALCUL : {e}")
+    finally:
+        if own_client and client is not None:
+            client.close()
 
 if __name__ == "__main__":
     calculate_error_rate()
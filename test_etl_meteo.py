@@ -1,4 +1,5 @@
 import unittest
+from datetime import datetime
 # CORRECTION D'IMPORTATION : Importe le module entier pour modifier ses variables internes
 import etl_meteo 
 from pymongo import MongoClient
@@ -81,12 +82,13 @@ class TestETLPipeline(unittest.TestCase):
         self.assertTrue(results, "L'agrégation des dates n'a retourné aucun résultat.")
         
         result = results[0]
-        min_date_str = result['min_date']
-        max_date_str = result['max_date']
+        min_date = result['min_date']
+        max_date = result['max_date']
 
-        # Vérifie que les dates extrêmes se situent bien dans la période 01/10 au 07/10
-        self.assertIn('2024-10-01', min_date_str, "La date minimale ne correspond pas au début de la période attendue.")
-        self.assertIn('2024-10-07', max_date_str, "La date maximale ne correspond pas à la fin de la période attendue.")
+        # Les dates sont stockées en datetime UTC : minuit heure de Paris/Bruxelles le 01/10 correspond à 22h UTC le 30/09
+        self.assertIsInstance(min_date, datetime, "date_heure_utc n'est pas stockée comme une date BSON.")
+        self.assertTrue(datetime(2024, 9, 30, 22) <= min_date < datetime(2024, 10, 2), "La date minimale ne correspond pas au début de la période attendue.")
+        self.assertTrue(datetime(2024, 10, 7) <= max_date < datetime(2024, 10, 8), "La date maximale ne correspond pas à la fin de la période attendue.")
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
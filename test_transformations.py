@@ -0,0 +1,1190 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+from contextlib import ExitStack
+from datetime import datetime
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+try:
+    import mongomock
+except ImportError:  # mongomock est optionnel : les tests de chargement sont alors ignorés
+    mongomock = None
+
+import etl_meteo
+import instrumentation
+import pipeline_runner
+import quality_audit
+from benchmark_etl import compare_benchmark_results, load_benchmark_results, run_benchmark_suite
+from testing_support import (frames_identical, generate_synthetic_dataset, legacy_clean_and_convert_csv_df, legacy_clean_and_convert_json,
+                             legacy_final_integrity_stats, make_synthetic_measures, make_synthetic_wu_frame, mongomock_compat,
+                             write_synthetic_infoclimat_json, write_synthetic_wu_csv)
+
+_module_context = ExitStack()
+
+
+def setUpModule():
+    if mongomock is not None:
+        _module_context.enter_context(mongomock_compat())
+
+
+def tearDownModule():
+    _module_context.close()
+
+
+# --- Tests hors-ligne des transformations (aucun fichier source ni serveur MongoDB requis) ---
+
+
+class TestVectorizedCsvConversion(unittest.TestCase):
+
+    def test_01_identical_to_cell_by_cell_conversion(self):
+        """Vérifie que la conversion vectorisée produit exactement le même DataFrame que l'ancienne implémentation."""
+        df = make_synthetic_wu_frame(5000)
+        expected = legacy_clean_and_convert_csv_df(df, '1001', 'Weather Underground')
+        result = etl_meteo.clean_and_convert_csv_df(df, '1001', 'Weather Underground')
+        self.assertTrue(frames_identical(expected, result))
+
+    def test_02_edge_cases_match_clean_value(self):
+        """Vérifie les cas limites : unités collées, séparateurs, valeurs invalides, colonnes numériques ou vides."""
+        df = pd.DataFrame({
+            'Time': ['12:00 AM', '', None, '1:00 AM', '2:00 AM', '3:00 AM'],
+            'Temperature': ['5 0 °F', '1i n', '--', np.nan, '1_000', '-0 °F'],
+            'Humidity': [93, 94, 95, 96, 97, 98],
+            'Speed': ['m ph', '3,5 mph', 'nan', 'inf', '0 mph', '12mph'],
+            'Pressure': ['29,92 in', '30.01 in', '', '29.5in', '29 .9 in', '1e1 in'],
+            'Precip. Accum.': [np.nan] * 6,
+        })
+        df.name = '2024-10-01'
+        expected = legacy_clean_and_convert_csv_df(df, '1002', 'Weather Underground')
+        result = etl_meteo.clean_and_convert_csv_df(df, '1002', 'Weather Underground')
+        self.assertTrue(frames_identical(expected, result))
+
+
+class TestJsonConversion(unittest.TestCase):
+
+    def assertSameDocuments(self, expected, result):
+        # repr distingue None, NaN, 0 et 0.0 ainsi que les types int/float
+        self.assertEqual([repr(sorted(d.items())) for d in expected], [repr(sorted(d.items())) for d in result])
+
+    def test_01_columnar_conversion_matches_record_by_record(self):
+        """Vérifie que la conversion par colonnes produit exactement les mêmes documents que l'ancienne boucle."""
+        hourly = {
+            '07015': [
+                {'id_station': '07015', 'dh_utc': '2024-10-01 00:00:00', 'temperature': '12.3', 'humidite': '85', 'pression': '1013.2', 'vent_moyen': '18', 'pluie_1h': '0.4'},
+                {'id_station': '07015', 'dh_utc': '2024-10-01 01:00:00', 'temperature': '0', 'humidite': None, 'pression': '', 'vent_moyen': None, 'pluie_1h': None, 'pluie_3h': '1.2'},
+                {'id_station': '07015', 'dh_utc': '2024-10-01 02:00:00', 'temperature': 0, 'humidite': 85.7, 'pluie_3h': '1.2'},
+                {'id_station': '07015', 'dh_utc': '2024-10-01 03:00:00', 'temperature': 'nan', 'humidite': 90, 'pression': 1012.5, 'vent_moyen': 0, 'pluie_3h': None},
+                'valeur ignorée',
+            ],
+            '_params': ['temperature', 'pression'],
+            'meta': {'non': 'liste'},
+        }
+        self.assertSameDocuments(legacy_clean_and_convert_json(hourly), etl_meteo.clean_and_convert_json(hourly))
+
+    def test_02_streaming_reader_matches_full_load(self):
+        """Vérifie que le lecteur JSON incrémental (même avec de très petites lectures) retrouve tous les enregistrements."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = write_synthetic_infoclimat_json(os.path.join(tmpdir, 'infoclimat.json'), n_stations=3, n_hours=50)
+            expected = legacy_clean_and_convert_json(etl_meteo.read_full_json_file(path))
+            records = list(etl_meteo.iter_json_hourly_records(path, read_size=7))
+            self.assertEqual(len(records), 150)
+            self.assertSameDocuments(expected, etl_meteo.convert_json_records(records).to_dict('records'))
+
+            batches = list(etl_meteo.iter_json_batches(path, batch_size=40))
+            self.assertEqual([len(b) for b in batches], [40, 40, 40, 30])
+            self.assertSameDocuments(expected, [d for b in batches for d in etl_meteo.batch_to_documents(b)])
+
+
+class TestStreamingCsvExtraction(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.csv_path = write_synthetic_wu_csv(os.path.join(self.tmpdir.name, 'station - 011024.csv'), 1000)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_01_chunked_extraction_matches_full_read(self):
+        """Vérifie que la lecture par blocs produit les mêmes enregistrements qu'une lecture complète."""
+        files = {'2024-10-01': self.csv_path}
+        full = etl_meteo.extract_and_process_csv_from_disk(files, '1001', 'Weather Underground', chunksize=10_000)
+        chunked = etl_meteo.extract_and_process_csv_from_disk(files, '1001', 'Weather Underground', chunksize=77)
+        self.assertEqual(len(full), len(chunked))
+        self.assertEqual(pd.DataFrame(full).to_json(), pd.DataFrame(chunked).to_json())
+
+    def test_02_duplicates_detected_across_chunks(self):
+        """Vérifie que les doublons répartis sur plusieurs blocs sont comptés comme dans une vérification globale."""
+        batches = list(etl_meteo.iter_csv_batches({'2024-10-01': self.csv_path}, '1001', 'Weather Underground', chunksize=100))
+        self.assertGreater(len(batches), 1)
+
+        check = etl_meteo.StreamingIntegrityCheck()
+        for batch in batches:
+            check.update(batch)
+        full = pd.concat(batches)
+        # 1000 relevés toutes les 5 minutes : les horodatages se répètent à partir du 289e
+        self.assertEqual(check.doublons, full.duplicated(subset=['date_heure_utc']).sum())
+        self.assertGreater(check.doublons, 0)
+        self.assertEqual(check.manquants_critiques, full['temperature_c'].isnull().sum())
+
+
+class TestTimestampNormalization(unittest.TestCase):
+
+    def setUp(self):
+        etl_meteo._TIMESTAMP_FORMAT_CACHE.clear()
+
+    def test_01_local_station_times_converted_to_utc(self):
+        """Vérifie la conversion des heures locales Weather Underground en UTC (heure d'été et d'hiver)."""
+        df = pd.DataFrame({'date_heure_utc': ['2024-10-01 12:00 AM', '2024-10-01 1:30 PM', '2024-12-01 12:00 PM'], 'id_station': '1001'})
+        result = etl_meteo.normalize_timestamps(df, 'Weather Underground', '1001')
+        self.assertEqual(result['date_heure_utc'].dtype, 'datetime64[ns]')
+        self.assertEqual(list(result['date_heure_utc']), [pd.Timestamp('2024-09-30 22:00'), pd.Timestamp('2024-10-01 11:30'),
+                                                          pd.Timestamp('2024-12-01 11:00')])
+        self.assertEqual(etl_meteo._TIMESTAMP_FORMAT_CACHE['Weather Underground'], '%Y-%m-%d %I:%M %p')
+
+    def test_02_utc_source_kept_and_repeated_hour_disambiguated(self):
+        """Vérifie qu'Infoclimat reste en UTC et que l'heure répétée du passage à l'heure d'hiver donne deux instants."""
+        df = pd.DataFrame({'date_heure_utc': ['2024-10-27 01:00:00', '2024-10-27 02:00:00']})
+        result = etl_meteo.normalize_timestamps(df, 'Infoclimat')
+        self.assertEqual(list(result['date_heure_utc']), [pd.Timestamp('2024-10-27 01:00'), pd.Timestamp('2024-10-27 02:00')])
+
+        df = pd.DataFrame({'date_heure_utc': ['2024-10-27 2:30 AM', '2024-10-27 2:30 AM']})
+        result = etl_meteo.normalize_timestamps(df, 'Weather Underground', '1002')
+        self.assertEqual(list(result['date_heure_utc']), [pd.Timestamp('2024-10-27 00:30'), pd.Timestamp('2024-10-27 01:30')])
+
+    def test_03_mixed_formats_and_unreadable_rows(self):
+        """Vérifie le repli sur les autres formats connus et l'exclusion des horodatages illisibles."""
+        df = pd.DataFrame({'date_heure_utc': ['2024-10-01 00:00:00', '2024-10-01 01:00', 'hier'], 'temperature_c': [1.0, 2.0, 3.0]})
+        result = etl_meteo.normalize_timestamps(df, 'Infoclimat')
+        self.assertEqual(list(result['date_heure_utc']), [pd.Timestamp('2024-10-01 00:00'), pd.Timestamp('2024-10-01 01:00')])
+        self.assertEqual(list(result['temperature_c']), [1.0, 2.0])
+
+    def test_04_pipeline_batches_carry_utc_datetimes(self):
+        """Vérifie que les lots produits par le pipeline portent des datetimes UTC cohérents avec l'heure locale source."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = write_synthetic_wu_csv(os.path.join(tmpdir, 'station - 011024.csv'), 300)
+            task = etl_meteo.SourceTask('csv', path, station_id='1002', source='Weather Underground', date_str='2024-10-01')
+            batch = pd.concat(etl_meteo.iter_task_batches(task, chunksize=100))
+        local = etl_meteo.clean_and_convert_csv_df(make_synthetic_wu_frame(300), '1002', 'Weather Underground')['date_heure_utc']
+        expected = pd.to_datetime(local, format='%Y-%m-%d %I:%M %p') - pd.Timedelta(hours=2)
+        self.assertEqual(list(batch['date_heure_utc']), list(expected))
+
+
+    def test_05_repeated_hour_split_across_chunks(self):
+        """Vérifie qu'une heure répétée (passage à l'heure d'hiver) coupée entre deux lots donne deux instants distincts."""
+        df = make_synthetic_wu_frame(25, date_str='2024-10-27')
+        hours = list(range(3)) + list(range(2, 24))   # 2:00 AM figure deux fois
+        df['Time'] = [f"{(h % 12) or 12}:00 {'AM' if h < 12 else 'PM'}" for h in hours]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'station - 271024.csv')
+            lines = df.to_csv(sep=';', index=False, lineterminator='\n').splitlines()
+            lines.insert(2, ';'.join([''] * len(df.columns)))
+            with open(path, 'w', encoding='latin-1') as f:
+                f.write('\n'.join(lines) + '\n')
+            task = etl_meteo.SourceTask('csv', path, station_id='1002', source='Weather Underground', date_str='2024-10-27')
+            # Le second lot commence à la seconde occurrence de 2:00 AM
+            chunked = pd.concat(etl_meteo.iter_task_batches(task, chunksize=3))['date_heure_utc']
+            whole = pd.concat(etl_meteo.iter_task_batches(task, chunksize=100))['date_heure_utc']
+        self.assertEqual(list(chunked), list(whole))
+        self.assertTrue(chunked.is_unique)
+        self.assertEqual(list(chunked.iloc[2:4]), [pd.Timestamp('2024-10-27 00:00'), pd.Timestamp('2024-10-27 01:00')])
+
+class TestCompactRecords(unittest.TestCase):
+
+    def setUp(self):
+        df = etl_meteo.clean_and_convert_csv_df(make_synthetic_wu_frame(500), '1001', 'Weather Underground')
+        self.csv = etl_meteo.normalize_timestamps(df, 'Weather Underground', '1001')
+        self.json = etl_meteo.normalize_timestamps(etl_meteo.convert_json_records([
+            {'dh_utc': '2024-10-01 00:00:00', 'id_station': 'STATIC0010', 'temperature': None, 'humidite': '80', 'pression': '1012.3'},
+            {'dh_utc': '2024-10-01 01:00:00', 'id_station': 'STATIC0011', 'temperature': '12.7', 'humidite': None, 'vent_moyen': '9'},
+        ]), 'Infoclimat')
+
+    def test_01_compact_dtypes_keep_stored_values(self):
+        """Vérifie les types compacts et que les documents ne diffèrent des documents float64 qu'au float32 près."""
+        compact = etl_meteo.compact_records(self.csv)
+        self.assertEqual({c: str(compact[c].dtype) for c in ['id_station', 'source_donnees', 'temperature_c', 'humidite_pct']},
+                         {'id_station': 'category', 'source_donnees': 'category', 'temperature_c': 'float32', 'humidite_pct': 'Int8'})
+        self.assertLess(compact.memory_usage(deep=True).sum(), self.csv.memory_usage(deep=True).sum() / 3)
+
+        expected, documents = etl_meteo.batch_to_documents(self.csv), etl_meteo.batch_to_documents(compact)
+        self.assertEqual(len(documents), len(expected))
+        for got, want in zip(documents, expected):
+            self.assertEqual((got['id_station'], got['date_heure_utc']), (want['id_station'], want['date_heure_utc']))
+            self.assertIsInstance(got['id_station'], str)
+            for name in etl_meteo.FLOAT32_FIELDS:
+                if np.isnan(want[name]):
+                    self.assertTrue(np.isnan(got[name]))
+                else:
+                    self.assertAlmostEqual(got[name], want[name], delta=abs(want[name]) * 1e-6)
+                    self.assertEqual(got[name], float(str(np.float32(want[name]))))  # Écriture décimale la plus courte
+        # Mêmes empreintes de clés (doublons entre lots) avec des stations en catégories
+        key = ['date_heure_utc', 'id_station']
+        self.assertTrue((pd.util.hash_pandas_object(compact[key], index=False) == pd.util.hash_pandas_object(self.csv[key], index=False)).all())
+
+    def test_02_missing_values_keep_null_or_nan(self):
+        """Vérifie que <NA> reste null et NaN reste NaN : les compteurs de l'audit en ligne sont inchangés."""
+        compact = etl_meteo.compact_records(self.json)
+        self.assertEqual((str(compact['temperature_c'].dtype), str(compact['humidite_pct'].dtype)), ('Float32', 'Int8'))
+        documents = etl_meteo.batch_to_documents(compact)
+        self.assertEqual([(d['temperature_c'], d['humidite_pct']) for d in documents], [(None, 80), (12.7, None)])
+
+        csv = self.csv.copy()
+        csv.loc[csv.index[0], 'humidite_pct'] = np.nan
+        self.assertEqual(str(etl_meteo.compact_records(csv)['humidite_pct'].dtype), 'float32')
+        csv['humidite_pct'] = csv['humidite_pct'].fillna(300.0)
+        self.assertEqual(str(etl_meteo.compact_records(csv)['humidite_pct'].dtype), 'Int16')
+
+        for frame in (self.csv, self.json):
+            expected, result = quality_audit.StreamingQualityAudit(), quality_audit.StreamingQualityAudit()
+            expected.update(frame)
+            result.update(etl_meteo.compact_records(frame))
+            for name, audit in expected.result().fields.items():
+                got = result.result().fields[name]
+                self.assertEqual((got.nulls, got.nans, got.out_of_range), (audit.nulls, audit.nans, audit.out_of_range))
+
+    @unittest.skipUnless(etl_meteo._feather_available(), "pyarrow n'est pas installé")
+    def test_03_cache_and_parquet_keep_compact_types(self):
+        """Vérifie que le cache et l'export Parquet conservent les types compacts (dictionnaires Arrow pour les catégories)."""
+        import pyarrow.parquet as pq
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = write_synthetic_infoclimat_json(os.path.join(tmpdir, 'infoclimat.json'), 3, 24)
+            cache = etl_meteo.TransformCache(os.path.join(tmpdir, 'cache'))
+            task = etl_meteo.SourceTask('json', path, source='Infoclimat')
+            fresh = pd.concat(etl_meteo.iter_task_batches(task, chunksize=20, cache=cache), ignore_index=True)
+            cached = pd.concat(etl_meteo.iter_task_batches(task, chunksize=20, cache=cache), ignore_index=True)
+            self.assertEqual(dict(cached.dtypes), dict(etl_meteo.compact_records(fresh).dtypes))
+            self.assertEqual(cached['id_station'].dtype, 'category')
+
+            parquet = os.path.join(tmpdir, 'releves.parquet')
+            self.assertEqual(etl_meteo.export_parquet([self.csv, cached], parquet), len(self.csv) + len(cached))
+            table = pq.read_table(parquet)
+            self.assertEqual(str(table.schema.field('id_station').type), 'dictionary<values=string, indices=int8, ordered=0>')
+            self.assertEqual(str(table.schema.field('temperature_c').type), 'float')
+
+
+class TestFinalIntegrity(unittest.TestCase):
+
+    def test_01_incremental_stats_match_full_dataframe(self):
+        """Vérifie que les statistiques cumulées lot par lot égalent celles du DataFrame unifié (doublons entre lots inclus)."""
+        def csv_batch(n_rows, seed, station_id):
+            df = etl_meteo.clean_and_convert_csv_df(make_synthetic_wu_frame(n_rows, seed=seed), station_id, 'Weather Underground')
+            return etl_meteo.normalize_timestamps(df, 'Weather Underground', station_id)
+
+        hourly = [{'id_station': '07015', 'dh_utc': f'2024-10-01 0{h}:00:00', 'temperature': '12.5', 'humidite': None} for h in range(5)]
+        json_batch = etl_meteo.normalize_timestamps(etl_meteo.convert_json_records(hourly + hourly[:2]).drop(columns=['pression_hpa']), 'Infoclimat')
+        batches = [csv_batch(400, 1, '1001'), csv_batch(300, 2, '1001'), json_batch, csv_batch(300, 3, '1002')]
+
+        integrity = etl_meteo.FinalIntegrityCheck()
+        for batch in batches:
+            self.assertIs(integrity.update(batch), batch)
+        expected = legacy_final_integrity_stats([d for b in batches for d in b.to_dict('records')])
+
+        self.assertEqual(integrity.total, expected['total'])
+        self.assertEqual(integrity.doublons, expected['doublons'])
+        self.assertGreater(integrity.doublons, 0)
+        self.assertEqual(integrity.nulls, expected['nulls'])
+        # Minuit heure de Paris (UTC+2 en octobre) = 22h UTC la veille
+        self.assertEqual(integrity.start_date, pd.Timestamp('2024-09-30 22:00:00'))
+        self.assertEqual(integrity.end_date, pd.Timestamp('2024-10-01 21:55:00'))
+
+    def test_02_many_small_batches(self):
+        """Vérifie les doublons entre un grand nombre de petits lots et que les niveaux d'empreintes restent en O(log n)."""
+        rng = np.random.default_rng(0)
+        hours = pd.date_range('2024-10-01', periods=1500, freq='h')
+        batches = [pd.DataFrame({'date_heure_utc': hours[rng.integers(0, len(hours), 6)], 'id_station': rng.choice(['1001', '1002'], 6)})
+                   for _ in range(800)]
+        integrity = etl_meteo.FinalIntegrityCheck()
+        for batch in batches:
+            integrity.update(batch)
+        everything = pd.concat(batches, ignore_index=True)
+        self.assertEqual(integrity.total, len(everything))
+        self.assertEqual(integrity.doublons, int(everything.duplicated().sum()))
+        self.assertLessEqual(len(integrity._seen.levels), int(np.log2(len(everything))) + 1)
+        self.assertEqual(len(integrity._seen), len(everything.drop_duplicates()))
+
+    def test_03_dataframes_converted_to_documents_batch_by_batch(self):
+        """Vérifie que les documents produits tranche par tranche sont identiques à une conversion complète."""
+        df = etl_meteo.clean_and_convert_csv_df(make_synthetic_wu_frame(1000), '1001', 'Weather Underground')
+        with mock.patch.object(pd.DataFrame, 'to_dict', autospec=True, side_effect=pd.DataFrame.to_dict) as to_dict:
+            batches = list(etl_meteo.iter_document_batches([df], batch_size=128))
+        self.assertTrue(all(len(call.args[0]) <= 128 for call in to_dict.call_args_list))
+        self.assertEqual(repr([d for b in batches for d in b]), repr(df.to_dict('records')))
+
+
+class TestParallelExtraction(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.tasks = []
+        for day in range(1, 5):
+            path = write_synthetic_wu_csv(os.path.join(self.tmpdir.name, f'station - {day:02d}1024.csv'), 200 * day, seed=day)
+            self.tasks.append(etl_meteo.SourceTask('csv', path, station_id='1001', source='Weather Underground', date_str=f'2024-10-{day:02d}'))
+        self.tasks.insert(2, etl_meteo.SourceTask('csv', os.path.join(self.tmpdir.name, 'absent.csv'), station_id='1001', source='Weather Underground', date_str='2024-10-09'))
+        self.tasks.append(etl_meteo.SourceTask('json', os.path.join(self.tmpdir.name, 'absent.json'), source='Infoclimat'))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_01_results_merge_in_task_order(self):
+        """Vérifie que les résultats parallèles suivent l'ordre des tâches et qu'un fichier en échec n'arrête pas les autres."""
+        for executor in ('thread', 'process'):
+            with self.subTest(executor=executor):
+                results = etl_meteo.run_parallel_extraction(self.tasks, workers=3, executor=executor)
+                self.assertEqual([r.task for r in results], self.tasks)
+                self.assertEqual(results[2].rows, 0)
+                self.assertIsNotNone(results[-1].error)
+                self.assertEqual(results[0].rows, len(etl_meteo.extract_and_process_csv_from_disk({'2024-10-01': self.tasks[0].path}, '1001', 'Weather Underground')))
+                self.assertTrue(all(r.rows > 0 for i, r in enumerate(results) if i not in (2, len(results) - 1)))
+
+
+class TestTransformCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache = etl_meteo.TransformCache(os.path.join(self.tmpdir.name, 'cache'))
+        self.csv_path = write_synthetic_wu_csv(os.path.join(self.tmpdir.name, 'station - 011024.csv'), 500)
+        self.json_path = write_synthetic_infoclimat_json(os.path.join(self.tmpdir.name, 'infoclimat.json'), 2, 48)
+        self.csv_task = etl_meteo.SourceTask('csv', self.csv_path, station_id='1001', source='Weather Underground', date_str='2024-10-01')
+        self.json_task = etl_meteo.SourceTask('json', self.json_path, source='Infoclimat')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _run(self, task):
+        with mock.patch('etl_meteo.clean_and_convert_csv_df', wraps=etl_meteo.clean_and_convert_csv_df) as convert:
+            df = pd.concat(etl_meteo.iter_task_batches(task, chunksize=128, cache=self.cache), ignore_index=True)
+        return df, convert.call_count
+
+    def test_01_unchanged_files_are_read_from_cache(self):
+        """Vérifie qu'un fichier inchangé est relu depuis le cache à l'identique, sans nouvelle transformation."""
+        for task in (self.csv_task, self.json_task):
+            with self.subTest(kind=task.kind):
+                first, _ = self._run(task)
+                second, conversions = self._run(task)
+                self.assertEqual(conversions, 0)
+                self.assertTrue(frames_identical(first, second))
+                self.assertEqual(repr(first.to_dict('records')), repr(second.to_dict('records')))
+
+    def test_02_changed_file_or_rules_invalidate_entry(self):
+        """Vérifie qu'une modification du fichier ou des règles de conversion force un nouveau traitement."""
+        self._run(self.csv_task)
+        write_synthetic_wu_csv(self.csv_path, 500, seed=1)
+        _, conversions = self._run(self.csv_task)
+        self.assertGreater(conversions, 0)
+
+        with mock.patch('etl_meteo.CONVERSION_RULES_VERSION', 'test'):
+            _, conversions = self._run(self.csv_task)
+        self.assertGreater(conversions, 0)
+
+    def test_03_size_eviction_and_invalidation(self):
+        """Vérifie l'éviction des entrées les plus anciennes au-delà de la taille maximale, puis le vidage complet."""
+        self._run(self.csv_task)
+        self._run(self.json_task)
+        self.assertEqual(len(self.cache._entries()), 2)
+
+        self.cache.max_bytes = self.cache.size() - 1
+        self.assertEqual(self.cache.evict(), 1)
+        self.assertEqual(len(self.cache._entries()), 1)
+        self.assertEqual(self.cache.invalidate(), 1)
+        self.assertEqual(self.cache.size(), 0)
+
+    def test_04_failed_file_is_not_cached(self):
+        """Vérifie qu'un fichier en erreur n'est jamais mis en cache."""
+        with open(self.csv_path, 'w', encoding='latin-1') as f:
+            f.write('Time;Temperature\n')
+        with self.assertRaises(Exception):
+            list(etl_meteo.iter_task_batches(self.csv_task, cache=self.cache))
+        self.assertEqual(self.cache.size(), 0)
+
+    def test_05_digest_index_read_once_and_saved_on_flush(self):
+        """Vérifie que l'index des empreintes est lu une fois, enregistré au flush() et complet après une extraction parallèle."""
+        tasks = []
+        for i in range(40):
+            path = os.path.join(self.tmpdir.name, f'fichier{i}.csv')
+            with open(path, 'w') as f:
+                f.write(str(i))
+            tasks.append(etl_meteo.SourceTask('csv', path, station_id='1001', source='Weather Underground', date_str='2024-10-01'))
+        with mock.patch.object(etl_meteo.TransformCache, '_load_digest_index', autospec=True, return_value={}) as load, \
+                mock.patch.object(etl_meteo.TransformCache, '_save_digest_index', autospec=True) as save:
+            for task in tasks:
+                self.cache.key_for(task)
+            self.assertEqual((load.call_count, save.call_count), (1, 0))
+            self.cache.flush()
+            self.assertEqual(save.call_count, 1)
+            self.assertEqual(len(save.call_args[0][1]), len(tasks))
+
+        paths = [write_synthetic_wu_csv(os.path.join(self.tmpdir.name, f'station - 0{i}1024.csv'), 50) for i in range(1, 4)]
+        tasks = [etl_meteo.SourceTask('csv', path, station_id='1001', source='Weather Underground', date_str=f'2024-10-0{i}')
+                 for i, path in enumerate(paths, 1)]
+        etl_meteo.run_parallel_extraction(tasks, workers=3, executor='thread', cache=self.cache)
+        fresh = etl_meteo.TransformCache(self.cache.cache_dir)
+        self.assertEqual(len(fresh._load_digest_index()), len(tasks))
+        self.assertEqual(len(fresh._entries()), len(tasks))
+
+
+class TestSourceRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.data_dir = os.path.join(self.tmpdir.name, 'donnees')
+        os.makedirs(self.data_dir)
+        self.index_path = os.path.join(self.tmpdir.name, 'index.json')
+        for name, n_rows in (("Weather+Underground+-+La+Madeleine,+FR.xlsx - 021024.csv", 100),
+                             ("Weather+Underground+-+La+Madeleine,+FR.xlsx - 011024.csv", 300),
+                             ("Weather+Underground+-+Ichtegem,+BE.xlsx - 011024.csv", 200),
+                             ("Weather+Underground+-+Lille,+FR.xlsx - 011024.csv", 50),
+                             ("Weather+Underground+-+Ichtegem,+BE.xlsx - copie.csv", 10)):
+            write_synthetic_wu_csv(os.path.join(self.data_dir, name), n_rows)
+        write_synthetic_infoclimat_json(os.path.join(self.data_dir, 'Data_Source1_011024-071024.json'), 1, 24)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _registry(self):
+        return etl_meteo.SourceRegistry(self.data_dir, index_path=self.index_path)
+
+    def test_01_station_and_date_parsed_from_filenames(self):
+        """Vérifie la découverte des fichiers, l'interprétation des noms et l'ordre chronologique par défaut."""
+        registry = self._registry()
+        scan = registry.scan()
+        self.assertEqual(len(scan.added), 5)
+        self.assertEqual(registry.ignored, ["Weather+Underground+-+Ichtegem,+BE.xlsx - copie.csv"])
+
+        tasks = registry.tasks()
+        self.assertEqual([(t.kind, t.station_id, t.date_str) for t in tasks],
+                         [('csv', '1001', '2024-10-01'), ('csv', '1001', '2024-10-02'), ('csv', '1002', '2024-10-01'),
+                          ('csv', 'Lille, FR', '2024-10-01'), ('json', None, None)])
+        self.assertTrue(all(os.path.exists(t.path) for t in tasks))
+
+    def test_02_largest_files_scheduled_first(self):
+        """Vérifie la planification des plus gros fichiers en premier."""
+        registry = self._registry()
+        registry.scan()
+        sizes = [os.path.getsize(t.path) for t in registry.tasks(largest_first=True)]
+        self.assertEqual(sizes, sorted(sizes, reverse=True))
+
+    def test_03_rescan_reports_only_changes(self):
+        """Vérifie qu'un nouveau scan s'appuie sur l'index persistant et ne signale que les changements."""
+        self._registry().scan()
+        modified = os.path.join(self.data_dir, "Weather+Underground+-+Ichtegem,+BE.xlsx - 011024.csv")
+        write_synthetic_wu_csv(modified, 250)
+        os.remove(os.path.join(self.data_dir, "Weather+Underground+-+Lille,+FR.xlsx - 011024.csv"))
+        write_synthetic_wu_csv(os.path.join(self.data_dir, "Weather+Underground+-+Ichtegem,+BE.xlsx - 021024.csv"), 20)
+
+        registry = self._registry()
+        with mock.patch.object(registry, 'parse_filename', wraps=registry.parse_filename) as parse:
+            scan = registry.scan()
+        self.assertEqual(scan.added, ["Weather+Underground+-+Ichtegem,+BE.xlsx - 021024.csv"])
+        self.assertEqual(scan.modified, [os.path.basename(modified)])
+        self.assertEqual(scan.removed, ["Weather+Underground+-+Lille,+FR.xlsx - 011024.csv"])
+        self.assertEqual(scan.unchanged, 3)
+        # Seuls les fichiers absents de l'index (nouveau + nom non reconnu) sont réanalysés
+        self.assertEqual(parse.call_count, 2)
+
+
+@unittest.skipIf(mongomock is None, "mongomock n'est pas installé")
+class TestIncrementalLoad(unittest.TestCase):
+
+    def setUp(self):
+        df = etl_meteo.clean_and_convert_csv_df(make_synthetic_wu_frame(288), '1001', 'Weather Underground')
+        self.df = etl_meteo.normalize_timestamps(df, 'Weather Underground', '1001')
+        self.client = mongomock.MongoClient()
+        self.collection = self.client[etl_meteo.MONGO_DATABASE][etl_meteo.MONGO_COLLECTION]
+        etl_meteo.ensure_unique_key_index(self.collection)
+
+    def test_01_rerun_on_unchanged_data_is_a_no_op(self):
+        """Vérifie qu'un second chargement des mêmes données n'écrit rien."""
+        first = etl_meteo.upsert_documents(self.collection, [self.df], batch_size=100)
+        self.assertEqual(first['inserted'], len(self.df))
+        second = etl_meteo.upsert_documents(self.collection, [self.df], batch_size=100)
+        self.assertEqual((second['inserted'], second['modified'], second['unchanged']), (0, 0, len(self.df)))
+        self.assertEqual(self.collection.count_documents({}), len(self.df))
+
+    def test_02_only_changed_documents_are_updated(self):
+        """Vérifie que seuls les documents dont le contenu a changé sont réécrits."""
+        etl_meteo.upsert_documents(self.collection, [self.df])
+        changed = self.df.copy()
+        changed.iloc[:5, changed.columns.get_loc('pression_hpa')] += 1.0
+        stats = etl_meteo.upsert_documents(self.collection, [changed])
+        self.assertEqual((stats['inserted'], stats['modified']), (0, 5))
+        first_key = {'id_station': '1001', 'date_heure_utc': changed['date_heure_utc'].iloc[0]}
+        self.assertEqual(self.collection.find_one(first_key)['pression_hpa'], changed['pression_hpa'].iloc[0])
+
+    def test_03_loader_incremental_mode(self):
+        """Vérifie le chargement incrémental de bout en bout via load_batches_to_mongodb."""
+        with mock.patch.object(etl_meteo, 'MongoClient', lambda *args, **kwargs: self.client):
+            self.assertTrue(etl_meteo.load_batches_to_mongodb([self.df], mode='incremental'))
+            self.assertTrue(etl_meteo.load_batches_to_mongodb([self.df], mode='incremental'))
+        self.assertEqual(self.collection.count_documents({}), len(self.df))
+
+    def test_04_full_load_indexes_station_and_utc_datetime(self):
+        """Vérifie l'index (id_station, date_heure_utc) d'un chargement complet et les requêtes par plage de dates."""
+        self.collection.drop_indexes()
+        with mock.patch.object(etl_meteo, 'MongoClient', lambda *args, **kwargs: self.client):
+            self.assertTrue(etl_meteo.load_batches_to_mongodb([self.df], mode='full'))
+        self.assertIn('station_date_heure', self.collection.index_information())
+        self.assertEqual(etl_meteo.ensure_time_range_index(self.collection), 'station_date_heure')
+
+        window = {'id_station': '1001', 'date_heure_utc': {'$gte': datetime(2024, 9, 30, 22), '$lt': datetime(2024, 9, 30, 23)}}
+        self.assertEqual(self.collection.count_documents(window), 12)
+
+
+@unittest.skipIf(mongomock is None, "mongomock n'est pas installé")
+class TestStorageLayouts(unittest.TestCase):
+
+    def setUp(self):
+        frames = make_synthetic_measures(n_stations=2, n_days=3, freq='h')
+        frames[0].loc[5, 'temperature_c'] = np.nan
+        frames[1].loc[7, 'humidite_pct'] = 150.0
+        # Lots découpés à cheval sur les jours : un même seau reçoit des relevés de plusieurs lots
+        self.batches = [frame.iloc[i:i + 30] for frame in frames for i in range(0, len(frame), 30)]
+        self.rows = sum(len(frame) for frame in frames)
+        self.db = mongomock.MongoClient()['db']
+        self.flat = self.db['flat']
+        etl_meteo.insert_documents(self.flat, self.batches)
+
+    def _load(self, layout, data, mode='full'):
+        # mongomock ne sait pas créer de collection time-series : la forme des documents est testée sur une collection simple
+        collection = self.db[layout]
+        if mode == 'full':
+            collection.delete_many({})
+        etl_meteo.write_layout_documents(collection, data, layout, mode, batch_size=25)
+        return collection
+
+    def test_01_bucket_documents_group_one_station_day(self):
+        """Vérifie qu'un seau regroupe les relevés d'une station sur un jour UTC, sans répéter les champs de station."""
+        collection = self._load('bucket', self.batches)
+        self.assertEqual(collection.count_documents({}), 2 * 3)
+        bucket = collection.find_one({'id_station': '1002', 'jour': datetime(2024, 10, 2)})
+        self.assertEqual(len(bucket['mesures']), 24)
+        self.assertEqual(bucket['source_donnees'], 'Weather Underground')
+        self.assertNotIn('id_station', bucket['mesures'][0])
+        self.assertEqual(etl_meteo.count_stored_measures(collection, 'bucket'), self.rows)
+
+    def test_02_incremental_reload_replaces_measures(self):
+        """Vérifie qu'un rechargement incrémental remplace les relevés existants au lieu de les dupliquer."""
+        changed = [batch.copy() for batch in self.batches[:2]]
+        changed[0]['pression_hpa'] = 999.0
+        for layout in ('bucket', 'timeseries'):
+            with self.subTest(layout=layout):
+                collection = self._load(layout, self.batches)
+                self._load(layout, changed, mode='incremental')
+                self.assertEqual(etl_meteo.count_stored_measures(collection, layout), self.rows)
+                first = changed[0].iloc[0]
+                stored = etl_meteo.query_time_range(collection, first['id_station'], first['date_heure_utc'],
+                                                    first['date_heure_utc'] + pd.Timedelta(hours=1), layout)
+                self.assertEqual([d['pression_hpa'] for d in stored], [999.0])
+
+    def test_03_audit_and_range_queries_match_flat_layout(self):
+        """Vérifie que l'audit et les requêtes par plage donnent les mêmes résultats dans toutes les dispositions."""
+        expected_audit = quality_audit.run_audit(self.flat)
+        start, end = datetime(2024, 10, 1, 20), datetime(2024, 10, 2, 3)
+        expected_range = etl_meteo.query_time_range(self.flat, '1001', start, end, 'flat')
+        self.assertEqual(len(expected_range), 7)
+        for layout in ('bucket', 'timeseries'):
+            with self.subTest(layout=layout):
+                collection = self._load(layout, self.batches)
+                report = quality_audit.run_audit(collection, pre_pipeline=etl_meteo.audit_pre_pipeline(layout))
+                self.assertEqual(report.total_documents, expected_audit.total_documents)
+                self.assertEqual(report.fields, expected_audit.fields)
+                self.assertEqual((report.min_date, report.max_date), (expected_audit.min_date, expected_audit.max_date))
+
+                stored = etl_meteo.query_time_range(collection, '1001', start, end, layout)
+                strip = lambda d: {k: v for k, v in d.items() if k not in etl_meteo.STATION_FIELDS + [etl_meteo.TIMESERIES_META_FIELD]}
+                self.assertEqual(repr([strip(d) for d in stored]), repr([strip(d) for d in expected_range]))
+
+    def test_04_bucket_partial_failure_counts_stored_measures(self):
+        """Vérifie qu'un échec partiel d'écriture des seaux ne compte que les relevés réellement stockés."""
+        for mode in ('full', 'incremental'):
+            with self.subTest(mode=mode):
+                collection = self.db[f'bucket_{mode}']
+                # Index unique sur la source : seul le premier seau créé est accepté, les ajouts à ce seau passent
+                collection.create_index('source_donnees', unique=True)
+                stats = etl_meteo.write_layout_documents(collection, self.batches, 'bucket', mode, batch_size=25)
+                stored = etl_meteo.count_stored_measures(collection, 'bucket')
+                self.assertLess(stored, self.rows)
+                self.assertEqual((stats.written, stats.failed_batches), (stored, 0))
+
+
+class TestDailyRollup(unittest.TestCase):
+
+    def setUp(self):
+        frames = make_synthetic_measures(n_stations=2, n_days=3, freq='h')
+        frames[0].loc[5, 'temperature_c'] = np.nan
+        self.frame = pd.concat(frames, ignore_index=True)
+        # Lots à cheval sur les jours : les agrégats partiels d'une station-jour viennent de plusieurs lots
+        self.batches = [self.frame.iloc[i:i + 30] for i in range(0, len(self.frame), 30)]
+
+    def _rollup(self, batches):
+        rollup = etl_meteo.DailyRollup()
+        for batch in batches:
+            rollup.update(batch)
+        return rollup
+
+    def test_01_batched_rollup_matches_global_groupby(self):
+        """Vérifie que les agrégats cumulés lot par lot égalent un groupby sur l'ensemble des relevés."""
+        daily = self._rollup(self.batches).result()
+        grouped = self.frame.groupby(['id_station', self.frame['date_heure_utc'].dt.floor('D').rename('jour')])
+        self.assertEqual(len(daily), 2 * 3)
+        np.testing.assert_allclose(daily['temperature_min_c'], grouped['temperature_c'].min())
+        np.testing.assert_allclose(daily['temperature_max_c'], grouped['temperature_c'].max())
+        np.testing.assert_allclose(daily['temperature_moy_c'], grouped['temperature_c'].mean())
+        np.testing.assert_allclose(daily['pluie_totale_mm'], grouped['pluie_accum_mm'].sum())
+        np.testing.assert_allclose(daily['vent_moy_ms'], grouped['vent_vitesse_ms'].mean())
+        self.assertEqual(daily['nb_releves'].tolist(), [24] * 6)
+        self.assertEqual(daily['nb_temperature'].iloc[0], 23)
+
+    def test_02_weekly_rollup_weights_daily_means(self):
+        """Vérifie que l'agrégat hebdomadaire recalculé depuis les jours égale celui des relevés horaires."""
+        weekly = etl_meteo.weekly_rollup(self._rollup(self.batches).result())
+        first = self.frame[self.frame['id_station'] == '1001']
+        self.assertEqual(weekly['nb_releves'].tolist(), [72, 72])
+        self.assertAlmostEqual(weekly['temperature_moy_c'].iloc[0], first['temperature_c'].mean())
+        self.assertAlmostEqual(weekly['pluie_totale_mm'].iloc[0], first['pluie_accum_mm'].sum())
+
+    @unittest.skipIf(mongomock is None, "mongomock n'est pas installé")
+    def test_03_incremental_upsert_touches_only_changed_days(self):
+        """Vérifie que seuls les agrégats des stations-jours modifiés sont réécrits."""
+        collection = mongomock.MongoClient()['db'][etl_meteo.DAILY_ROLLUP_COLLECTION]
+        first = etl_meteo.write_daily_rollup(collection, self._rollup(self.batches), mode='full')
+        self.assertEqual(first['inserted'], 6)
+
+        # Nouvelle exécution sur un seul jour d'une station, dont une mesure a changé
+        changed = self.frame[(self.frame['id_station'] == '1002') & (self.frame['date_heure_utc'] < datetime(2024, 10, 2))].copy()
+        changed.iloc[0, changed.columns.get_loc('pluie_accum_mm')] += 10.0
+        stats = etl_meteo.write_daily_rollup(collection, self._rollup([changed]), mode='incremental')
+        self.assertEqual((stats['inserted'], stats['modified'], stats['unchanged']), (0, 1, 0))
+        self.assertEqual(collection.count_documents({}), 6)
+
+        stored = etl_meteo.query_daily_rollup(collection, '1002', datetime(2024, 10, 1), datetime(2024, 10, 2))
+        self.assertEqual(len(stored), 1)
+        self.assertAlmostEqual(stored[0]['pluie_totale_mm'], changed['pluie_accum_mm'].sum())
+        stats = etl_meteo.write_daily_rollup(collection, self._rollup([changed]), mode='incremental')
+        self.assertEqual(stats['unchanged'], 1)
+
+    @unittest.skipIf(mongomock is None, "mongomock n'est pas installé")
+    def test_04_partial_rerun_recomputed_from_stored_measures(self):
+        """Vérifie qu'une exécution partielle (avec doublons) recalcule les jours touchés depuis les relevés stockés."""
+        db = mongomock.MongoClient()['db']
+        etl_meteo.upsert_documents(db['flat'], self.batches)
+        daily = db[etl_meteo.DAILY_ROLLUP_COLLECTION]
+        etl_meteo.write_daily_rollup(daily, self._rollup(self.batches), mode='incremental', source=db['flat'])
+        expected = self._rollup(self.batches).result()
+
+        # Demi-journée rechargée deux fois dans la même exécution, avec une mesure modifiée
+        partial = self.frame[(self.frame['id_station'] == '1002') & (self.frame['date_heure_utc'] < datetime(2024, 10, 1, 12))].copy()
+        partial.iloc[0, partial.columns.get_loc('pluie_accum_mm')] += 10.0
+        rerun = self._rollup([partial, partial])
+        self.assertEqual(rerun.result()['nb_releves'].tolist(), [12])
+        etl_meteo.upsert_documents(db['flat'], [partial, partial])
+        stats = etl_meteo.write_daily_rollup(daily, rerun, mode='incremental', source=db['flat'])
+        self.assertEqual((stats['inserted'], stats['modified']), (0, 1))
+
+        stored = etl_meteo.query_daily_rollup(daily, '1002', datetime(2024, 10, 1), datetime(2024, 10, 2))[0]
+        day = expected[(expected['id_station'] == '1002') & (expected['jour'] == datetime(2024, 10, 1))].iloc[0]
+        self.assertEqual(stored['nb_releves'], 24)
+        self.assertAlmostEqual(stored['pluie_totale_mm'], day['pluie_totale_mm'] + 10.0)
+        self.assertAlmostEqual(stored['temperature_moy_c'], day['temperature_moy_c'])
+
+        # Même recalcul depuis les seaux station-jour (les relevés n'y portent pas l'identifiant de station)
+        etl_meteo.write_layout_documents(db['bucket'], self.batches, 'bucket', 'full')
+        recomputed = etl_meteo.rollup_from_measures(db['bucket'], self._rollup(self.batches), 'bucket')
+        pd.testing.assert_frame_equal(recomputed, expected, check_exact=False)
+        self.assertEqual(recomputed['nb_temperature'].iloc[0], 23)
+
+
+class TestAnomalyDetector(unittest.TestCase):
+
+    def setUp(self):
+        # Deux stations horaires ; la seconde est mélangée à la première et ses relevés arrivent dans le désordre
+        times = pd.date_range('2024-10-01', periods=24, freq='h')
+        self.a = pd.DataFrame({'date_heure_utc': times, 'id_station': 'A', 'source_donnees': 'Infoclimat',
+                               'temperature_c': 10.0 + np.arange(24) * 0.5, 'humidite_pct': np.arange(24) % 7 + 60,
+                               'pression_hpa': 1010.0 + np.arange(24) * 0.1, 'vent_vitesse_ms': np.arange(24) % 5 + 1.0,
+                               'pluie_accum_mm': 0.0})
+        self.a.loc[10, 'temperature_c'] = 30.0                               # Pic isolé : montée puis descente
+        self.a = self.a.drop(index=[15, 16, 17]).reset_index(drop=True)       # Trou de 3 heures avant 18h
+        self.b = self.a.assign(id_station='B', pression_hpa=1000.0).iloc[::-1].reset_index(drop=True)   # Pression figée
+
+    def test_01_spikes_gaps_and_flatlines_flagged_per_station(self):
+        """Vérifie les drapeaux d'un pic, d'un trou horaire et d'une valeur figée, station par station."""
+        detector = quality_audit.AnomalyDetector()
+        flagged = pd.concat(detector.flag_frames([self.a, self.b]), ignore_index=True)
+        flags = flagged[quality_audit.QUALITY_FLAGS_FIELD]
+        names = lambda station, hour: quality_audit.quality_flag_names(
+            flags[(flagged['id_station'] == station) & (flagged['date_heure_utc'].dt.hour == hour)].iloc[0])
+
+        self.assertEqual(names('A', 10), ['pic_temperature_c'])
+        self.assertEqual(names('A', 11), ['pic_temperature_c'])
+        self.assertEqual(names('A', 18), ['trou_horaire'])
+        self.assertEqual(names('A', 0), [])                          # Premier relevé : pas de prédécesseur
+        self.assertIn('plat_pression_hpa', names('B', 0))            # Toute la série figée, y compris son début
+        self.assertNotIn('plat_pression_hpa', names('A', 5))
+        self.assertEqual((detector.counts['trou_horaire'], detector.missing_hours), (2, 6))
+        self.assertEqual(detector.counts['plat_pression_hpa'], len(self.b))
+        self.assertEqual(detector.total, len(self.a) + len(self.b))
+
+    def test_02_streaming_batches_compare_with_previous_batch(self):
+        """Vérifie que update() rattache chaque lot au dernier relevé de la station (pics et trous entre lots)."""
+        whole = quality_audit.AnomalyDetector().flag_frames([self.a])[0]
+        streaming = quality_audit.AnomalyDetector()
+        parts = [streaming.update(self.a.iloc[start:start + 5]) for start in range(0, len(self.a), 5)]
+        self.assertEqual(pd.concat(parts)[quality_audit.QUALITY_FLAGS_FIELD].tolist(),
+                         whole[quality_audit.QUALITY_FLAGS_FIELD].tolist())
+
+    @unittest.skipIf(mongomock is None, "mongomock n'est pas installé")
+    def test_03_flags_loaded_with_documents_and_counted(self):
+        """Vérifie que les drapeaux sont écrits avec les documents et comptés en une agrégation (et dans celle de l'audit)."""
+        detector = quality_audit.AnomalyDetector()
+        frames = detector.flag_frames([etl_meteo.compact_records(self.a), etl_meteo.compact_records(self.b)])
+        collection = mongomock.MongoClient()['db']['coll']
+        etl_meteo.upsert_documents(collection, frames)
+        document = collection.find_one({'id_station': 'A', 'date_heure_utc': datetime(2024, 10, 1, 18)})
+        self.assertEqual(document[quality_audit.QUALITY_FLAGS_FIELD], quality_audit.QUALITY_FLAGS['trou_horaire'])
+        self.assertIsInstance(document[quality_audit.QUALITY_FLAGS_FIELD], int)
+        counts = quality_audit.count_quality_flags(collection)
+        self.assertEqual(counts, detector.counts)
+        self.assertEqual(quality_audit.run_audit(collection).quality_flags, detector.counts)
+
+
+    @unittest.skipIf(mongomock is None, "mongomock n'est pas installé")
+    def test_04_streaming_flags_gaps_across_files_given_out_of_order(self):
+        """Vérifie qu'en streaming, un trou entre deux fichiers d'une station est signalé même si les fichiers arrivent dans le désordre."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            # Premier jour interrompu à 19h55 (heure locale), second jour complet : trou de 4 heures entre les deux fichiers
+            first = write_synthetic_wu_csv(os.path.join(tmpdir, 'station - 011024.csv'), 240, date_str='2024-10-01')
+            second = write_synthetic_wu_csv(os.path.join(tmpdir, 'station - 021024.csv'), 288, date_str='2024-10-02', seed=1)
+            tasks = [etl_meteo.SourceTask('csv', path, station_id='1001', source='Weather Underground', date_str=date_str)
+                     for path, date_str in ((second, '2024-10-02'), (first, '2024-10-01'))]
+            client = mongomock.MongoClient()
+            with mock.patch.object(etl_meteo, 'MongoClient', lambda *args, **kwargs: client):
+                etl_meteo.run_full_etl(streaming=True, tasks=tasks, use_cache=False, daily_rollup=False, load_mode='full')
+
+        collection = client[etl_meteo.MONGO_DATABASE][etl_meteo.MONGO_COLLECTION]
+        day_start = collection.find_one({'date_heure_utc': {'$gte': datetime(2024, 10, 1, 22)}}, sort=[('date_heure_utc', 1)])
+        self.assertIn('trou_horaire', quality_audit.quality_flag_names(day_start[quality_audit.QUALITY_FLAGS_FIELD]))
+        self.assertEqual(quality_audit.count_quality_flags(collection)['trou_horaire'], 1)
+
+
+class TestPipelinedWriter(unittest.TestCase):
+
+    def test_01_fixed_size_batches_from_any_iterable(self):
+        """Vérifie le redécoupage en lots fixes d'un flux mêlant documents, listes et DataFrames."""
+        df = pd.DataFrame({'a': range(5)})
+        stream = [{'a': -1}, [{'a': -2}, {'a': -3}], df, {'a': 99}]
+        batches = list(etl_meteo.iter_document_batches(stream, batch_size=3))
+        self.assertEqual([len(b) for b in batches], [3, 3, 3])
+        self.assertEqual([d['a'] for b in batches for d in b], [-1, -2, -3, 0, 1, 2, 3, 4, 99])
+
+    def test_02_failed_batch_does_not_abort_the_load(self):
+        """Vérifie qu'un lot en échec est compté sans interrompre l'écriture des lots suivants."""
+        written = []
+
+        def write_batch(batch):
+            if batch[0] == 'boom':
+                raise ValueError("lot invalide")
+            written.extend(batch)
+            return len(batch)
+
+        stats = etl_meteo.PipelinedWriter(write_batch, queue_size=1).write_all([[1, 2], ['boom'], [3]])
+        self.assertEqual(written, [1, 2, 3])
+        self.assertEqual((stats.documents, stats.written, stats.batches, stats.failed_batches), (4, 3, 3, 1))
+        self.assertEqual(len(stats.latencies), 3)
+
+    @unittest.skipIf(mongomock is None, "mongomock n'est pas installé")
+    def test_03_insert_documents_from_generator(self):
+        """Vérifie l'insertion par lots d'un générateur de documents avec un write concern allégé."""
+        collection = mongomock.MongoClient()['db']['coll']
+        documents = ({'id_station': '1001', 'n': i} for i in range(2500))
+        stats = etl_meteo.insert_documents(collection, documents, batch_size=1000, write_concern=etl_meteo.RELAXED_WRITE_CONCERN)
+        self.assertEqual((stats.documents, stats.written, stats.batches), (2500, 2500, 3))
+        self.assertEqual(collection.count_documents({}), 2500)
+        self.assertGreater(stats.docs_per_second, 0)
+
+
+@unittest.skipIf(mongomock is None, "mongomock n'est pas installé")
+class TestSinglePassAudit(unittest.TestCase):
+
+    def test_01_counts_match_per_field_queries(self):
+        """Vérifie que l'audit en une passe retrouve les compteurs des anciennes requêtes count_documents."""
+        collection = mongomock.MongoClient()['db']['coll']
+        collection.insert_many([
+            {'date_heure_utc': '2024-10-01 00:00:00', 'temperature_c': 12.5, 'humidite_pct': 80, 'pression_hpa': 1012.0, 'vent_vitesse_ms': 3.0},
+            {'date_heure_utc': '2024-10-01 01:00:00', 'temperature_c': None, 'humidite_pct': 120, 'pression_hpa': 700.0, 'vent_vitesse_ms': 3.0},
+            {'date_heure_utc': '2024-10-02 00:00:00', 'temperature_c': '12', 'humidite_pct': -1, 'pression_hpa': 1013.0},
+            {'date_heure_utc': '2024-10-03 00:00:00', 'temperature_c': 60.0, 'humidite_pct': 50, 'pression_hpa': 1015.0, 'vent_vitesse_ms': 80.0},
+        ])
+        report = quality_audit.run_audit(collection)
+
+        self.assertEqual(report.total_documents, 4)
+        self.assertEqual((report.min_date, report.max_date), ('2024-10-01 00:00:00', '2024-10-03 00:00:00'))
+        for name in quality_audit.AUDITED_FIELDS:
+            with self.subTest(field=name):
+                audit = report.fields[name]
+                self.assertEqual(audit.nulls, collection.count_documents({name: None}))
+                self.assertEqual(audit.strings, collection.count_documents({name: {'$type': 'string'}}))
+        for name, bounds in quality_audit.QUALITY_CONSTRAINTS.items():
+            with self.subTest(field=name):
+                expected = collection.count_documents({'$or': [{name: {'$lt': bounds['min']}}, {name: {'$gt': bounds['max']}}]})
+                self.assertEqual(report.fields[name].out_of_range, expected)
+        self.assertEqual(report.range_anomalies, 5)
+        self.assertFalse(report.passed)
+
+    def test_02_inline_audit_matches_post_load_audit(self):
+        """Vérifie que l'audit calculé sur les lots transformés donne les mêmes compteurs que la relecture de MongoDB."""
+        csv_batch = etl_meteo.clean_and_convert_csv_df(make_synthetic_wu_frame(500), '1001', 'Weather Underground')
+        json_batch = [
+            {'date_heure_utc': '2024-10-01 00:00:00', 'temperature_c': None, 'humidite_pct': 101, 'pression_hpa': 1010.0, 'vent_vitesse_ms': 1.0, 'pluie_accum_mm': 0.0},
+            {'date_heure_utc': '2024-10-01 01:00:00', 'temperature_c': 'n/a', 'humidite_pct': None, 'pression_hpa': None, 'vent_vitesse_ms': 60.0, 'pluie_accum_mm': 0.2},
+        ]
+        inline = quality_audit.StreamingQualityAudit()
+        collection = mongomock.MongoClient()['db']['coll']
+        for batch in (csv_batch, json_batch):
+            collection.insert_many(etl_meteo.batch_to_documents(inline.update(batch)))
+
+        expected, result = quality_audit.run_audit(collection), inline.result()
+        self.assertEqual(result.total_documents, expected.total_documents)
+        self.assertEqual((result.min_date, result.max_date), (expected.min_date, expected.max_date))
+        for name, audit in expected.fields.items():
+            with self.subTest(field=name):
+                got = result.fields[name]
+                self.assertEqual((got.nulls, got.strings, got.non_numeric, got.out_of_range),
+                                 (audit.nulls, audit.strings, audit.non_numeric, audit.out_of_range))
+        # Les températures manquantes du CSV sont stockées en NaN (et non en null)
+        self.assertEqual(result.fields['temperature_c'].nans, csv_batch['temperature_c'].isna().sum())
+
+
+
+class _AsyncCursor:
+    """Curseur asynchrone minimal sur des résultats mongomock."""
+
+    def __init__(self, documents):
+        self._documents = list(documents)
+
+    async def to_list(self, length=None):
+        return self._documents
+
+
+class _AsyncCollection:
+    """Adaptateur asynchrone d'une collection mongomock (sous-ensemble de l'API PyMongo asynchrone utilisé par le pipeline)."""
+
+    def __init__(self, collection):
+        self._collection = collection
+        self.name = collection.name
+
+    def with_options(self, **kwargs):
+        return _AsyncCollection(self._collection.with_options(**kwargs))
+
+    def find(self, *args, **kwargs):
+        return _AsyncCursor(self._collection.find(*args, **kwargs))
+
+    async def aggregate(self, pipeline, **kwargs):
+        return _AsyncCursor(self._collection.aggregate(pipeline, **kwargs))
+
+    def __getattr__(self, name):
+        method = getattr(self._collection, name)
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+        return call
+
+
+class _AsyncClient:
+    """Adaptateur asynchrone d'un client mongomock : les bases renvoient des _AsyncCollection."""
+
+    def __init__(self, client):
+        self._client = client
+        self.admin = self
+        self.closed = False
+
+    async def command(self, *args, **kwargs):
+        return {'ok': 1.0}
+
+    def __getitem__(self, name):
+        database = self._client[name]
+        return type('AsyncDatabase', (), {'__getitem__': lambda _, collection: _AsyncCollection(database[collection])})()
+
+    async def close(self):
+        self.closed = True
+
+
+@unittest.skipIf(mongomock is None, "mongomock n'est pas installé")
+class TestAsyncMongoIO(unittest.TestCase):
+
+    def setUp(self):
+        df = etl_meteo.clean_and_convert_csv_df(make_synthetic_wu_frame(288), '1001', 'Weather Underground')
+        self.df = etl_meteo.normalize_timestamps(df, 'Weather Underground', '1001')
+        self.client = mongomock.MongoClient()
+        self.collection = self.client[etl_meteo.MONGO_DATABASE][etl_meteo.MONGO_COLLECTION]
+
+    def test_01_concurrent_writes_match_sync_loader(self):
+        """Vérifie que l'insertion et l'upsert asynchrones (plusieurs lots en vol) écrivent les mêmes documents."""
+        target = _AsyncCollection(self.collection)
+        stats = asyncio.run(etl_meteo.insert_documents_async(target, [self.df], batch_size=50, concurrency=3))
+        self.assertEqual((stats.documents, stats.written, stats.batches, stats.failed_batches), (len(self.df), len(self.df), 6, 0))
+        self.assertEqual(self.collection.count_documents({}), len(self.df))
+
+        self.collection.delete_many({})
+        etl_meteo.ensure_unique_key_index(self.collection)
+        first = asyncio.run(etl_meteo.upsert_documents_async(target, [self.df], batch_size=50, concurrency=3))
+        second = asyncio.run(etl_meteo.upsert_documents_async(target, [self.df], batch_size=50, concurrency=3))
+        self.assertEqual(first['inserted'], len(self.df))
+        self.assertEqual((second['inserted'], second['modified'], second['unchanged']), (0, 0, len(self.df)))
+
+    def test_02_parallel_audit_matches_single_pass_audit(self):
+        """Vérifie que l'audit asynchrone (même agrégation unique) donne les compteurs de run_audit."""
+        self.collection.insert_many(etl_meteo.batch_to_documents(self.df))
+        self.collection.insert_one({'date_heure_utc': datetime(2024, 10, 2), 'temperature_c': 'n/a', 'humidite_pct': 120})
+        expected = quality_audit.run_audit(self.collection)
+        report = asyncio.run(quality_audit.run_audit_async(_AsyncCollection(self.collection)))
+        self.assertEqual((report.total_documents, report.min_date, report.max_date),
+                         (expected.total_documents, expected.min_date, expected.max_date))
+        for name, audit in expected.fields.items():
+            with self.subTest(field=name):
+                got = report.fields[name]
+                self.assertEqual((got.nulls, got.nans, got.strings, got.non_numeric, got.out_of_range),
+                                 (audit.nulls, audit.nans, audit.strings, audit.non_numeric, audit.out_of_range))
+
+    def test_03_load_rollup_and_audit_share_one_async_client(self):
+        """Vérifie le chargement asyncio de bout en bout : agrégats et audit passent par le même client, fermé à la fin."""
+        async_client = _AsyncClient(self.client)
+        rollup = etl_meteo.DailyRollup()
+        rollup.update(self.df)
+        with mock.patch.object(etl_meteo, 'async_mongo_client', lambda *args, **kwargs: async_client):
+            success, report = asyncio.run(etl_meteo.load_and_audit_async([self.df], rollup=rollup, mode='full', verify_after_load=True))
+        self.assertTrue(success)
+        self.assertTrue(async_client.closed)
+        self.assertEqual(report.total_documents, len(self.df))
+        self.assertEqual(self.client[etl_meteo.MONGO_DATABASE][etl_meteo.DAILY_ROLLUP_COLLECTION].count_documents({}), rollup.touched)
+
+    def test_04_pipeline_stages_reuse_the_shared_client(self):
+        """Vérifie qu'un seul client est créé pour le chargement, les agrégats et l'audit dans shared_mongo_client(), et que l'audit lit la collection une fois."""
+        created = []
+
+        def make_client(*args, **kwargs):
+            created.append(kwargs)
+            return self.client
+
+        rollup = etl_meteo.DailyRollup()
+        rollup.update(self.df)
+        with mock.patch.object(etl_meteo, 'MongoClient', make_client), mock.patch.object(quality_audit, 'MongoClient', make_client):
+            with etl_meteo.shared_mongo_client():
+                self.assertTrue(etl_meteo.load_batches_to_mongodb([self.df], mode='full'))
+                self.assertTrue(etl_meteo.load_daily_rollup_to_mongodb(rollup, mode='full'))
+                with mock.patch.object(mongomock.collection.Collection, 'aggregate', autospec=True,
+                                       side_effect=mongomock.collection.Collection.aggregate) as aggregate:
+                    report = etl_meteo.audit_mongodb_data()
+                self.assertIsNotNone(report)
+                self.assertEqual(aggregate.call_count, 1)
+                self.assertEqual(set(report.quality_flags), set(quality_audit.QUALITY_FLAGS))
+            self.assertIsNone(etl_meteo._shared_client)
+        self.assertEqual([kwargs.get('maxPoolSize') for kwargs in created], [etl_meteo.MONGO_MAX_POOL_SIZE])
+
+
+class TestRunMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.csv_path = write_synthetic_wu_csv(os.path.join(self.tmpdir.name, 'station - 011024.csv'), 1000)
+        self.tasks = [etl_meteo.SourceTask('csv', self.csv_path, station_id='1001', source='Weather Underground', date_str='2024-10-01'),
+                      etl_meteo.SourceTask('csv', os.path.join(self.tmpdir.name, 'absent.csv'), station_id='1001',
+                                           source='Weather Underground', date_str='2024-10-02')]
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_01_file_counters_and_extraction_stage(self):
+        """Vérifie les lignes lues, produites et écartées par fichier, et le débit de l'étape d'extraction."""
+        metrics = instrumentation.RunMetrics()
+        with metrics:
+            rows = sum(len(batch) for batch in etl_meteo.iter_all_source_batches(chunksize=300, tasks=self.tasks, metrics=metrics))
+        csv_stats, missing = metrics.files
+        # Lignes sans heure écartées par dropna (une sur trois des cellules manquantes du générateur)
+        self.assertEqual((csv_stats.rows_in, csv_stats.rows_out, csv_stats.dropped_missing_time), (1000, rows, 1000 - rows))
+        self.assertGreater(csv_stats.rows_dropped, 0)
+        self.assertIsNotNone(missing.error)
+        stage = metrics.stages['Extraction CSV']
+        self.assertEqual(stage.rows, rows)
+        self.assertGreater(stage.elapsed, 0)
+
+    def test_02_json_and_prometheus_exports(self):
+        """Vérifie le fichier de mesures JSON et le fichier texte Prometheus."""
+        metrics = instrumentation.RunMetrics()
+        with metrics:
+            with metrics.stage('Chargement MongoDB', rows=10):
+                pass
+            metrics.add_file(instrumentation.FileStats('a "b".csv', 'csv', rows_in=12, rows_out=10, dropped_missing_time=2))
+
+        json_path = metrics.write_json(os.path.join(self.tmpdir.name, 'metrics.json'))
+        with open(json_path, encoding='utf-8') as f:
+            written = json.load(f)
+        self.assertEqual(written['stages']['Chargement MongoDB']['rows'], 10)
+        self.assertEqual(written['totals'], {'rows_in': 12, 'rows_out': 10, 'rows_dropped': 2, 'failed_files': 0})
+
+        prom_path = metrics.write_prometheus(os.path.join(self.tmpdir.name, 'etl.prom'))
+        with open(prom_path, encoding='utf-8') as f:
+            lines = f.read().splitlines()
+        self.assertIn('etl_meteo_stage_rows_total{stage="Chargement MongoDB"} 10', lines)
+        self.assertIn('etl_meteo_file_rows_dropped_total{file="a \\"b\\".csv"} 2', lines)
+        self.assertIn('# TYPE etl_meteo_stage_duration_seconds gauge', lines)
+
+    def test_03_profiling_modes(self):
+        """Vérifie le décorateur de chronométrage et les rapports cProfile / tracemalloc."""
+        for mode in instrumentation.PROFILE_MODES:
+            with self.subTest(profile=mode):
+                metrics = instrumentation.RunMetrics(profile=mode)
+                convert = metrics.timed('Conversion CSV')(etl_meteo.clean_and_convert_csv_df)
+                with metrics:
+                    for _ in range(2):
+                        convert(make_synthetic_wu_frame(500), '1001', 'Weather Underground')
+                self.assertEqual(metrics.stages['Conversion CSV'].calls, 2)
+                self.assertTrue(metrics.profile_report)
+                if mode == 'tracemalloc':
+                    self.assertGreater(metrics.stages['Conversion CSV'].peak_traced_bytes, 0)
+        with self.assertRaises(ValueError):
+            instrumentation.RunMetrics(profile='perf')
+
+    @unittest.skipIf(mongomock is None, "mongomock n'est pas installé")
+    def test_04_run_full_etl_writes_stage_metrics(self):
+        """Vérifie les étapes mesurées par run_full_etl (séquentiel et streaming) et le fichier de mesures écrit."""
+        data_dir = os.path.join(self.tmpdir.name, 'donnees')
+        os.makedirs(data_dir)
+        write_synthetic_wu_csv(os.path.join(data_dir, "Weather+Underground+-+La+Madeleine,+FR.xlsx - 011024.csv"), 300)
+        write_synthetic_infoclimat_json(os.path.join(data_dir, 'Data_Source1_011024-071024.json'), 2, 24)
+        client = mongomock.MongoClient()
+        metrics_path = os.path.join(self.tmpdir.name, 'metrics.json')
+        for streaming in (False, True):
+            with self.subTest(streaming=streaming), \
+                    mock.patch.object(etl_meteo, 'MongoClient', lambda *args, **kwargs: client), \
+                    mock.patch.object(etl_meteo, 'CACHE_DIR', os.path.join(self.tmpdir.name, 'cache')):
+                metrics = etl_meteo.run_full_etl(streaming=streaming, use_cache=False, data_dir=data_dir, metrics_file=metrics_path)
+                stored = client[etl_meteo.MONGO_DATABASE][etl_meteo.MONGO_COLLECTION].count_documents({})
+                self.assertEqual(metrics.stages['Chargement MongoDB'].rows, stored)
+                self.assertEqual(metrics.stages['Extraction CSV'].rows + metrics.stages['Extraction JSON'].rows, stored)
+                self.assertIn('Agrégats journaliers', metrics.stages)
+                with open(metrics_path, encoding='utf-8') as f:
+                    self.assertEqual(json.load(f)['totals']['rows_out'], stored)
+
+
+
+class TestBenchmarkSuite(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_01_synthetic_dataset_is_discovered_like_real_exports(self):
+        """Vérifie que le jeu synthétique (stations x jours) est reconnu par le registre et reproductible."""
+        data_dir = os.path.join(self.tmpdir.name, 'sources')
+        dataset = generate_synthetic_dataset(data_dir, n_stations=3, n_days=2, rows_per_day=48)
+        registry = etl_meteo.SourceRegistry(data_dir, index_path=os.path.join(self.tmpdir.name, 'index.json'))
+        registry.scan()
+        tasks = registry.tasks()
+        self.assertEqual(registry.ignored, [])
+        self.assertEqual(sum(t.kind == 'csv' for t in tasks), 3 * 2)
+        self.assertEqual({t.station_id for t in tasks if t.kind == 'csv'}, {'1001', '1002', 'Station002, FR'})
+        self.assertEqual(sum(len(b) for b in etl_meteo.iter_json_batches(dataset['json_file'])), dataset['json_rows'])
+
+        with open(dataset['csv_files'][0], 'rb') as f:
+            first = f.read()
+        generate_synthetic_dataset(os.path.join(self.tmpdir.name, 'bis'), n_stations=3, n_days=2, rows_per_day=48)
+        with open(os.path.join(self.tmpdir.name, 'bis', os.path.basename(dataset['csv_files'][0])), 'rb') as f:
+            self.assertEqual(f.read(), first)
+
+    @unittest.skipIf(mongomock is None, "mongomock n'est pas installé")
+    def test_02_suite_records_comparable_results(self):
+        """Vérifie que la suite chronomètre chaque étape, enregistre ses résultats et les compare à l'exécution précédente."""
+        results_file = os.path.join(self.tmpdir.name, 'resultats.jsonl')
+        for _ in range(2):
+            result = run_benchmark_suite(n_stations=1, n_days=2, rows_per_day=48, results_file=results_file)
+        self.assertEqual(result['stored'], result['rows'])
+        footprint = result['bytes_per_million_rows']
+        self.assertLess(footprint['compact'], footprint['columns'])
+        self.assertLess(footprint['columns'], footprint['documents'])
+        for stage in ('clean_and_convert_csv_df', 'clean_and_convert_json', 'check_final_integrity', 'Chargement complet', 'Audit MongoDB'):
+            self.assertIn(stage, result['stages'])
+        self.assertEqual(len(load_benchmark_results(results_file)), 2)
+        self.assertEqual(set(compare_benchmark_results(results_file)), set(result['stages']))
+
+
+class TestPipelineRunner(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.data_dir = os.path.join(self.tmpdir.name, 'donnees')
+        self.dataset = generate_synthetic_dataset(self.data_dir, n_stations=2, n_days=2, rows_per_day=48)
+        self.settings = pipeline_runner.PipelineSettings(data_dir=self.data_dir, cache_dir=os.path.join(self.tmpdir.name, 'cache'),
+                                                         mongo_database='meteo_runner_test')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_01_settings_precedence(self):
+        """Vérifie la priorité des réglages : fichier < environnement (dont MONGO_URI de docker-compose) < options explicites."""
+        config = os.path.join(self.tmpdir.name, 'config.json')
+        with open(config, 'w', encoding='utf-8') as f:
+            json.dump({'load_mode': 'incremental', 'workers': 2, 'csv_files': {'1001': {'2024-10-01': 'a.csv'}}}, f)
+        environ = {'MONGO_URI': 'mongodb://mongodb:27017/meteo_projet', 'ETL_WORKERS': '4', 'ETL_DAILY_ROLLUP': 'false'}
+        settings = pipeline_runner.PipelineSettings.load(config, environ=environ, storage='bucket', streaming=None)
+        self.assertEqual((settings.mongo_uri, settings.load_mode, settings.workers, settings.daily_rollup, settings.storage),
+                         ('mongodb://mongodb:27017/meteo_projet', 'incremental', 4, False, 'bucket'))
+        self.assertFalse(settings.streaming)
+        self.assertEqual([(t.path, t.station_id, t.date_str) for t in settings.configured_tasks()], [('a.csv', '1001', '2024-10-01')])
+
+        with open(config, 'w', encoding='utf-8') as f:
+            json.dump({'mongo_url': 'x'}, f)
+        with self.assertRaises(ValueError):
+            pipeline_runner.PipelineSettings.load(config, environ={})
+        with self.assertRaises(ValueError):
+            pipeline_runner.PipelineSettings.load(environ={'ETL_LOAD_MODE': 'append'})
+        with self.assertRaises(ValueError):
+            pipeline_runner.run_pipeline(self.settings, stages=['transform'])
+
+        # La connexion des réglages atteint aussi quality_audit (taux d'erreur lancé seul), puis est restaurée
+        settings = pipeline_runner.PipelineSettings.load(environ={'MONGO_DATABASE': 'meteo_compose'})
+        with settings.applied():
+            self.assertEqual((etl_meteo.MONGO_DATABASE, quality_audit.MONGO_DATABASE), ('meteo_compose', 'meteo_compose'))
+        self.assertEqual(quality_audit.MONGO_DATABASE, etl_meteo.MONGO_DATABASE)
+
+    def test_02_dry_run_skips_mongodb(self):
+        """Vérifie que le mode à blanc traite toutes les lignes sans jamais ouvrir de connexion MongoDB."""
+        database = etl_meteo.MONGO_DATABASE
+        with mock.patch.object(etl_meteo, 'MongoClient', side_effect=AssertionError("MongoDB contacté")):
+            metrics = pipeline_runner.run_pipeline(self.settings, dry=True)
+        total = self.dataset['csv_rows'] + self.dataset['json_rows']
+        self.assertEqual(metrics.stages['Conversion en documents'].rows, metrics.stages['Intégrité + audit en ligne'].rows)
+        self.assertLessEqual(metrics.stages['Conversion en documents'].rows, total)
+        self.assertIn('Agrégats journaliers', metrics.stages)
+        self.assertEqual(etl_meteo.MONGO_DATABASE, database)  # Réglages restaurés après l'exécution
+
+    @unittest.skipIf(mongomock is None, "mongomock n'est pas installé")
+    def test_03_extract_then_load_from_cache_then_audit(self):
+        """Vérifie l'enchaînement extraction seule -> chargement depuis le cache -> audit seul."""
+        client = mongomock.MongoClient()
+        with mock.patch.object(etl_meteo, 'MongoClient', side_effect=AssertionError("MongoDB contacté")):
+            extracted = pipeline_runner.run_pipeline(self.settings, stages=['extract'])
+        self.assertTrue(all(stats.error is None for stats in extracted.files))
+        rows = sum(stats.rows_out for stats in extracted.files)
+
+        with mock.patch.object(etl_meteo, 'MongoClient', lambda *args, **kwargs: client), \
+                mock.patch('etl_meteo.clean_and_convert_csv_df', side_effect=AssertionError("fichier retraité")):
+            loaded = pipeline_runner.run_pipeline(self.settings, stages=['load'])
+            audited = pipeline_runner.run_pipeline(self.settings, stages=['audit'])
+        self.assertTrue(all(stats.from_cache for stats in loaded.files))
+        self.assertEqual(client['meteo_runner_test'][etl_meteo.MONGO_COLLECTION].count_documents({}), rows)
+        self.assertEqual(audited.stages['Audit'].rows, rows)
+
+    def test_04_load_only_reports_files_missing_from_cache(self):
+        """Vérifie qu'un chargement depuis le cache signale les fichiers jamais extraits au lieu de les retraiter."""
+        cache = etl_meteo.TransformCache(self.settings.cache_dir, cache_only=True)
+        task = etl_meteo.SourceTask('json', self.dataset['json_file'], source='Infoclimat')
+        with self.assertRaises(LookupError):
+            list(etl_meteo.iter_task_batches(task, cache=cache))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,209 @@
+import json
+import os
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+import etl_meteo
+from etl_meteo import clean_value
+
+# Libellés des stations Weather Underground synthétiques (les premiers sont les stations configurées)
+SYNTHETIC_WU_STATIONS = list(etl_meteo.WU_STATION_IDS)
+
+# --- Jeux d'essai partagés par les tests hors-ligne (test_transformations.py) et benchmark_etl.py ---
+# Les tests d'équivalence comparent le pipeline à ces références : toute modification change ce qu'ils vérifient.
+
+# --- Implémentations de référence (anciennes versions des transformations) ---
+
+
+def legacy_clean_and_convert_csv_df(df, station_id, source):
+    """Implémentation de référence (cellule par cellule) de clean_and_convert_csv_df, conservée pour comparaison."""
+    df_clean = pd.DataFrame()
+
+    df_clean['temperature_c'] = df['Temperature'].apply(clean_value).apply(lambda f: (f - 32) * 5/9 if f is not None else None)
+    df_clean['humidite_pct'] = df['Humidity'].apply(clean_value)
+    df_clean['pression_hpa'] = df['Pressure'].apply(clean_value).apply(lambda i: i * 33.8638 if i is not None else None)
+    df_clean['vent_vitesse_ms'] = df['Speed'].apply(clean_value).apply(lambda m: m * 0.44704 if m is not None else None)
+    df_clean['pluie_accum_mm'] = df['Precip. Accum.'].apply(clean_value).apply(lambda i: i * 25.4 if i is not None else None)
+
+    df_clean['date_heure_utc'] = df['Time'].apply(lambda t: t if isinstance(t, str) else None).apply(lambda t: f"{df.name} {t}" if t else None)
+
+    df_clean['id_station'] = station_id
+    df_clean['source_donnees'] = source
+
+    df_clean = df_clean.dropna(subset=['date_heure_utc'])
+
+    final_cols = ['date_heure_utc', 'temperature_c', 'humidite_pct', 'pression_hpa', 'vent_vitesse_ms', 'id_station', 'source_donnees', 'pluie_accum_mm']
+    return df_clean[final_cols]
+
+
+def legacy_clean_and_convert_json(json_hourly_data):
+    """Implémentation de référence (enregistrement par enregistrement) de clean_and_convert_json."""
+    all_json_records = []
+    for station_id, records in json_hourly_data.items():
+        if not isinstance(records, list):
+            continue
+        for record in records:
+            if not isinstance(record, dict):
+                continue
+            vent_moyen_ms = float(record.get('vent_moyen', 0) or 0) / 3.6
+            pluie_mm = float(record.get('pluie_1h', record.get('pluie_3h', 0) or 0) or 0)
+            all_json_records.append({
+                'date_heure_utc': record.get('dh_utc'),
+                'temperature_c': float(record.get('temperature')) if record.get('temperature') else None,
+                'humidite_pct': int(record.get('humidite')) if record.get('humidite') else None,
+                'pression_hpa': float(record.get('pression')) if record.get('pression') else None,
+                'vent_vitesse_ms': vent_moyen_ms,
+                'id_station': record.get('id_station'),
+                'source_donnees': 'Infoclimat',
+                'pluie_accum_mm': pluie_mm
+            })
+    return all_json_records
+
+
+def legacy_final_integrity_stats(data_list):
+    """Statistiques de l'ancienne check_final_integrity (DataFrame reconstruit à partir de la liste de documents)."""
+    df_final = pd.DataFrame(data_list)
+    duplicates = df_final.duplicated(subset=['date_heure_utc', 'id_station']).sum()
+    nulls = df_final.isnull().sum()
+    dates = pd.to_datetime(df_final['date_heure_utc'], errors='coerce')
+    return {'total': len(df_final), 'doublons': int(duplicates), 'nulls': nulls.to_dict(), 'start_date': dates.min(), 'end_date': dates.max()}
+
+
+# --- Données synthétiques au format des sources ---
+
+def make_synthetic_wu_frame(n_rows, date_str='2024-10-01', seed=0):
+    """Génère un DataFrame au format Weather Underground (tel que lu par read_csv, unités impériales)."""
+    rng = np.random.default_rng(seed)
+    minutes = np.arange(n_rows) * 5 % (24 * 60)
+    hours, mins = divmod(minutes, 60)
+    times = [f"{(h % 12) or 12}:{m:02d} {'AM' if h < 12 else 'PM'}" for h, m in zip(hours, mins)]
+
+    df = pd.DataFrame({
+        'Time': times,
+        'Temperature': [f"{v:.0f} °F" for v in rng.normal(55, 10, n_rows)],
+        'Dew Point': [f"{v:.0f} °F" for v in rng.normal(48, 8, n_rows)],
+        'Humidity': [f"{v:.0f} %" for v in rng.uniform(40, 100, n_rows)],
+        'Speed': [f"{v:.1f} mph" for v in rng.gamma(2, 3, n_rows)],
+        'Pressure': [f"{v:.2f} in" for v in rng.normal(29.9, 0.3, n_rows)],
+        'Precip. Accum.': [f"{v:,.2f} in".replace('.', ',') for v in rng.exponential(0.05, n_rows)],
+        'Solar': [f"{v:.0f} w/m²" for v in rng.uniform(0, 600, n_rows)],
+    })
+    # Quelques cellules manquantes ou invalides, comme dans les exports réels
+    holes = rng.choice(n_rows, size=max(1, n_rows // 200), replace=False)
+    df.loc[holes, 'Temperature'] = np.nan
+    df.loc[holes[::2], 'Speed'] = '--'
+    df.loc[holes[::3], 'Time'] = np.nan
+    df.name = date_str
+    return df
+
+
+def write_synthetic_wu_csv(path, n_rows, date_str='2024-10-01', seed=0):
+    """Écrit un CSV au format des exports Weather Underground (séparateur ';', latin-1, ligne parasite n°2)."""
+    df = make_synthetic_wu_frame(n_rows, date_str=date_str, seed=seed)
+    lines = df.to_csv(sep=';', index=False, lineterminator='\n').splitlines()
+    # read_csv(skiprows=[2]) ignore la 3e ligne du fichier : on y place une ligne parasite
+    lines.insert(2, ';'.join([''] * len(df.columns)))
+    with open(path, 'w', encoding='latin-1') as f:
+        f.write('\n'.join(lines) + '\n')
+    return path
+
+
+def write_synthetic_infoclimat_json(path, n_stations, n_hours, start='2024-10-01', seed=0):
+    """Écrit un export Infoclimat (clé 'hourly' : une liste de relevés horaires par station, valeurs en chaînes)."""
+    rng = np.random.default_rng(seed)
+    timestamps = pd.date_range(start, periods=n_hours, freq='h').strftime('%Y-%m-%d %H:%M:%S')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{"status": "OK", "errors": [], "message": "export synthétique", "stations": [], "hourly": {')
+        for i in range(n_stations):
+            station_id = f"{7000 + i:05d}"
+            records = []
+            for ts, temp, hum, pres, vent, pluie in zip(timestamps, rng.normal(12, 5, n_hours), rng.integers(40, 100, n_hours),
+                                                        rng.normal(1013, 8, n_hours), rng.gamma(2, 5, n_hours), rng.exponential(0.2, n_hours)):
+                record = {'id_station': station_id, 'dh_utc': ts, 'temperature': f"{temp:.1f}", 'pression': f"{pres:.1f}",
+                          'humidite': str(hum), 'vent_moyen': f"{vent:.1f}", 'pluie_3h': None}
+                if rng.random() < 0.9:
+                    record['pluie_1h'] = f"{pluie:.1f}" if pluie > 0.3 else None
+                if rng.random() < 0.02:
+                    record['temperature'] = None
+                records.append(record)
+            f.write(('' if i == 0 else ', ') + json.dumps(station_id) + ': ' + json.dumps(records))
+        f.write(', "_params": ["temperature", "pression", "humidite", "vent_moyen", "pluie_1h", "pluie_3h"]}}')
+    return path
+
+
+def frames_identical(left, right):
+    """Compare deux DataFrames bit à bit (dtypes, valeurs, NaN et signe des zéros)."""
+    if list(left.columns) != list(right.columns) or not left.index.equals(right.index):
+        return False
+    for col in left.columns:
+        a, b = left[col], right[col]
+        if a.dtype != b.dtype:
+            return False
+        if a.dtype == 'float64':
+            if not np.array_equal(a.to_numpy().view(np.int64), b.to_numpy().view(np.int64)):
+                return False
+        elif not a.equals(b):
+            return False
+    return True
+
+
+def make_synthetic_measures(n_stations=10, n_days=30, freq='30min', seed=0):
+    """Génère des relevés unifiés et normalisés (date_heure_utc en datetime UTC), une station par lot."""
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range('2024-10-01', pd.Timestamp('2024-10-01') + pd.Timedelta(days=n_days), freq=freq, inclusive='left')
+    frames = []
+    for i in range(n_stations):
+        n = len(dates)
+        frames.append(pd.DataFrame({
+            'date_heure_utc': dates,
+            'temperature_c': rng.normal(12, 5, n).round(1),
+            'humidite_pct': rng.integers(40, 100, n).astype('float64'),
+            'pression_hpa': rng.normal(1013, 8, n).round(1),
+            'vent_vitesse_ms': rng.gamma(2, 1.5, n).round(2),
+            'id_station': f"{1001 + i}",
+            'source_donnees': 'Weather Underground',
+            'pluie_accum_mm': rng.exponential(0.2, n).round(1),
+        }))
+    return frames
+
+
+def generate_synthetic_dataset(data_dir, n_stations=2, n_days=7, rows_per_day=288, start='2024-10-01', seed=0):
+    """Écrit un jeu de sources au format réel dans `data_dir` : un CSV Weather Underground par station et par jour
+    (';', latin-1, unités impériales, nommé comme les exports) et un export Infoclimat 'hourly' de n_stations x n_days.
+
+    Le contenu ne dépend que des paramètres (générateur pseudo-aléatoire graine `seed`) ; renvoie un résumé.
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    days = pd.date_range(start, periods=n_days, freq='D')
+    labels = SYNTHETIC_WU_STATIONS[:n_stations] + [f"Station{i:03d},+FR" for i in range(len(SYNTHETIC_WU_STATIONS), n_stations)]
+    csv_files = []
+    for s_index, label in enumerate(labels):
+        for d_index, day in enumerate(days):
+            name = f"Weather+Underground+-+{label}.xlsx - {day.strftime('%d%m%y')}.csv"
+            path = os.path.join(data_dir, name)
+            write_synthetic_wu_csv(path, rows_per_day, date_str=day.strftime('%Y-%m-%d'), seed=seed + s_index * n_days + d_index)
+            csv_files.append(path)
+    json_name = f"Data_Source1_{days[0].strftime('%d%m%y')}-{days[-1].strftime('%d%m%y')}.json"
+    json_path = write_synthetic_infoclimat_json(os.path.join(data_dir, json_name), n_stations, n_days * 24, start=start, seed=seed)
+    return {'data_dir': data_dir, 'csv_files': csv_files, 'json_file': json_path,
+            'csv_rows': len(csv_files) * rows_per_day, 'json_rows': n_stations * n_days * 24}
+
+
+# --- Compatibilité mongomock ---
+
+@contextmanager
+def mongomock_compat():
+    """Adapte mongomock à la version installée de PyMongo le temps du bloc (mongomock absent : ImportError).
+
+    PyMongo >= 4.11 transmet un argument `sort` aux opérations de bulk_write, inconnu de mongomock 4.3.
+    """
+    import mongomock.collection
+    builder = mongomock.collection.BulkOperationBuilder
+    add_update = builder.add_update
+    builder.add_update = lambda self, *args, sort=None, **kwargs: add_update(self, *args, **kwargs)
+    try:
+        yield
+    finally:
+        builder.add_update = add_update